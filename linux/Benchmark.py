@@ -0,0 +1,220 @@
+#!/usr/bin/python
+"""
+filename: Benchmark.py
+
+Description:
+   Recognition benchmarks.  Feeds synthetic strokes (see Utils/StrokeGenerators.py)
+   through _Board.AddStroke with the standard observer set from SketchSystem.initialize
+   and reports, for each workload:
+      - time spent inside each observer's callbacks (total, and excluding nested callbacks),
+        as measured by the board's profiler (_Board.EnableProfiling)
+      - per-stroke AddStroke latency percentiles
+      - peak memory (max resident set size) of the process
+   Nothing is drawn: the "null" SketchGUI backend is used throughout.
+
+   Results can be saved as a baseline and later runs compared against it:
+      python Benchmark.py --sizes 10,100,1000 --save bench_baseline.json
+      python Benchmark.py --sizes 10,100,1000 --compare bench_baseline.json
+   A comparison exits with status 1 if any workload got slower than the tolerance allows.
+
+   --simplify RADIUS,EPSILON thins out each stroke's points before it is added, as the GUIs can
+   (see Utils/StrokeSimplifier.py), and reports how many points that removed.  Leave either
+   one empty to skip that step, e.g. --simplify ,1.5
+
+   --trace FILE writes the callback cascades of the slowest strokes (see CascadeTracer)
+   as Chrome trace-event JSON, to see which stroke caused a stall and why.
+
+   The recognizers' result caches (see Utils/ResultCache.py) are emptied before each workload,
+   so that none of them is sped up by what an earlier one recognized.
+
+   Must be run from this directory, since the observers load their data files by relative path.
+"""
+
+import gc
+import sys
+import logging
+import time
+import json
+from optparse import OptionParser
+
+try:
+    import resource
+except ImportError: #Windows
+    resource = None
+
+from Utils import Logger
+from Utils import ResultCache
+from Utils.StrokeGenerators import generateStrokes, KINDS
+from Utils.StrokeSimplifier import StrokeSimplifier
+from SketchFramework import SketchGUI
+from SketchFramework.Board import BoardSingleton
+from SketchFramework.BoardMonitor import CascadeTracer
+from SketchSystem import initialize
+
+logger = Logger.getLogger('Benchmark', Logger.WARN )
+
+DEFAULT_SIZES = [10, 100, 1000]
+
+#-------------------------------------
+
+def percentile(sortedValues, pct):
+    "Input: sorted list of numbers, pct in [0,100]. Returns the nearest-rank percentile"
+    if len(sortedValues) == 0:
+        return 0.0
+    idx = int(round((pct / 100.0) * (len(sortedValues) - 1)))
+    return sortedValues[idx]
+
+def peakMemoryKB():
+    "Returns the peak resident set size of this process in KB, or None if unknown"
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': #Reported in bytes there
+        peak = peak / 1024
+    return peak
+
+def runWorkload(kind, count, seed = 0, tracer = None, queued = False, simplifier = None):
+    "Run one synthetic workload through a fresh board, simplifying each stroke first if given a StrokeSimplifier. Returns a dict of results"
+    strokes = generateStrokes(kind, count, seed = seed)
+    board = BoardSingleton(reset = True)
+    initialize(board)
+    if queued:
+        board.EnableQueuedDispatch()
+    profiler = board.EnableProfiling()
+    if tracer is not None:
+        board.AddMonitor(tracer)
+
+    ResultCache.clearAll()
+    gc.collect()
+    latencies = []
+    start = time.time()
+    if simplifier is not None:
+        simplifier.resetCounts()
+    for stk in strokes:
+        t = time.time()
+        if simplifier is not None:
+            stk = simplifier.simplify(stk)
+        board.AddStroke(stk)
+        latencies.append(time.time() - t)
+    total = time.time() - start
+    latencies.sort()
+
+    retDict = {'kind': kind,
+            'strokes': count,
+            'total_s': total,
+            'latency_ms': {'p50': 1000 * percentile(latencies, 50),
+                           'p90': 1000 * percentile(latencies, 90),
+                           'p99': 1000 * percentile(latencies, 99),
+                           'max': 1000 * percentile(latencies, 100)},
+            'observers': profiler.byObserver(),
+            'cascade_depth': profiler.maxDepth,
+            'peak_kb': peakMemoryKB(),
+            'annotations': len(board.FindAnnotations()),
+            'cache_hits': sum([c.hits for c in ResultCache.allCaches()]),
+            'cache_misses': sum([c.misses for c in ResultCache.allCaches()]),
+           }
+    if simplifier is not None:
+        retDict['points'] = simplifier.totalPoints
+        retDict['points_removed'] = simplifier.totalRemoved
+    return retDict
+
+def workloadKey(result):
+    return "%s/%s" % (result['kind'], result['strokes'])
+
+#-------------------------------------
+
+def printResult(result, out = sys.stdout):
+    lat = result['latency_ms']
+    print >> out, "%-14s total %8.3fs   latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f   peak %s KB   cascade depth %s   annotations %s" % \
+        (workloadKey(result), result['total_s'], lat['p50'], lat['p90'], lat['p99'], lat['max'], result['peak_kb'], result['cascade_depth'], result['annotations'])
+    if 'points_removed' in result:
+        print >> out, "      simplified away %d of %d points" % (result['points_removed'], result['points'])
+    if result.get('cache_hits', 0) > 0:
+        print >> out, "      result caches: %d hits, %d misses" % (result['cache_hits'], result['cache_misses'])
+    obsList = sorted(result['observers'].items(), key = (lambda x: x[1]['self']), reverse = True)
+    for name, stat in obsList:
+        print >> out, "      %-28s calls %7d   total %8.3fs   self %8.3fs   max %8.2fms" % \
+            (name, stat['calls'], stat['total'], stat['self'], 1000 * stat['max'])
+
+def compareResults(results, baseline, tolerance = 0.25, out = sys.stdout):
+    "Compare results against a saved baseline. Returns a list of workloads that regressed by more than tolerance"
+    #Tiny workloads are mostly timer noise, so also require a measurable absolute slowdown
+    minSlowdown = 0.05
+    regressions = []
+    for result in results:
+        key = workloadKey(result)
+        if key not in baseline:
+            print >> out, "%-14s no baseline" % (key)
+            continue
+        base = baseline[key]['total_s']
+        now = result['total_s']
+        ratio = now / base if base > 0 else 1.0
+        flag = ""
+        if ratio > 1 + tolerance and now - base > minSlowdown:
+            flag = "  ** REGRESSION **"
+            regressions.append(key)
+        print >> out, "%-14s %8.3fs vs %8.3fs baseline (x%.2f)%s" % (key, now, base, ratio, flag)
+    return regressions
+
+def main(argv):
+    parser = OptionParser(usage = "%prog [options]")
+    parser.add_option("-k", "--kinds", default = ",".join(KINDS),
+                      help = "comma separated workloads to run, from %s" % (", ".join(KINDS)))
+    parser.add_option("-n", "--sizes", default = ",".join([str(s) for s in DEFAULT_SIZES]),
+                      help = "comma separated stroke counts (10 to 10000)")
+    parser.add_option("-s", "--seed", type = "int", default = 0)
+    parser.add_option("--save", metavar = "FILE", help = "store the results as a baseline")
+    parser.add_option("--compare", metavar = "FILE", help = "compare against a stored baseline")
+    parser.add_option("-v", "--verbose", action = "store_true", default = False,
+                      help = "keep the observers' debug logging on (slow)")
+    parser.add_option("--tolerance", type = "float", default = 0.25,
+                      help = "fractional slowdown allowed before flagging a regression")
+    parser.add_option("--trace", metavar = "FILE", help = "write a Chrome trace of the slowest strokes")
+    parser.add_option("--queued", action = "store_true", default = False,
+                      help = "use the board's queued dispatch mode")
+    parser.add_option("--simplify", metavar = "RADIUS,EPSILON",
+                      help = "simplify each stroke before adding it (radial distance, Douglas-Peucker tolerance)")
+    (options, args) = parser.parse_args(argv)
+
+    SketchGUI.setBackend("null")
+    if not options.verbose:
+        logging.disable(logging.DEBUG)
+    kinds = [k.strip() for k in options.kinds.split(",") if k.strip()]
+    sizes = [int(n) for n in options.sizes.split(",") if n.strip()]
+
+    runWorkload('mixed', 10) #Warm up, so the first workload doesn't pay for the imports and caches
+
+    simplifier = None
+    if options.simplify:
+        radius, epsilon = [(float(v) if v.strip() else None) for v in options.simplify.split(",")]
+        simplifier = StrokeSimplifier(radius = radius, epsilon = epsilon)
+
+    tracer = None
+    if options.trace:
+        tracer = CascadeTracer()
+    results = []
+    for kind in kinds:
+        for count in sizes:
+            result = runWorkload(kind, count, seed = options.seed, tracer = tracer, queued = options.queued, simplifier = simplifier)
+            printResult(result)
+            results.append(result)
+
+    if tracer is not None:
+        tracer.keepSlowest(20)
+        tracer.export(options.trace)
+
+    if options.save:
+        fp = open(options.save, "w")
+        json.dump(dict([(workloadKey(r), r) for r in results]), fp, indent = 1, sort_keys = True)
+        fp.close()
+
+    if options.compare:
+        fp = open(options.compare, "r")
+        baseline = json.load(fp)
+        fp.close()
+        if len(compareResults(results, baseline, tolerance = options.tolerance)) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -23,6 +23,8 @@ import pdb
 from Utils import Logger
 from Utils import GeomUtils
 from Utils import Template
+from Utils.ResultCache import ResultCache
+from Utils.SpatialGrid import SpatialGrid
 
 from SketchFramework import SketchGUI
 from SketchFramework.Point import Point
@@ -33,6 +35,16 @@ from xml.etree import ElementTree as ET
 
 logger = Logger.getLogger('ArrowObserver', Logger.WARN)
 
+_arrowHeadCache = ResultCache("ArrowMarker") #The tip of each stroke geometry that is an arrowhead, kept across board resets
+
+_arrowHeadMatcher = None
+def _loadArrowHeadMatcher():
+    "Returns the arrowhead templates, read from their file the first time only"
+    global _arrowHeadMatcher
+    if _arrowHeadMatcher is None:
+        _arrowHeadMatcher = Template.TemplateDict(filename = "Utils/arrowheads.templ")
+    return _arrowHeadMatcher
+
 #-------------------------------------
 
 class ArrowAnnotation( Annotation ):
@@ -74,17 +86,23 @@ class ArrowMarker( BoardObserver ):
         BoardSingleton().RegisterForStroke( self )
         
         #For multistroke arrows, keep track of arrowheads and line endpoints
-        # and match them up into arrows
-        self._arrowHeads = [] #tuples of (arrowhead_tip, arrowhead_stroke)
-        self._endpoints = []  #tuples of (endpoint, tail_stroke), one for each endpoint of a tail
-        
-        self.arrowHeadMatcher = Template.TemplateDict(filename = "Utils/arrowheads.templ")
+        # and match them up into arrows. Both are kept in spatial grids, so that
+        # matching only looks at what's nearby
+        self._arrowHeads = SpatialGrid() #tuples of (arrowhead_tip, arrowhead_stroke), stored over the area a tail could join the head in
+        self._endpoints = SpatialGrid()  #tuples of (endpoint, tail_stroke), one for each endpoint of a tail
+        self._strokeInfo = {} #stroke : {'length', 'endpoints' : [endpoint tuples], 'head' : arrowhead tuple or None}
         
+        self.arrowHeadMatcher = _loadArrowHeadMatcher()
+
+    def reset( self ):
+        "The board was cleared: forget the heads and tails waiting to be matched. The arrowhead templates stay loaded"
+        self._arrowHeads.clear()
+        self._endpoints.clear()
+        self._strokeInfo = {}
         
 
     def onStrokeAdded( self, stroke ):
         "Watches for Strokes that look like an arrow to Annotate"
-        smoothedStroke = GeomUtils.strokeSmooth(stroke)
         ep1 = stroke.Points[0]
         ep2 = stroke.Points[-1]
         #ep1 = smoothedStroke.Points[0]
@@ -109,23 +127,12 @@ class ArrowMarker( BoardObserver ):
             BoardSingleton().AnnotateStrokes( [stroke],  anno)
         #/DISABLED
         else:
-            if _isArrowHead(smoothedStroke, self.arrowHeadMatcher):
+            headTip = _arrowHeadCache.getOrCompute(stroke, self._findArrowHeadTip)
+            if headTip is not None:
                 logger.debug("Arrowhead Found")
-                #head = smoothedStroke
                 head = stroke
                 isArrowHead = True
-
-                #                * (tip-point)
-                #              o   o
-                #             o      o
-                #            o         o
-                #          o            o
-                
-                #Get the endpoints/tip point as max curvature
-                strokeNorm = GeomUtils.strokeNormalizeSpacing(smoothedStroke, numpoints = 7)
-                curvatures = GeomUtils.strokeGetPointsCurvature(strokeNorm)
-                ptIdx = curvatures.index(max(curvatures))
-                tip = strokeNorm.Points[ptIdx] #Middle is the point of max curvature
+                tip = Point(*headTip)
 
                 #Match it to any tails we have 
                 matchedTails = self._matchHeadtoTail(head = stroke, point = tip)
@@ -157,10 +164,54 @@ class ArrowMarker( BoardObserver ):
             BoardSingleton().AnnotateStrokes([head, tail],anno)
         
         #Add this stroke to the pool for future evaluation
-        self._endpoints.append( (ep1, stroke) )
-        self._endpoints.append( (ep2, stroke) )
+        info = self._getStrokeInfo(stroke)
+        for ep in (ep1, ep2):
+            ep_tuple = (ep, stroke)
+            if ep_tuple not in self._endpoints:
+                self._endpoints.insert(ep_tuple, ep.X, ep.Y)
+                info['endpoints'].append(ep_tuple)
         if isArrowHead:
-            self._arrowHeads.append( (tip, stroke) )
+            head_tuple = (tip, stroke)
+            reach = _headReach(stroke, tip)
+            self._arrowHeads.insert(head_tuple, tip.X - reach, tip.Y - reach, tip.X + reach, tip.Y + reach)
+            info['head'] = head_tuple
+
+    def _findArrowHeadTip(self, stroke):
+        "Returns (X, Y, T) of the tip if the stroke looks like an arrowhead, or None"
+        smoothedStroke = GeomUtils.strokeSmooth(stroke)
+        if not _isArrowHead(smoothedStroke, self.arrowHeadMatcher):
+            return None
+        ep1 = stroke.Points[0]
+        ep2 = stroke.Points[-1]
+
+        #                * (tip-point)
+        #              o   o
+        #             o      o
+        #            o         o
+        #          o            o
+        
+        #The tip is the corner farthest from the line between the endpoints, where the sides meet
+        corners = [corner for corner, sharpness in GeomUtils.strokeCorners(stroke)]
+        if len(corners) > 0:
+            tip = max(corners, key = (lambda p: GeomUtils.pointSegmentDistanceSquared(p.X, p.Y, ep1.X, ep1.Y, ep2.X, ep2.Y)))
+        else: #Too rounded for any corners: fall back to the point of max curvature
+            strokeNorm = GeomUtils.strokeNormalizeSpacing(smoothedStroke, numpoints = 7)
+            curvatures = GeomUtils.strokeGetPointsCurvature(strokeNorm)
+            ptIdx = curvatures.index(max(curvatures))
+            tip = strokeNorm.Points[ptIdx] #Middle is the point of max curvature
+        return (tip.X, tip.Y, tip.T)
+
+    def _getStrokeInfo(self, stroke):
+        "Returns the cached information about stroke, computing it the first time"
+        info = self._strokeInfo.get(stroke)
+        if info is None:
+            ep1, ep2 = stroke.Points[0], stroke.Points[-1]
+            info = {'length' : GeomUtils.strokeLength(stroke),
+                    'breadth' : GeomUtils.pointDistance(ep1.X, ep1.Y, ep2.X, ep2.Y),
+                    'endpoints' : [],
+                    'head' : None}
+            self._strokeInfo[stroke] = info
+        return info
 
         
             
@@ -175,10 +226,11 @@ class ArrowMarker( BoardObserver ):
             
         if head is not None and tail is None: #Head is specified, find the tail
             tip = point
-            ep1, ep2 = head.Points[0], head.Points[-1]
-            headBreadth = GeomUtils.pointDistance(ep1.X, ep1.Y, ep2.X, ep2.Y)
-            for endpoint, tailStroke in self._endpoints:
-                if GeomUtils.strokeLength(head) < GeomUtils.strokeLength(tailStroke) \
+            headInfo = self._getStrokeInfo(head)
+            headBreadth = headInfo['breadth']
+            #Only endpoints within reach of the head can pass _isPointWithHead
+            for endpoint, tailStroke in self._endpoints.queryRadius(tip.X, tip.Y, _headReach(head, tip)):
+                if headInfo['length'] < self._strokeInfo[tailStroke]['length'] \
                 and _isPointWithHead(endpoint, head, tip): #Make sure the proportions aren't totally off
                     logger.debug("Head stroke has a tail close and within cone")
                     pointingLength = len(tailStroke.Points) / 5
@@ -200,10 +252,12 @@ class ArrowMarker( BoardObserver ):
             elif endpoint== tail.Points[-1]:
                 linept1, linept2 = tail.Points[-pointingLength], endpoint
 
-            for tip, headStroke in self._arrowHeads:
-                ep1, ep2 = headStroke.Points[0], headStroke.Points[-1]
-                headBreadth = GeomUtils.pointDistance(ep1.X, ep1.Y, ep2.X, ep2.Y)
-                if GeomUtils.strokeLength(headStroke) < GeomUtils.strokeLength(tail) \
+            tailLength = self._getStrokeInfo(tail)['length']
+            #Heads are stored over the area a tail could join them in
+            for tip, headStroke in self._arrowHeads.queryRadius(endpoint.X, endpoint.Y, 0):
+                headInfo = self._strokeInfo[headStroke]
+                headBreadth = headInfo['breadth']
+                if headInfo['length'] < tailLength \
                 and _isPointWithHead(endpoint, headStroke, tip):
                     logger.debug("Tail stroke is close and within cone of an arrowhead")
                     pointsTo = GeomUtils.linePointsTowards(linept1, linept2, tip, headBreadth)
@@ -214,19 +268,28 @@ class ArrowMarker( BoardObserver ):
 
     def onStrokeRemoved(self, stroke):
         "When a stroke is removed, remove arrow annotation if found and clean up local state"
-        for ep_tuple in list(self._endpoints):
-            if ep_tuple[1] is stroke:
+        info = self._strokeInfo.pop(stroke, None)
+        if info is not None:
+            for ep_tuple in info['endpoints']:
                 self._endpoints.remove(ep_tuple)
-        for head_tuple in list( self._arrowHeads ):
-            if head_tuple[1] is stroke:
+            if info['head'] is not None:
                 logger.debug("Removed arrowhead")
-                self._arrowHeads.remove(head_tuple)
+                self._arrowHeads.remove(info['head'])
                 
     	for anno in stroke.findAnnotations(ArrowAnnotation, True):
             logger.debug("Removing annotation")
             BoardSingleton().RemoveAnnotation(anno)
 
 
+def _headReach(head, tip):
+    "Returns how far from the tip a tail's endpoint can be and still pass _isPointWithHead"
+    #The endpoint must be closer to the back of the head, or to the tip, than the tip
+    # is to the back, so it is never more than twice that from the tip
+    ep1 = head.Points[0]
+    ep2 = head.Points[-1]
+    midX, midY = (ep1.X + ep2.X)/2, (ep1.Y + ep2.Y)/2
+    return 2 * GeomUtils.pointDistance(tip.X, tip.Y, midX, midY) + 1e-6
+
 def _isPointWithHead(point, head, tip):
     "Returns true if point is close enough and within the cone of the head stroke"
     distanceThresh = 1 
@@ -267,6 +330,10 @@ class ArrowVisualizer( BoardObserver ):
         BoardSingleton().RegisterForAnnotation( ArrowAnnotation, self )
         self.annotation_list = []
 
+    def reset( self ):
+        "The board was cleared: forget the arrow annotations on it"
+        self.annotation_list = []
+
     def onAnnotationAdded( self, strokes, annotation ):
         "Watches for annotations of Arrows and prints out the Underlying Data" 
         self.annotation_list.append(annotation)
@@ -307,6 +374,8 @@ def _isArrowHead(stroke, matcher):
         
 def _isArrowHead_Template(stroke, matcher):
     score_dict = matcher.Score([stroke])
+    if score_dict is None:
+        return False
     logger.debug("Arrowhead template score: %s" % (score_dict['score']))
     if score_dict['score'] < 0.2:
         return True
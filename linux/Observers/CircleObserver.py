@@ -21,6 +21,19 @@ example of something is a circle
 >>> circlepoints = [(int(math.sin(math.radians(x))*100+200),int(math.cos(math.radians(x))*100)+200) for x in range(0,360,20)]
 >>> c.onStrokeAdded(Stroke(circlepoints))
 
+the center and radius are from a circle fitted to the points
+>>> circle = Stroke(circlepoints)
+>>> BoardSingleton().AddStroke(circle)
+>>> anno = circle.findAnnotations(CircleAnnotation)[0]
+>>> str(anno.center), round(anno.radius, 1)
+('(199.5,200.0)', 99.7)
+
+an arc of one doesn't go far enough around
+>>> arc = Stroke(circlepoints[:12])
+>>> BoardSingleton().AddStroke(arc)
+>>> arc.findAnnotations(CircleAnnotation)
+[]
+
 """
 
 #-------------------------------------
@@ -31,6 +44,7 @@ from SketchFramework import SketchGUI
 
 from Utils import Logger
 from Utils import GeomUtils
+from Utils.ResultCache import ResultCache
 from SketchFramework.Point import Point
 from SketchFramework.Stroke import Stroke
 from SketchFramework.Board import BoardObserver, BoardSingleton
@@ -40,12 +54,14 @@ from xml.etree import ElementTree as ET
 
 logger = Logger.getLogger('CircleObserver', Logger.WARN )
 
+_circleCache = ResultCache("CircleMarker") #What CircleMarker found for each stroke's geometry, kept across board resets
+
 #-------------------------------------
 
 class CircleAnnotation(Annotation):
     def __init__(self, circ, cen, avgDist):
         Annotation.__init__(self)
-        self.circularity = circ # float
+        self.circularity = circ # float, 1 - (distance of the stroke from the fitted circle / radius)
         self.center = cen # Point
         self.radius = avgDist # float
 
@@ -64,6 +80,8 @@ class CircleAnnotation(Annotation):
 
 class CircleMarker( BoardObserver ):
     "Watches for Circle, and annotates them with the circularity, center and the radius"
+    MIN_AXIS_RATIO = 0.55 # Ellipses flatter than this (minor / major axis) aren't circles
+    MIN_SWEEP = 270 # Degrees the stroke has to go around its center
     def __init__(self, circularity_threshold=0.90):
         # TODO: we may wish to add the ability to expose/centralize these thresholds
         # so that they can be tuned differently for various enviornments
@@ -72,24 +90,52 @@ class CircleMarker( BoardObserver ):
 	self.threshold = circularity_threshold;
 
     def onStrokeAdded( self, stroke ):
-        "Watches for Strokes with Circularity > threshold to Annotate"
-        # need at least 6 points to be a circle
-	if stroke.length()<6:
-            return
-	s_norm = GeomUtils.strokeNormalizeSpacing( stroke, 20 ) 
-	s_chop = GeomUtils.strokeChopEnds( s_norm, 0.20 ) 
-        circ_norm = GeomUtils.strokeCircularity( s_norm ) 
-        circ_chop = GeomUtils.strokeCircularity( s_chop ) 
-
-        logger.debug( "stroke: %s", [str(p) for p in s_norm.Points] )
-        logger.debug( "potential circles (%f,%f) <> %f", circ_norm, circ_chop, self.threshold )
-
-        if( circ_norm>self.threshold or circ_chop>self.threshold):
-            cen = stroke.Center
-            avgDist = GeomUtils.averageDistance( cen, stroke.Points )
-            anno = CircleAnnotation( circ_norm, cen, avgDist )
+        "Watches for Strokes that fit a circle (or a round ellipse) with circularity > threshold to Annotate"
+        circle = _circleCache.getOrCompute( stroke, self._findCircle, self.threshold )
+        if circle is not None:
+            cx, cy, radius, circ = circle
+            anno = CircleAnnotation( circ, Point(cx, cy), radius )
             BoardSingleton().AnnotateStrokes( [stroke],  anno)
 
+    def _findCircle( self, stroke, threshold ):
+        "Returns (cx, cy, radius, circularity) if the stroke is a circle, or None"
+        # need at least 6 points to be a circle
+	if stroke.length()<6 or len(stroke.Points)<6:
+            return None
+        xs = [p.X for p in stroke.Points]
+        ys = [p.Y for p in stroke.Points]
+        fit = self.fitCircle( xs, ys, threshold )
+        if fit is None:
+            return None
+        cx, cy, radius, circ = fit
+        logger.debug( "potential circle (%f,%f) radius %f: %f <> %f", cx, cy, radius, circ, threshold )
+
+        # an overtraced circle goes around more than once, but an arc doesn't go all the way
+        if abs( GeomUtils.sweptAngleXY( xs, ys, cx, cy ) ) >= CircleMarker.MIN_SWEEP:
+            return fit
+        return None
+
+    def fitCircle( self, xs, ys, threshold = None ):
+        "Returns (cx, cy, radius, circularity) of the circle fitted to the points, or of the ellipse if it's round but not a circle, or None. threshold defaults to the marker's"
+        if threshold is None:
+            threshold = self.threshold
+        fit = GeomUtils.fitCircleXY( xs, ys )
+        if fit is None:
+            return None
+        cx, cy, radius, residual = fit
+        circ = 1 - residual / radius
+        if circ > threshold:
+            return (cx, cy, radius, circ)
+        fit = GeomUtils.fitEllipseXY( xs, ys )
+        if fit is None:
+            return None
+        cx, cy, major, minor, angle, residual = fit
+        radius = (major + minor) / 2
+        circ = 1 - residual / radius
+        if minor / major >= CircleMarker.MIN_AXIS_RATIO and circ > threshold:
+            return (cx, cy, radius, circ)
+        return None
+
 
     def onStrokeRemoved(self, stroke):
 	"When a stroke is removed, remove circle annotation if found"
@@ -105,6 +151,10 @@ class CircleVisualizer( BoardObserver ):
         BoardSingleton().RegisterForAnnotation( CircleAnnotation, self )
         self.annotation_list = []
 
+    def reset( self ):
+        "The board was cleared: forget the circle annotations on it"
+        self.annotation_list = []
+
     def onAnnotationAdded( self, strokes, annotation ):
         "Watches for annotations of Circles and prints out the Underlying Data" 
         logger.debug( "A circle was annotated with Circularity, Center and Radius = %f, (%f,%f), %f", \
@@ -32,6 +32,10 @@ class DebugObserver( BoardObserver ):
 	self.watchSet = set([]) # set of annotation types to track
 	self.seenBefore = {} # set of particular annotation that we have already drawn
 
+    def reset(self):
+        "The board was cleared. Keep tracking the same types, but forget the annotations seen"
+        self.seenBefore = {}
+
     def trackAnnotation(self,annoType):
         logger.debug("debugObserver adding %s", annoType.__name__ );
         # add this annotation type to the list to track
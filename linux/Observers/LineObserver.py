@@ -83,6 +83,10 @@ class LineVisualizer( BoardObserver ):
         BoardSingleton().RegisterForAnnotation( LineAnnotation, self )
         self.annotation_list = []
 
+    def reset( self ):
+        "The board was cleared: forget the line annotations on it"
+        self.annotation_list = []
+
     def onAnnotationAdded( self, strokes, annotation ):
         "Watches for annotations of Lines and tracks them" 
         logger.debug( "A Line was annotated with (lin=%f, ang=%f)", annotation.linearity, annotation.angle )
@@ -45,6 +45,10 @@ class Visualizer( BoardObserver ):
         BoardSingleton().RegisterForAnnotation( anno_type, self )
         self.annotation_list = []
 
+    def reset( self ):
+        "The board was cleared: forget the annotations on it"
+        self.annotation_list = []
+
     def onAnnotationAdded( self, strokes, annotation ):
         logger.debug("anno added   %s", annotation )
         self.annotation_list.append(annotation)
@@ -81,6 +85,12 @@ class Animator( Visualizer ):
 
         self.fps = fps
 
+    def reset( self ):
+        "The board was cleared: forget the annotations on it, and when they were last stepped"
+        for a in self.annotation_list:
+            Animator.CALLTIMES.pop(a, None)
+        Visualizer.reset(self)
+
     def drawMyself( self ):
         "Calls each observed annotation with a step of however many ms since its last call, and then draws the anno"
         for a in self.annotation_list:
@@ -116,6 +126,10 @@ class Collector( BoardObserver ):
         self.item_annotype_list = item_annotype_list      # types of the "items"  (e.g. CircleAnnotation, ArrowAnnotation)
         self.collection_annotype = collection_annotype    # type of the "collection" (e.g. DiGraphAnnotation)
 
+    def reset( self ):
+        "The board was cleared: forget the collections on it"
+        self.all_collections = set([])
+
     def onAnnotationAdded( self, strokes, annotation ):
         if type(annotation) is self.collection_annotype:
             self.all_collections.add(annotation)
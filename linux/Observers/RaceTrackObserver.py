@@ -8,6 +8,7 @@ from SketchFramework import SketchGUI
 
 from Utils import Logger
 from Utils import GeomUtils
+from Utils.SpatialGrid import SpatialGrid
 from SketchFramework.Point import Point
 from SketchFramework.Stroke import Stroke
 from SketchFramework.Board import BoardObserver, BoardSingleton
@@ -228,12 +229,40 @@ class RaceTrackMarker( BoardObserver ):
     def __init__(self):
         self.maybeWalls = set([]) #A set of strokes things that aren't part of a racetrack yet
         self.wallInfo = {} #A dict indexed by  strokes for useful info on partial walls
+        self.wallIndex = SpatialGrid() #The strokes in wallInfo, by bounding box
         BoardSingleton().RegisterForStroke( self )
 
+    def reset(self):
+        "The board was cleared: there are no walls any more"
+        self.maybeWalls = set([])
+        self.wallInfo = {}
+        self.wallIndex.clear()
+
+    def _strokeBox(self, stroke):
+        "Returns the stroke's bounding box as (minX, minY, maxX, maxY)"
+        tl, br = stroke.BoundTopLeft, stroke.BoundBottomRight
+        return (tl.X, br.Y, br.X, tl.Y)
+
+    def _containsStroke(self, outStk, inStk):
+        "Returns whether the closed wall outStk contains inStk, as GeomUtils.strokeContainsStroke, but with outStk's polygon cached"
+        outDict = self.wallInfo[outStk]
+        if outDict['polygon'] is None:
+            ep2 = outStk.Points[-1]
+            outDict['polygon'] = GeomUtils.PreparedPolygon(GeomUtils.strokeNormalizeSpacing(Stroke(outStk.Points + [ep2]), numpoints = len(outStk.Points)).Points)
+        if not outDict['polygon'].contains(inStk.Points[0]):
+            return False
+        #Test if inStk ever leaves outStk's containment
+        return not GeomUtils.strokesIntersect(outStk, inStk)
+
+    def _removeWall(self, stroke):
+        if stroke in self.wallInfo:
+            del(self.wallInfo[stroke])
+            self.wallIndex.remove(stroke)
+
     def onStrokeAdded( self, stroke ):
         #If it's a closed figure, it is its own wall
         rtm_logger.debug("Stroke Added")
-        newWallDict = {'closed': False, 'matches': {}}
+        newWallDict = {'closed': False, 'matches': {}, 'polygon': None}
         ep1 = stroke.Points[0]
         ep2 = stroke.Points[-1]
         strokeLen = GeomUtils.strokeLength(stroke)
@@ -245,14 +274,22 @@ class RaceTrackMarker( BoardObserver ):
 
         rtm_logger.debug("Adding stroke as possible future wall")
         self.wallInfo[stroke] = newWallDict
+        x1, y1, x2, y2 = self._strokeBox(stroke)
+        self.wallIndex.insert(stroke, x1, y1, x2, y2)
         #self.linkStrokesTogether()
 
-        for testStroke, wallDict in self.wallInfo.items():
-            gran = min(len(stroke.Points), len(testStroke.Points))
-            if wallDict['closed'] and GeomUtils.strokeContainsStroke(testStroke, stroke, granularity = gran):
+        #A stroke can only contain another if their bounding boxes nest, so just check those
+        for testStroke in self.wallIndex.query(x1, y1, x2, y2):
+            if testStroke is stroke:
+                continue
+            wallDict = self.wallInfo[testStroke]
+            tx1, ty1, tx2, ty2 = self._strokeBox(testStroke)
+            if wallDict['closed'] and tx1 <= x1 and ty1 <= y1 and tx2 >= x2 and ty2 >= y2 \
+            and self._containsStroke(testStroke, stroke):
                 outStk = testStroke
                 inStk = stroke
-            elif newWallDict['closed'] and GeomUtils.strokeContainsStroke(stroke, testStroke, granularity = gran):
+            elif newWallDict['closed'] and x1 <= tx1 and y1 <= ty1 and x2 >= tx2 and y2 >= ty2 \
+            and self._containsStroke(stroke, testStroke):
                 outStk = stroke
                 inStk = testStroke
             else:
@@ -261,7 +298,7 @@ class RaceTrackMarker( BoardObserver ):
             rtm_logger.debug("Found containment with another stroke")
             rtAnno = RaceTrackAnnotation(rightwalls = [outStk], leftwalls = [inStk]) 
             BoardSingleton().AnnotateStrokes([stroke, testStroke], rtAnno)
-            del(self.wallInfo[testStroke])
+            self._removeWall(testStroke)
             addToWalls = False
             break
 
@@ -321,8 +358,7 @@ class RaceTrackMarker( BoardObserver ):
         rtm_logger.debug("stroke removed")
         otherStrokes = set([stroke])
 
-        if stroke in self.wallInfo:
-            del(self.wallInfo[stroke])
+        self._removeWall(stroke)
 
     	for anno in stroke.findAnnotations(RaceTrackAnnotation):
             otherStrokes.update(anno.Strokes)
@@ -52,8 +52,8 @@ class TemplateMarker( BoardObserver ):
         logger.debug("Scoring templates")
         for templates in self.templateRecognizers:
             score_dict = templates.Score([stroke])
-            logger.debug("   '%s' ... %s" % (score_dict['name'], score_dict['score']))
             if score_dict is not None and score_dict['score'] < 0.2:
+                logger.debug("   '%s' ... %s" % (score_dict['name'], score_dict['score']))
                 anno = TemplateAnnotation(score_dict['name'], score_dict['template'])
                 BoardSingleton().AnnotateStrokes( [stroke], anno )
 
@@ -88,6 +88,10 @@ class TemplateVisualizer( BoardObserver ):
         BoardSingleton().RegisterForAnnotation( TemplateAnnotation, self )
         self.annotation_list = []
 
+    def reset( self ):
+        "The board was cleared: forget the template annotations on it"
+        self.annotation_list = []
+
     def onAnnotationAdded( self, strokes, annotation ):
         "Watches for annotations of Templates and draws the idealized template" 
         logger.debug( "A stroke was annotated as matching template: %s" % annotation.name )
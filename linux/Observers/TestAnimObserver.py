@@ -48,6 +48,10 @@ class TestAnimator( ObserverBase.Animator):
         self.lastDraw = time.time()
         self.trackedAnno = None
 
+    def reset(self):
+        ObserverBase.Animator.reset(self)
+        self.trackedAnno = None
+
     def drawAnno(self, anno):
         #pdb.set_trace()
         if self.trackedAnno == None:
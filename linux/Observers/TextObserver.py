@@ -21,6 +21,7 @@ import pdb
 import math
 from Utils import Logger
 from Utils import GeomUtils
+from Utils.ResultCache import ResultCache
 
 from Observers import CircleObserver
 from Observers import LineObserver
@@ -58,6 +59,7 @@ class TextAnnotation(Annotation):
 
 #-------------------------------------
 l_logger = Logger.getLogger('LetterMarker', Logger.WARN)
+_letterCache = ResultCache("LetterMarker") #The letter _LetterMarker read from each stroke's geometry, kept across board resets
 class _LetterMarker( BoardObserver ):
     """Class initialized by the TextCollector object"""
     def __init__(self):
@@ -66,6 +68,16 @@ class _LetterMarker( BoardObserver ):
         BoardSingleton().RegisterForStroke( self )
     def onStrokeAdded(self, stroke):
         "Tags 1's and 0's as letters (TextAnnotation)"
+        letter = _letterCache.getOrCompute(stroke, self._readLetter)
+        if letter is not None:
+            text, scale = letter
+            annotation = TextAnnotation(text, scale)
+            l_logger.debug("Annotating %s with %s" % ( stroke, annotation.text))
+            BoardSingleton().AnnotateStrokes( [stroke],  annotation)
+            l_logger.debug(" Afterward: %s.annotations is %s" % ( stroke, stroke.Annotations))
+
+    def _readLetter(self, stroke):
+        "Returns (text, scale) for the letter the stroke is, or None"
         closedDistRatio = 0.22
         circularityThresh_0 = 0.80
         circularityThresh_1 = 0.20
@@ -87,10 +99,7 @@ class _LetterMarker( BoardObserver ):
 
         if isClosedShape and circularity > circularityThresh_0:
             height = stroke.BoundTopLeft.Y - stroke.BoundBottomRight.Y
-            oAnnotation = TextAnnotation("0", height)
-            l_logger.debug("Annotating %s with %s" % ( stroke, oAnnotation))
-            BoardSingleton().AnnotateStrokes( [stroke],  oAnnotation)
-            l_logger.debug(" Afterward: %s.annotations is %s" % ( stroke, stroke.Annotations))
+            return ("0", height)
 
         elif len(stroke.Points) >= 2 \
             and max(curvatures) < 0.5 \
@@ -98,16 +107,11 @@ class _LetterMarker( BoardObserver ):
                 if stroke.Points[0].X < stroke.Points[-1].X + strokeLen / 2.0 \
                 and stroke.Points[0].X > stroke.Points[-1].X - strokeLen / 2.0:
                     height = stroke.BoundTopLeft.Y - stroke.BoundBottomRight.Y
-                    oneAnnotation = TextAnnotation("1", height)
-                    l_logger.debug("Annotating %s with %s" % ( stroke, oneAnnotation.text))
-                    BoardSingleton().AnnotateStrokes( [stroke],  oneAnnotation)
-                    l_logger.debug(" Afterward: %s.annotations is %s" % ( stroke, stroke.Annotations))
+                    return ("1", height)
                 elif stroke.Points[0].Y < stroke.Points[-1].Y + strokeLen / 2.0 \
                 and stroke.Points[0].Y > stroke.Points[-1].Y - strokeLen / 2.0:
                     width = stroke.BoundBottomRight.X - stroke.BoundTopLeft.X 
-                    dashAnnotation = TextAnnotation("-", width * 1.5) #Treat the dash's (boosted) width as its scale 
-                    l_logger.debug("Annotating %s with %s" % ( stroke, dashAnnotation.text))
-                    BoardSingleton().AnnotateStrokes( [stroke],  dashAnnotation)
+                    return ("-", width * 1.5) #Treat the dash's (boosted) width as its scale 
         else:
             if not isClosedShape:
                 l_logger.debug("0: Not a closed shape")
@@ -122,6 +126,7 @@ class _LetterMarker( BoardObserver ):
             if not ( stroke.Points[0].X < stroke.Points[-1].X + strokeLen / 3 \
                and   stroke.Points[0].X > stroke.Points[-1].X - strokeLen / 3):
                 l_logger.debug("1: Not vertical enough: \nX1 %s, \nX2 %s, \nLen %s" % (stroke.Points[0].X, stroke.Points[-1].X, strokeLen))
+        return None
 
 
     def onStrokeRemoved(self, stroke):
@@ -1,9 +1,41 @@
+"""
+filename: TuringMachineObserver.py
+
+description:
+   Turing machines drawn as digraphs, with their edges labelled
+   <read symbol><write symbol><move: 0 left, 1 right>.  TuringMachineCollector pairs
+   the labels with the edges of the graphs into TuringMachineAnnotations, which
+   simulate the machine on a tape.  A machine's transitions are compiled into a
+   table when it first runs, and run() fast-forwards it many steps at a time.
+
+Doctest Examples:
+
+A machine that flips every bit, then halts at the end of the tape
+>>> node = CircleObserver.CircleAnnotation(1.0, Point(0, 0), 10)
+>>> start, flip0, flip1 = [ArrowObserver.ArrowAnnotation(Point(0, 0), Point(i, i)) for i in range(3)]
+>>> graph = DiGraphObserver.DiGraphAnnotation(set([node]), set([start, flip0, flip1]))
+>>> graph.connectMap = {None: [(start, node)], node: [(flip0, node), (flip1, node)]}
+>>> tm = TuringMachineAnnotation(state_graph_anno = graph)
+>>> tm.assocLabel2Edge(TextObserver.TextAnnotation("011", 1), flip0)
+>>> tm.assocLabel2Edge(TextObserver.TextAnnotation("101", 1), flip1)
+>>> tm.setTapeString("1101")
+>>> tm.simulateStep(), tm.tape_string, tm.tape_idx
+(True, ['0', '1', '0', '1'], 1)
+>>> tm.run(max_steps = 100), tm.tape_string, tm.active_state
+(3, ['0', '0', '1', '0'], None)
+>>> tm.restartSimulation()
+>>> tm.run(), ''.join(tm.tape_string)
+(4, '1101')
+"""
 
 import pdb
+import time
 
 from Utils import Logger
 from Utils import GeomUtils
 from Utils import Debugging as D
+from Utils.ResultCache import ResultCache
+from Utils.SpatialGrid import SpatialGrid
 
 from SketchFramework import SketchGUI
 from SketchFramework.Point import Point
@@ -12,6 +44,8 @@ from SketchFramework.Board import BoardObserver, BoardSingleton
 from SketchFramework.Annotation import Annotation, AnnotatableObject
 
 from Observers import DiGraphObserver
+from Observers import CircleObserver
+from Observers import ArrowObserver
 from Observers import TextObserver
 from Observers import ObserverBase
 
@@ -21,6 +55,9 @@ from xml.etree import ElementTree as ET
 
 tm_logger = Logger.getLogger('TuringCollector', Logger.DEBUG )
 
+BLANK = '-' #What is read from the tape where nothing has been written
+MOVES = {'0': -1, '1': 1} #Edge label move direction: 0 left, 1 right
+
 #-------------------------------------
 
 class TuringMachineAnnotation(Annotation):
@@ -31,10 +68,14 @@ class TuringMachineAnnotation(Annotation):
 
         #Which state we are currently in
         self.active_state = None
-        #Where on the tape we are currently residing
-        self.tape_idx = -1
-        #What is currently on the tape
-        self.tape_string = []
+        #The tape as two stacks: the cells left of the head (nearest last), and
+        #the head's cell and those right of it (head last). See tape_string / tape_idx
+        self._tape_left = []
+        self._tape_right = []
+        #(state, symbol) : (write, move, next state, edge, label), built from the graph and labels when needed
+        self._transitions = None
+        #How many steps step(dt) runs per second of animation, None for one step per call
+        self.step_rate = None
         #What edge brought us here
         self.leading_edge = {'edge': None, 'label' : None} #edge ArrowAnno, label TextAnno
 
@@ -92,11 +133,34 @@ class TuringMachineAnnotation(Annotation):
 
         
     def setTapeString(self, string):
-        if type(string) == str:
-            self.tape_string = list(string)
-        else:
-            self.tape_string = ""
-        self.tape_idx = 0
+        if type(string) != str:
+            string = ""
+        self._tape_left = []
+        self._tape_right = list(reversed(string))
+
+    def _tapeView(self):
+        "Returns (the written part of the tape as a list, the head's index into it)"
+        cells = self._tape_left + self._tape_right[::-1]
+        head = len(self._tape_left)
+        start = 0
+        while start < len(cells) and cells[start] == BLANK:
+            start += 1
+        end = len(cells)
+        while end > start and cells[end - 1] == BLANK:
+            end -= 1
+        if start == end: #Nothing written
+            return ([], 0)
+        return (cells[start:end], head - start)
+
+    @property
+    def tape_string(self):
+        "What is on the tape, as a list of characters, without the blanks beyond either end"
+        return self._tapeView()[0]
+
+    @property
+    def tape_idx(self):
+        "Where the head is, as an index into tape_string (-1 or len(tape_string) just off either end)"
+        return self._tapeView()[1]
         
 
     def setTapeTextAnno(self, anno):
@@ -111,8 +175,15 @@ class TuringMachineAnnotation(Annotation):
     def assocLabel2Edge(self, label, edge):
         tm_logger.debug("Associating label %s with edge of %s" % (label.text, self.state_graph_anno))
         assert edge == None or edge in self.state_graph_anno.edge_set
+        self._transitions = None
         self.edge2labels_map.setdefault(edge, set([])).add(label)
         self.labels2edge_map.setdefault(label, set([])).add(edge)
+
+    def clearLabels(self):
+        "Forget all of the label/edge associations"
+        self.edge2labels_map = {}
+        self.labels2edge_map = {}
+        self._transitions = None
         
     def getAssociatedStrokes(self):
         "Returns a set of all the strokes that this annotation is actively tracking"
@@ -149,7 +220,12 @@ class TuringMachineAnnotation(Annotation):
 
     def restartSimulation(self):
         self.active_state = None
-        self.tape_idx = 0
+        self._transitions = None #The graph may have changed
+        #Back to the first thing written on the tape
+        self._tape_right.extend(reversed(self._tape_left))
+        self._tape_left = []
+        while self._tape_right and self._tape_right[-1] == BLANK:
+            self._tape_right.pop()
 
         #Find the initial state
         initialEdges = self.state_graph_anno.connectMap.get(None, [])
@@ -168,57 +244,85 @@ class TuringMachineAnnotation(Annotation):
         
 
     def step(self, dt):
-        self.simulateStep()
+        "Advance the animation by dt seconds: one step, or step_rate steps per second if it is set"
+        if self.step_rate is None:
+            self.simulateStep()
+        else:
+            self.run(max_steps = max(1, int(dt * self.step_rate)), max_time = dt)
+
+    def compileTransitions(self):
+        "Returns the machine's transitions as a dict { (state, read symbol) : (write symbol, move -1/1, next state, edge, label) }"
+        if self._transitions is None:
+            table = {}
+            for state, out_edges in self.state_graph_anno.connectMap.items():
+                for edge, to_node in out_edges:
+                    for edge_label_anno in self.edge2labels_map.get(edge, []):
+                        edge_label = edge_label_anno.text
+                        if edge_label is None or len(edge_label) != 3 or to_node is None:
+                            continue
+                        read_cond, write_back, move_dir = edge_label
+                        if move_dir not in MOVES:
+                            continue
+                        if (state, read_cond) in table:
+                            tm_logger.warn("Multiple edges leading out of TM node can be taken on '%s': using %s" % \
+                                (read_cond, table[(state, read_cond)][4].text))
+                            continue
+                        table[(state, read_cond)] = (write_back, MOVES[move_dir], to_node, edge, edge_label_anno)
+            self._transitions = table
+        return self._transitions
 
     def simulateStep(self):
-        "Edge label: <read condition> <write character> <move direction 0L, 1R>"
+        "Edge label: <read condition> <write character> <move direction 0L, 1R>. Returns True if an edge was taken"
+        return self.run(max_steps = 1) == 1
+
+    def run(self, max_steps = None, max_time = None):
+        """Fast-forward the simulation until no edge can be taken (moving to the fail-state), max_steps
+        steps have been taken, or max_time seconds have passed. With neither limit a machine that never
+        halts runs forever. Returns the number of steps taken"""
+        transitions = self.compileTransitions()
+        left, right = self._tape_left, self._tape_right
+        state = self.active_state
+        deadline = None
+        if max_time is not None:
+            deadline = time.time() + max_time
+
+        steps = 0
+        taken = None
+        halted = False
+        while max_steps is None or steps < max_steps:
+            if right:
+                symbol = right[-1]
+            else:
+                symbol = BLANK
+            trans = transitions.get( (state, symbol) )
+            if trans is None:
+                halted = True
+                break
+            taken = trans
+            write_back, move, state = trans[0], trans[1], trans[2]
+            if right:
+                right[-1] = write_back
+            else:
+                right.append(write_back)
+            if move > 0:
+                left.append(right.pop())
+            elif left:
+                right.append(left.pop())
+            else:
+                right.append(BLANK)
+            steps += 1
+            if deadline is not None and steps & 1023 == 0 and time.time() >= deadline:
+                break
 
-        if self.tape_idx >= 0 and self.tape_idx < len(self.tape_string):
-            cur_tape_val = self.tape_string[self.tape_idx]
-        else:
-            cur_tape_val = '-'
-
-        out_edges = self.state_graph_anno.connectMap.get(self.active_state, [])
-        next_state = None
-        ops = []
-        for edge, to_node in out_edges:
-            for edge_label_anno in self.edge2labels_map.get(edge, []):
-                edge_label = edge_label_anno.text
-                if edge_label is not None and len(edge_label) == 3:
-                    read_cond, write_back, move_dir = edge_label
-                    bin_list = ['1', '0']
-                    if read_cond == cur_tape_val \
-                    and move_dir in bin_list \
-                    and to_node != None:
-                        ops.append( (read_cond, write_back, move_dir, to_node, edge, edge_label_anno) )
-
-        if len(ops) > 1:
-            tm_logger.warn("Multiple edges leading out of TM node can be taken: using %s" % (str(ops[0])))
-        if len(ops) == 0:
+        if halted:
             tm_logger.debug("No edges leading from node, moving to fail-state")
             self.active_state = None
             self.leading_edge = {'edge': None,'label': None}
-            return
         else:
-            read_cond, write_back, move_dir, next_state, along_edge, edge_label = ops[0]
-            tm_logger.debug("Doing operation: read '%s', write '%s', move %s" % (read_cond, write_back, move_dir))
-
-            if self.tape_idx < 0:
-                self.tape_string.insert(0, write_back)
-                self.tape_idx = 0
-            elif self.tape_idx == len(self.tape_string):
-                self.tape_string.insert(self.tape_idx, write_back)
-            else:
-                self.tape_string[self.tape_idx] = write_back
-                    
-            if move_dir == '0':
-                self.tape_idx -= 1
-            elif move_dir == '1':
-                self.tape_idx += 1
-            else:
-                tm_logger.warn("Trying to move in non-left/right direction '%s'. Staying put." % (move_dir))
-            self.leading_edge = {'edge': along_edge, 'label': edge_label}
-            self.active_state = next_state
+            self.active_state = state
+            if taken is not None:
+                self.leading_edge = {'edge': taken[3], 'label': taken[4]}
+        return steps
 
         
 class BoxAnnotation (Annotation):
@@ -237,6 +341,8 @@ class BoxVisualizer (ObserverBase.Visualizer):
                 SketchGUI.drawLine( prev.X, prev.Y, cPt.X, cPt.Y, width=4,color="#ccffcc")
             prev = cPt
         
+_boxCache = ResultCache("BoxMarker") #The corners of each stroke geometry that is a box, kept across board resets
+
 class BoxMarker(BoardObserver):
     def __init__(self):
         BoardSingleton().RegisterForStroke(self)
@@ -249,7 +355,12 @@ class BoxMarker(BoardObserver):
             BoardSingleton().RemoveAnnotation(ba)
 
     def tagBox(self, stroke):
+        corners = _boxCache.getOrCompute(stroke, self._findBoxCorners)
+        if corners is not None:
+            BoardSingleton().AnnotateStrokes([stroke], BoxAnnotation([Point(*c) for c in corners]))
 
+    def _findBoxCorners(self, stroke):
+        "Returns the (X, Y, T) of the box's four corners if the stroke is a box, or None"
         endPointDistPct = 0.10 #How close (as % of length) the points have to be to each other
         boxApproxThresh = 50000 #The DTW distance between the stroke and how it best fits a box
         stkLen = GeomUtils.strokeLength(stroke)
@@ -257,146 +368,234 @@ class BoxMarker(BoardObserver):
         epDistSqr = GeomUtils.pointDistanceSquared(ep1.X, ep1.Y, ep2.X, ep2.Y)
         if  epDistSqr > (endPointDistPct * stkLen) ** 2:
             print "Endpoints aren't close enough to be a box"
-            return
-        overshoot = max(1, len(stroke.Points)/10)
-        norm_stroke = GeomUtils.strokeSmooth(GeomUtils.strokeNormalizeSpacing(Stroke(stroke.Points + stroke.Points[0:overshoot]), numpoints = 70))
-        #D.strokeCurvatureHistogram(norm_stroke)
-        curvatures = GeomUtils.strokeGetPointsCurvature(norm_stroke)
-        corners = set([])
-        curvatures_cpy = list(curvatures)
-        while len(corners) < 4:
-            crnr_idx = curvatures_cpy.index(max(curvatures_cpy))
-            crnr = curvatures_cpy[crnr_idx] * 57.295
-            for nBor in range(crnr_idx -2, crnr_idx + 3):
-                if nBor < len(curvatures_cpy) and nBor > 0:
-                    curvatures_cpy[nBor] = 0
-            if crnr > 0: #30 and crnr < 150:
-                #Have a curvature, and we haven't already classified its immed neighbors as a corner
-                corners.add(crnr_idx)
-            else:
-                break
-        if len(corners) != 4:
-            return
+            return None
+        #The corners along the stroke (see GeomUtils.strokeFeaturePoints). With only three, it was started at the fourth
+        features = GeomUtils.strokeFeaturePoints(stroke)
+        c_list = features[1:-1]
+        if len(c_list) == 3:
+            #...but only if the stroke turns where its ends meet, and didn't start partway along an edge
+            start, end = features[0], features[-1]
+            inAngle = GeomUtils.pointOrientation(end.X, end.Y, c_list[-1].X, c_list[-1].Y)
+            outAngle = GeomUtils.pointOrientation(c_list[0].X, c_list[0].Y, start.X, start.Y)
+            if GeomUtils.angleDiff(inAngle, outAngle) > 45:
+                c_list = features[:1] + c_list
+        if len(c_list) != 4:
+            return None
         else:
-            c_list = [norm_stroke.Points[c_idx] for c_idx in sorted(list(corners))]
-            cornerStroke = Stroke(c_list + c_list[:2])
-            boxStroke = GeomUtils.strokeNormalizeSpacing(Stroke(c_list + [c_list[0]]))
+            #Compare along the path the stroke took, from wherever on the box it started
+            boxStroke = GeomUtils.strokeNormalizeSpacing(Stroke(features + [features[0]]))
             origStroke = GeomUtils.strokeNormalizeSpacing(Stroke(stroke.Points + [stroke.Points[0]]))
             approxAcc = GeomUtils.strokeDTWDist(boxStroke, origStroke)
             print "Box approximates original with %s accuracy" % (approxAcc)
             if approxAcc < boxApproxThresh:
-                BoardSingleton().AnnotateStrokes([stroke], BoxAnnotation(c_list))
+                return tuple([(c.X, c.Y, c.T) for c in c_list])
+            return None
 
         
 
 #-------------------------------------
 class TuringMachineCollector(BoardObserver):
+    """Pairs 3-character text labels with the closest digraph edge, and keeps a TuringMachineAnnotation
+    for each digraph. Changes are handled incrementally: a label is matched with a nearest-point
+    lookup over the edges' sample points, and only the machines whose labels or edges changed are
+    updated (in place) on the board."""
+    EDGE_SAMPLE_POINTS = 19 #Points along each edge's tail that labels are matched against
     def __init__( self ):
         # this will register everything with the board, and we will get the proper notifications
         BoardSingleton().RegisterForAnnotation(TextObserver.TextAnnotation, self)
         BoardSingleton().RegisterForAnnotation(DiGraphObserver.DiGraphAnnotation, self)
+        BoardSingleton().RegisterForAnnotation(TuringMachineAnnotation, self)
 
         #BoxVisualizer()
 
         #BoxMarker()
 
-        self.labelMap = {} #Maps textAnno to set of TMAnno
-        self.graphMap = {} #Maps DGAnno to TMAnno
+        self.labelMap = {} #Maps textAnno to its closest (edgeAnno, squared distance), or None if there are no edges
+        self.graphMap = {} #Maps DGAnno to TMAnno (None until it is on the board)
         self.tmMap = {} #Maps TMAnno to set of component DGAnno and TextAnno
 
+        self._graphEdges = {} #Maps DGAnno to the set of its edges we have indexed
+        self._edgeGraph = {} #Maps edgeAnno to the DGAnno it belongs to
+        self._edgeLabels = {} #Maps edgeAnno to the set of textAnnos matched to it
+        self._edgePoints = {} #Maps edgeAnno to its sample points
+        self._edgeIndex = SpatialGrid() #Holds (edgeAnno, sample index) at each sample point
+
+    def reset(self):
+        "The board was cleared: forget the labels, graphs and machines on it"
+        self.labelMap = {}
+        self.graphMap = {}
+        self.tmMap = {}
+        self._graphEdges = {}
+        self._edgeGraph = {}
+        self._edgeLabels = {}
+        self._edgePoints = {}
+        self._edgeIndex.clear()
 
     def onAnnotationUpdated(self, anno):
         if anno.isType( TextObserver.TextAnnotation ):
             labelAnno = anno
             if len(labelAnno.text) == 3: # 3-tuple text
                 tm_logger.debug("Found text to track %s" % (labelAnno.text))
-                tmGroups = self.labelMap.setdefault(labelAnno, set()) #All of the turing machines this label is a part of
-                self.refreshTuringMachines()
+                self.refreshTuringMachines(self._matchLabel(labelAnno))
             elif anno in self.labelMap: # Too many/few characters in label
-                del(self.labelMap[anno])
-                self.refreshTuringMachines()
+                self.refreshTuringMachines(self._dropLabel(anno))
 
         elif anno.isType( DiGraphObserver.DiGraphAnnotation ):
             graphAnno = anno
             if len(graphAnno.connectMap) >= 1:
                 tm_logger.debug("Found a graph to track %s" % (graphAnno))
-                self.graphMap.setdefault(graphAnno, None)
-                self.refreshTuringMachines()
+                self.refreshTuringMachines(self._trackGraph(graphAnno), restart = set([graphAnno]))
             elif graphAnno in self.graphMap:
-                del(self.graphMap[graphAnno])
-                self.refreshTuringMachines()
+                self.refreshTuringMachines(self._untrackGraph(graphAnno))
         
     def onAnnotationAdded(self, strokes, anno):
         self.onAnnotationUpdated(anno)
 
-    def refreshTuringMachines(self):
-        labelEdgeMatchingThresh = 2000 # how many times greater than the median we'll match edges
-
-        labelEdgeMatches = {} # { label : {edge, distance} }
+    def onAnnotationRemoved(self, anno):
+        if anno in self.labelMap:
+            self.refreshTuringMachines(self._dropLabel(anno))
+        elif anno in self.graphMap:
+            self.refreshTuringMachines(self._untrackGraph(anno))
+        elif anno in self.tmMap: #Removed along with one of its strokes
+            del(self.tmMap[anno])
+            graphAnno = anno.state_graph_anno
+            if self.graphMap.get(graphAnno) is anno:
+                self.graphMap[graphAnno] = None
+        return
 
-        for tmAnno in set(self.tmMap.keys()):
-            BoardSingleton().RemoveAnnotation(tmAnno)
+    def _labelCenter(self, labelAnno):
+        "Midpoint of the label's bounding box"
+        labelTL, labelBR = GeomUtils.strokelistBoundingBox(labelAnno.Strokes)
+        return ( (labelTL.X + labelBR.X) / 2.0, (labelTL.Y + labelBR.Y) / 2.0 )
+
+    def _setLabelMatch(self, labelAnno, match):
+        "Record labelAnno's closest (edge, distance). Returns the set of graphs whose labels changed"
+        changed = set([])
+        oldMatch = self.labelMap.get(labelAnno)
+        if oldMatch is not None:
+            self._edgeLabels.get(oldMatch[0], set([])).discard(labelAnno)
+            changed.add(self._edgeGraph.get(oldMatch[0]))
+        self.labelMap[labelAnno] = match
+        if match is not None:
+            self._edgeLabels.setdefault(match[0], set([])).add(labelAnno)
+            changed.add(self._edgeGraph.get(match[0]))
+        else:
+            tm_logger.debug("TextAnno %s not matched to an edge" % (labelAnno.text))
+        changed.discard(None)
+        return changed
+
+    def _matchLabel(self, labelAnno):
+        "Find the closest edge to labelAnno. Returns the set of graphs whose labels changed"
+        x, y = self._labelCenter(labelAnno)
+        item, dist = self._edgeIndex.nearest(x, y)
+        match = None
+        if item is not None:
+            match = (item[0], dist)
+        return self._setLabelMatch(labelAnno, match)
+
+    def _dropLabel(self, labelAnno):
+        "Stop tracking labelAnno. Returns the set of graphs whose labels changed"
+        changed = self._setLabelMatch(labelAnno, None)
+        del(self.labelMap[labelAnno])
+        return changed
+
+    def _indexEdge(self, edgeAnno, graphAnno):
+        "Add a new edge's sample points to the index. Returns the set of graphs that labels moved from"
+        self._edgeGraph[edgeAnno] = graphAnno
+        points = GeomUtils.strokeResampleXY(edgeAnno.tailstroke, self.EDGE_SAMPLE_POINTS)
+        self._edgePoints[edgeAnno] = points
+        for i, (x, y) in enumerate(points):
+            self._edgeIndex.insert( (edgeAnno, i), x, y)
+
+        #Claim any labels that are closer to this edge than to their current one
+        changed = set([])
+        for labelAnno, match in self.labelMap.items():
+            lx, ly = self._labelCenter(labelAnno)
+            dist = min( [GeomUtils.pointDistanceSquared(x, y, lx, ly) for x, y in points] )
+            if match is None or dist < match[1]:
+                changed.update( self._setLabelMatch(labelAnno, (edgeAnno, dist)) )
+        return changed
+
+    def _unindexEdge(self, edgeAnno):
+        "Remove an edge from the index. Returns the labels that were matched to it"
+        for i in range(len(self._edgePoints.pop(edgeAnno, []))):
+            self._edgeIndex.remove( (edgeAnno, i) )
+        del(self._edgeGraph[edgeAnno])
+        return self._edgeLabels.pop(edgeAnno, set([]))
+
+    def _trackGraph(self, graphAnno):
+        "Bring graphAnno's edges up to date. Returns the set of graphs that need refreshing"
+        changed = set([graphAnno])
+        self.graphMap.setdefault(graphAnno, None)
+        oldEdges = self._graphEdges.setdefault(graphAnno, set([]))
+        newEdges = set(graphAnno.edge_set)
+
+        orphans = set([])
+        for edgeAnno in oldEdges - newEdges:
+            orphans.update( self._unindexEdge(edgeAnno) )
+        for edgeAnno in newEdges - oldEdges:
+            prevGraph = self._edgeGraph.get(edgeAnno)
+            if prevGraph is not None: #Merged in from another graph, labels and all
+                self._graphEdges[prevGraph].discard(edgeAnno)
+                self._edgeGraph[edgeAnno] = graphAnno
+                changed.add(prevGraph)
+            else:
+                changed.update( self._indexEdge(edgeAnno, graphAnno) )
+        self._graphEdges[graphAnno] = newEdges
+
+        for labelAnno in orphans:
+            self.labelMap[labelAnno] = None
+            changed.update( self._matchLabel(labelAnno) )
+        return changed
+
+    def _untrackGraph(self, graphAnno):
+        "Stop tracking graphAnno, and take its machine off the board. Returns the set of graphs that need refreshing"
+        orphans = set([])
+        for edgeAnno in self._graphEdges.pop(graphAnno, set([])):
+            orphans.update( self._unindexEdge(edgeAnno) )
+        tmAnno = self.graphMap.pop(graphAnno, None)
+        if tmAnno is not None:
             del(self.tmMap[tmAnno])
+            BoardSingleton().RemoveAnnotation(tmAnno)
 
-        for textAnno in self.labelMap.keys():
-            labelTL, labelBR = GeomUtils.strokelistBoundingBox(textAnno.Strokes)
-            #Midpoint of the labe's bounding box
-            labelCenterPt = Point ( (labelTL.X + labelBR.X) / 2.0, (labelTL.Y + labelBR.Y) / 2.0) 
-
-            labelMatchDict = labelEdgeMatches.setdefault(textAnno, {}) 
-
-            for graphAnno in self.graphMap:
-                #Match edges to labels
-                for edgeAnno in graphAnno.edge_set:
-                    edgeLabelPoints = GeomUtils.strokeNormalizeSpacing(edgeAnno.tailstroke, 19).Points #Midpoint in the arrow-stroke
-                    for elp in edgeLabelPoints:
-                        dist = GeomUtils.pointDistanceSquared(elp.X, elp.Y, labelCenterPt.X, labelCenterPt.Y)
-                        #labelMatchDict['allmatches'].append({'anno': edgeAnno, 'dist': dist})
-                        if 'bestmatch' not in labelMatchDict or dist < labelMatchDict['bestmatch'][1]:
-                            labelMatchDict['bestmatch'] = (edgeAnno, dist)
+        changed = set([])
+        for labelAnno in orphans:
+            self.labelMap[labelAnno] = None
+            changed.update( self._matchLabel(labelAnno) )
+        return changed
 
-        #labelEdgeMatches contains each label paired with its best edge
-        
-        #Have each edge claim a label
-        edge2LabelMatching = {}
-        for textAnno, matchDict in labelEdgeMatches.items():
-            if 'bestmatch' in matchDict: # and matchDict['bestmatch'][1] < labelEdgeMatchingThresh:
-                edgeLabelList = edge2LabelMatching.setdefault(matchDict['bestmatch'][0], [])
-                edgeLabelList.append(textAnno)
-            else:
-                tm_logger.debug("TextAnno %s not matched to an edge" % (textAnno.text))
+    def refreshTuringMachines(self, graphs = None, restart = set([])):
+        """Rebuild the label associations of the machines for graphs (default all of them). Machines are
+        updated in place; their simulations are restarted only if their graph is in restart"""
+        if graphs is None:
+            graphs = self.graphMap.keys()
 
         #Make the associations and add the turing machine annotation
-        for graphAnno, tmAnno in self.graphMap.items():
+        for graphAnno in graphs:
+            if graphAnno not in self.graphMap:
+                continue
+            tmAnno = self.graphMap[graphAnno]
             assocSet = set([graphAnno])
             shouldAddAnno = False
             if tmAnno == None:
                 shouldAddAnno = True
                 tmAnno = TuringMachineAnnotation(state_graph_anno = graphAnno)
+            else:
+                tmAnno.clearLabels()
+                if graphAnno in restart:
+                    tmAnno.restartSimulation()
 
             for edgeAnno in graphAnno.edge_set:
-                if edge2LabelMatching.get(edgeAnno, None) is not None:
-                    assocLabelsList = edge2LabelMatching[edgeAnno]
-                    for label in assocLabelsList:
-                        assocSet.add(label)
-                        tmAnno.assocLabel2Edge(label, edgeAnno)
+                for label in self._edgeLabels.get(edgeAnno, []):
+                    assocSet.add(label)
+                    tmAnno.assocLabel2Edge(label, edgeAnno)
 
+            self.tmMap[tmAnno] = assocSet
             if shouldAddAnno:
+                self.graphMap[graphAnno] = tmAnno
                 BoardSingleton().AnnotateStrokes(tmAnno.getAssociatedStrokes(), tmAnno)
-                self.tmMap[tmAnno] = assocSet
             else:
-                BoardSingleton().UpdateAnnotation(tmAnno, new_strokes = tmAnno.getAssociatedStrokes())
-                self.tmMap[tmAnno] = assocSet
-
-    def onAnnotationRemoved(self, anno):
-        newStrokes = set([])
-        if anno in self.labelMap:
-            del(self.labelMap[anno])
-            self.refreshTuringMachines()
-        if anno in self.graphMap:
-            del(self.graphMap[anno])
-            self.refreshTuringMachines()
-        return
+                BoardSingleton().UpdateAnnotation(tmAnno, new_strokes = list(tmAnno.getAssociatedStrokes()))
 
 #-------------------------------------
 
@@ -515,3 +714,10 @@ class TuringMachineExporter ( ObserverBase.Visualizer ):
         print >> fd, a.dotify()
         fd.close()
 
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    Logger.setDoctest(tm_logger)
+    import doctest
+    doctest.testmod()
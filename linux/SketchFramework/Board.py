@@ -1,9 +1,58 @@
+"""
+filename: Board.py
+
+description:
+   The Board holds the strokes that have been drawn, and tells the observers registered
+   with it about strokes and annotations as they are added, updated and removed.
+
+Doctest Examples:
+
+In queued dispatch, observers told about a removal still see the board as it was
+>>> from SketchFramework.Point import Point
+>>> from SketchFramework.Annotation import Annotation
+>>> class Watcher(BoardObserver):
+...     def onStrokeRemoved(self, stroke):
+...         print "Stroke still on the board: %s" % (stroke in BoardSingleton().Strokes)
+...     def onAnnotationRemoved(self, anno):
+...         print "Annotations still on the stroke: %s" % (len(anno.Strokes[0].findAnnotations(Annotation)))
+>>> board = BoardSingleton(reset = True)
+>>> watcher = Watcher()
+>>> board.RegisterForStroke(watcher)
+>>> board.RegisterForAnnotation(Annotation, watcher)
+>>> board.EnableQueuedDispatch()
+>>> stroke = Stroke([Point(0, 0), Point(10, 10)])
+>>> board.AddStroke(stroke)
+>>> anno = Annotation()
+>>> board.AnnotateStrokes([stroke], anno)
+>>> board.RemoveAnnotation(anno)
+Annotations still on the stroke: 1
+>>> stroke.findAnnotations(Annotation)
+[]
+
+The same holds for a removal made from inside a callback, which is queued behind it
+>>> class Remover(BoardObserver):
+...     def onAnnotationAdded(self, strokes, anno):
+...         BoardSingleton().RemoveAnnotation(anno)
+>>> board.RegisterForAnnotation(Annotation, Remover())
+>>> board.AnnotateStrokes([stroke], Annotation())
+Annotations still on the stroke: 1
+>>> stroke.findAnnotations(Annotation)
+[]
+>>> board.RemoveStroke(stroke)
+Stroke still on the board: True
+>>> board.Strokes
+[]
+>>> board = BoardSingleton(reset = True)
+"""
+
 import datetime 
 import pdb 
 import threading
 import sys 
+from collections import deque
 
 from SketchFramework.Stroke import Stroke
+from SketchFramework.BoardMonitor import BoardProfiler, CascadeTracer
 
 from Utils import Logger
 from Utils import GeomUtils
@@ -37,6 +86,10 @@ class BoardObserver(object):
     def drawMyself(self):
         pass
 
+    def reset(self):
+        "Forget everything about the strokes and annotations on the board, which is being cleared (see _Board.Clear). Observers with state of their own must override this"
+        pass
+
 #--------------------------------------------
 
 # TODO: Does Board really need to be a sigleton?  If we want 
@@ -49,6 +102,10 @@ class _Board(object):
     "A singleton Object containing the Board and all of the strokes."
 
     def __init__(self):
+        #Dispatch monitors (e.g. profilers) survive a Reset, so they can be installed before initialization
+        self._monitors = []
+        #In queued mode observer callbacks are delivered breadth first from an event queue, see EnableQueuedDispatch
+        self._queued = False
         self.Reset()
         
 
@@ -62,7 +119,30 @@ class _Board(object):
         #Ensure that we don't add something after its removal
         self._removed_annotations = {}
         self._removed_strokes = {}
-        
+
+        self._resetQueue()
+
+    def Clear( self ):
+        """Removes all of the strokes, and with them all of the annotations, but keeps the observers and calls reset() on each.
+       Nobody is told about each stroke and annotation removed, so this is much quicker than removing them one at a
+       time, or than Reset and creating all of the observers (and loading their data) again"""
+        logger.debug( "Clearing the board" )
+        self.Strokes = []
+        self._removed_annotations = {}
+        self._removed_strokes = {}
+        self._resetQueue()
+        for obs in self.GetAllObservers():
+            obs.reset()
+
+    def GetAllObservers( self ):
+        "Returns every observer registered with the board, for strokes, annotations or drawing, each once"
+        seen = set([])
+        retlist = []
+        for obs in self.BoardObservers + self.StrokeObservers + sum(self.AnnoObservers.values(), []):
+            if id(obs) not in seen:
+                seen.add(id(obs))
+                retlist.append(obs)
+        return retlist
 
     def AddStroke( self, newStroke ):
         "Input: Stroke newStroke.  Adds a Stroke to the board and calls any Stroke Observers as needed"
@@ -70,9 +150,25 @@ class _Board(object):
         
         self.Strokes.append( newStroke )
         
-        for so in self.StrokeObservers:
-            if newStroke not in self._removed_strokes: #Nobody has removed this stroke yet
-                so.onStrokeAdded( newStroke )
+        if self._monitors:
+            for monitor in self._monitors:
+                monitor.strokeStarted( newStroke )
+        try:
+            for so in self.StrokeObservers:
+                if self._queued:
+                    self._enqueue( so, 'onStrokeAdded', (newStroke,), stroke = newStroke )
+                elif newStroke not in self._removed_strokes: #Nobody has removed this stroke yet
+                    if self._monitors:
+                        self._notify( so, 'onStrokeAdded', newStroke )
+                    else:
+                        so.onStrokeAdded( newStroke )
+            if self._queued:
+                self._drain()
+        finally:
+            #Even if an observer raised, so the monitors don't nest the next stroke inside this one
+            if self._monitors:
+                for monitor in self._monitors:
+                    monitor.strokeFinished( newStroke )
 
     def RemoveStroke( self, oldStroke ):
         "Input: Stroke oldStroke.  Removes a Stroke from the board and calls any Stroke Observers as needed"
@@ -82,7 +178,20 @@ class _Board(object):
         self._removed_strokes[oldStroke] = True
 
         for so in self.StrokeObservers:
-            so.onStrokeRemoved( oldStroke )
+            if self._queued:
+                self._enqueue( so, 'onStrokeRemoved', (oldStroke,) )
+            elif self._monitors:
+                self._notify( so, 'onStrokeRemoved', oldStroke )
+            else:
+                so.onStrokeRemoved( oldStroke )
+        if self._queued:
+            #Observers may still look at the board when they hear about it, so only take it off once they have
+            self._enqueueWork( self._detachStroke, (oldStroke,) )
+            self._drain()
+        else:
+            self._detachStroke( oldStroke )
+
+    def _detachStroke( self, oldStroke ):
         if oldStroke in self.Strokes:
             self.Strokes.remove( oldStroke )
         else:
@@ -92,7 +201,19 @@ class _Board(object):
         "Input: Stroke oldStroke, newStroke.  Edits oldStroke to be newStroke on the board; calls any Stroke Observers as needed"
         logger.debug( "Edit stroke (FIXME: Not Fully Implemented)" );
         for so in self.StrokeObservers:
-            so.onStrokeEdited( oldStroke, newStroke )
+            if self._queued:
+                self._enqueue( so, 'onStrokeEdited', (oldStroke, newStroke) )
+            elif self._monitors:
+                self._notify( so, 'onStrokeEdited', oldStroke, newStroke )
+            else:
+                so.onStrokeEdited( oldStroke, newStroke )
+        if self._queued:
+            self._enqueueWork( self._replaceStroke, (oldStroke, newStroke) )
+            self._drain()
+        else:
+            self._replaceStroke( oldStroke, newStroke )
+
+    def _replaceStroke( self, oldStroke, newStroke ):
         if oldStroke in self.Strokes:
             idx = self.Strokes.index(oldStroke)
             self.Strokes[idx] = newStroke
@@ -172,8 +293,15 @@ class _Board(object):
         annoObsvrs = self.AnnoObservers.get(anno.__class__)
         if (annoObsvrs != None):
             for i in annoObsvrs:
-                if anno not in self._removed_annotations: #Will fail if someone has called "RemoveAnnotation"
-                    i.onAnnotationAdded(strokes, anno)
+                if self._queued:
+                    self._enqueue(i, 'onAnnotationAdded', (strokes, anno), anno = anno)
+                elif anno not in self._removed_annotations: #Will fail if someone has called "RemoveAnnotation"
+                    if self._monitors:
+                        self._notify(i, 'onAnnotationAdded', strokes, anno)
+                    else:
+                        i.onAnnotationAdded(strokes, anno)
+            if self._queued:
+                self._drain()
 
     def UpdateAnnotation(self, anno, new_strokes=None, notify=True, remove_empty = True ):
 	"""Input: Annotation, Strokes.  Changes the annotation and alerts the correct listeners. 
@@ -205,8 +333,15 @@ class _Board(object):
             if not shouldRemove and notify and anno.__class__ in self.AnnoObservers:
                 for obs in self.AnnoObservers[anno.__class__]:
                     # tell obs about the updated annotation
-                    if anno not in self._removed_annotations: #Fails if someone called removeAnnotation
-                        obs.onAnnotationUpdated(anno)
+                    if self._queued:
+                        self._enqueue(obs, 'onAnnotationUpdated', (anno,), anno = anno)
+                    elif anno not in self._removed_annotations: #Fails if someone called removeAnnotation
+                        if self._monitors:
+                            self._notify(obs, 'onAnnotationUpdated', anno)
+                        else:
+                            obs.onAnnotationUpdated(anno)
+                if self._queued:
+                    self._drain()
             elif shouldRemove:
                 #The strokes are empty, so remove the annotation
                 self.RemoveAnnotation(anno)
@@ -221,9 +356,21 @@ class _Board(object):
         # if anyone is listening for this class of annotation, let them know
         if anno.__class__ in self.AnnoObservers:
             for obs in self.AnnoObservers[anno.__class__]:
-                obs.onAnnotationRemoved(anno)
+                if self._queued:
+                    self._enqueue(obs, 'onAnnotationRemoved', (anno,))
+                elif self._monitors:
+                    self._notify(obs, 'onAnnotationRemoved', anno)
+                else:
+                    obs.onAnnotationRemoved(anno)
         # remove the annotation from the strokes. 
         # do this second, since observers may need to check the old strokes' properties
+        if self._queued:
+            self._enqueueWork( self._detachAnnotation, (anno,) )
+            self._drain()
+        else:
+            self._detachAnnotation( anno )
+
+    def _detachAnnotation( self, anno ):
         for stroke in anno.Strokes:
             # logger.debug("RemoveAnnotation: stroke.Annotations = %s, id=%d", stroke.Annotations, stroke.id )
             # logger.debug("RemoveAnnotation: anno.__class__ = %s", anno.__class__ )
@@ -235,7 +382,136 @@ class _Board(object):
                 logger.error( "RemoveAnnotation: Annotation %s not found in stroke.Annotations", anno.__class__ )
             except ValueError:
                 logger.error( "RemoveAnnotation: Trying to remove nonexistant annotation %s", anno  )
+
+    def EnableQueuedDispatch( self ):
+        """Deliver observer callbacks from an event queue instead of straight away.
+       Board changes made from inside a callback take effect immediately, but the
+       callbacks they cause are queued behind the ones already waiting, so a cascade is
+       handled breadth first, one callback at a time. An update to an annotation that an
+       observer has not yet been told about (added or updated) is folded into the
+       pending callback."""
+        self._queued = True
+
+    def DisableQueuedDispatch( self ):
+        "Go back to calling observers synchronously, from inside the board call that caused it"
+        self._drain()
+        self._queued = False
+
+    def IsQueuedDispatch( self ):
+        return self._queued
+
+    def GetDispatchStats( self ):
+        "Returns {'delivered', 'coalesced', 'dropped'}: queued callbacks made, folded into a pending one, and skipped because the stroke/annotation was removed"
+        return dict(self._dispatchStats)
+
+    def _resetQueue( self ):
+        self._eventQueue = deque() # (observer, callback name, args, stroke, anno)
+        self._pendingAnnos = {} # (id(observer), id(anno)) : True, while an added/updated callback is waiting
+        self._draining = False
+        self._dispatchStats = {'delivered': 0, 'coalesced': 0, 'dropped': 0}
+
+    def _enqueue( self, obs, cbName, args, stroke = None, anno = None ):
+        "Queue up obs.cbName(*args). Skipped at delivery if stroke or anno has been removed by then"
+        if anno is not None:
+            key = (id(obs), id(anno))
+            if key in self._pendingAnnos:
+                if cbName == 'onAnnotationUpdated': #The observer will see the latest state when the pending callback runs
+                    self._dispatchStats['coalesced'] += 1
+                    return
+            else:
+                self._pendingAnnos[key] = True
+        self._eventQueue.append( (obs, cbName, args, stroke, anno) )
+
+    def _enqueueWork( self, func, args ):
+        "Queue up the board's own func(*args), to run once the callbacks queued before it have been delivered"
+        self._eventQueue.append( (None, func, args, None, None) )
+
+    def _drain( self ):
+        "Deliver queued callbacks until the queue is empty. Does nothing if called from inside a callback"
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            while len(self._eventQueue) > 0:
+                obs, cbName, args, stroke, anno = self._eventQueue.popleft()
+                if obs is None: #The board's own work, see _enqueueWork
+                    cbName( *args )
+                    continue
+                if anno is not None:
+                    #Anything after this is a change the observer hasn't seen
+                    self._pendingAnnos.pop( (id(obs), id(anno)), None )
+                    if anno in self._removed_annotations:
+                        self._dispatchStats['dropped'] += 1
+                        continue
+                if stroke is not None and stroke in self._removed_strokes:
+                    self._dispatchStats['dropped'] += 1
+                    continue
+                self._dispatchStats['delivered'] += 1
+                if self._monitors:
+                    self._notify( obs, cbName, *args )
+                else:
+                    getattr(obs, cbName)( *args )
+        finally:
+            if len(self._eventQueue) > 0: #A callback raised. Don't leave its cascade half delivered for the next call
+                pending = list(self._eventQueue)
+                self._eventQueue.clear()
+                self._pendingAnnos.clear()
+                logger.error( "Dropping %d queued callbacks", len([item for item in pending if item[0] is not None]) )
+                for obs, cbName, args, stroke, anno in pending:
+                    if obs is None: #Still finish removing what the observers were told about
+                        cbName( *args )
+            self._draining = False
             
+    def _notify( self, obs, cbName, *args ):
+        "Input: BoardObserver obs, string cbName, callback arguments.  Calls obs.cbName(*args) through every installed monitor"
+        func = getattr(obs, cbName)
+        for monitor in reversed(self._monitors):
+            func = _monitoredCall(monitor, obs, cbName, func)
+        func(*args)
+
+    def AddMonitor( self, monitor ):
+        "Input: BoardMonitor monitor.  monitor will be handed every observer callback the board makes"
+        if monitor not in self._monitors:
+            self._monitors.append( monitor )
+
+    def RemoveMonitor( self, monitor ):
+        "Input: BoardMonitor monitor.  Stop passing observer callbacks through monitor"
+        while monitor in self._monitors:
+            self._monitors.remove( monitor )
+
+    def EnableProfiling( self, dumpInterval = None, dumpFile = None ):
+        "Start timing every observer callback. Returns the BoardProfiler, see GetProfile"
+        self.DisableProfiling()
+        profiler = BoardProfiler( dumpInterval = dumpInterval, dumpFile = dumpFile )
+        self.AddMonitor( profiler )
+        return profiler
+
+    def DisableProfiling( self ):
+        "Stop timing observer callbacks"
+        for monitor in list(self._monitors):
+            if isinstance(monitor, BoardProfiler):
+                self.RemoveMonitor( monitor )
+
+    def GetProfile( self ):
+        "Returns a snapshot of the observer timing statistics (see BoardProfiler.snapshot), or None if profiling is off"
+        for monitor in self._monitors:
+            if isinstance(monitor, BoardProfiler):
+                return monitor.snapshot()
+        return None
+
+    def EnableTracing( self, maxStrokes = None ):
+        "Start recording the cascade of callbacks set off by each stroke. Returns the CascadeTracer"
+        self.DisableTracing()
+        tracer = CascadeTracer( maxStrokes = maxStrokes )
+        self.AddMonitor( tracer )
+        return tracer
+
+    def DisableTracing( self ):
+        "Stop recording callback cascades"
+        for monitor in list(self._monitors):
+            if isinstance(monitor, CascadeTracer):
+                self.RemoveMonitor( monitor )
+
     def AddBoardObserver ( self, obs ):
         "Input: Observer obs.  Obs is added to the list of Board Observers"
         # FIXME? should we check that the object is one in the list once?
@@ -289,9 +565,25 @@ class _Board(object):
                 
 #--------------------------------------------
 
+def _monitoredCall(monitor, obs, cbName, func):
+    "Returns a function that calls func(*args) by way of monitor"
+    def call(*args):
+        monitor.call(obs, cbName, func, args)
+    return call
+
+#--------------------------------------------
+
 def BoardSingleton(reset = False):
     if _Board.BoardSingleton == None or reset:
        logger.debug( "Creating board object" );
        _Board.BoardSingleton = _Board()
     return _Board.BoardSingleton
 
+#--------------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    Logger.setDoctest(logger)
+    import doctest
+    doctest.testmod()
+
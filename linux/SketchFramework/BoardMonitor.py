@@ -0,0 +1,310 @@
+"""
+filename: BoardMonitor.py
+
+description:
+   Optional instrumentation for the Board's observer dispatch.  A monitor is
+   handed every observer callback the board makes (onStrokeAdded, onAnnotationAdded, ...)
+   and must call it.  Monitors are installed on the board, e.g. board.EnableProfiling(),
+   and cost nothing when none are installed.
+
+   BoardProfiler records, for each observer callback:
+      calls, total time, self time (excluding callbacks nested inside it), max time,
+      and the deepest cascade (callbacks triggered from within callbacks) it ran at.
+
+   CascadeTracer records the causal tree of callbacks that each input stroke sets off
+   (AddStroke -> onStrokeAdded -> AnnotateStrokes -> onAnnotationAdded -> ...) with
+   timestamps, and exports it in the Chrome trace-event format, which can be loaded
+   in chrome://tracing or https://ui.perfetto.dev :
+      tracer = board.EnableTracing()
+      ...
+      tracer.export("strokes.trace.json")
+
+Doctest Examples:
+
+>>> class Slow(object):
+...     def onStrokeAdded(self, stroke):
+...         time.sleep(0.01)
+>>> p = BoardProfiler()
+>>> obs = Slow()
+>>> p.call(obs, 'onStrokeAdded', obs.onStrokeAdded, (None,))
+>>> snap = p.snapshot()
+>>> snap['Slow.onStrokeAdded']['calls'], snap['Slow.onStrokeAdded']['max_depth']
+(1, 1)
+>>> snap['Slow.onStrokeAdded']['total'] >= 0.01
+True
+
+Nested callbacks are charged to their own entry, and not to the callback's self time
+>>> class Outer(object):
+...     def onStrokeAdded(self, stroke):
+...         p.call(obs, 'onStrokeAdded', obs.onStrokeAdded, (stroke,))
+>>> o = Outer()
+>>> p.reset()
+>>> p.call(o, 'onStrokeAdded', o.onStrokeAdded, (None,))
+>>> snap = p.snapshot()
+>>> snap['Outer.onStrokeAdded']['self'] < 0.01 <= snap['Outer.onStrokeAdded']['total']
+True
+>>> snap['Slow.onStrokeAdded']['max_depth'], p.maxDepth
+(2, 2)
+
+The tracer keeps one tree per input stroke
+>>> from SketchFramework.Stroke import Stroke
+>>> stk = Stroke([(0,0), (1,1)])
+>>> t = CascadeTracer()
+>>> class Outer(object):
+...     def onStrokeAdded(self, stroke):
+...         t.call(obs, 'onStrokeAdded', obs.onStrokeAdded, (stroke,))
+>>> o = Outer()
+>>> t.strokeStarted(stk)
+>>> t.call(o, 'onStrokeAdded', o.onStrokeAdded, (stk,))
+>>> t.strokeFinished(stk)
+>>> root = t.trees()[0]
+>>> [root['name']] + [c['name'] for c in root['children']] + [g['name'] for g in root['children'][0]['children']]
+['AddStroke', 'Outer.onStrokeAdded', 'Slow.onStrokeAdded']
+>>> root['children'][0]['args']['stroke'] == stk.id
+True
+>>> events = t.toChromeTrace()['traceEvents']
+>>> [(e['name'], e['ph']) for e in events]
+[('AddStroke', 'X'), ('Outer.onStrokeAdded', 'X'), ('Slow.onStrokeAdded', 'X')]
+>>> events[2]['dur'] >= 10000 #microseconds
+True
+
+A stroke's tree is finished even if an observer raises, so the next stroke gets a tree of its own
+>>> from SketchFramework.Board import BoardSingleton, BoardObserver
+>>> class Broken(BoardObserver):
+...     def onStrokeAdded(self, stroke):
+...         raise ValueError("broken observer")
+>>> board = BoardSingleton(reset = True)
+>>> board.RegisterForStroke(Broken())
+>>> t = board.EnableTracing()
+>>> board.AddStroke(Stroke([(0,0), (1,1)]))
+Traceback (most recent call last):
+    ...
+ValueError: broken observer
+>>> board.AddStroke(Stroke([(2,2), (3,3)]))
+Traceback (most recent call last):
+    ...
+ValueError: broken observer
+>>> [(root['name'], len(root['children'])) for root in t.trees()]
+[('AddStroke', 1), ('AddStroke', 1)]
+>>> board.DisableTracing()
+>>> board = BoardSingleton(reset = True)
+"""
+
+import os
+import sys
+import time
+import json
+import threading
+
+from Utils import Logger
+
+logger = Logger.getLogger('BoardMonitor', Logger.WARN )
+
+#--------------------------------------------
+
+class BoardMonitor(object):
+    "Base class for board dispatch monitors"
+    def call(self, observer, cbName, func, args):
+        "Input: the observer, the name of the callback, the (bound) callback and its arguments. Must call func(*args)"
+        func(*args)
+
+    def strokeStarted(self, stroke):
+        "Called when the board starts adding stroke, before any observer hears about it"
+        pass
+
+    def strokeFinished(self, stroke):
+        "Called once every callback set off by adding stroke has returned"
+        pass
+
+#--------------------------------------------
+
+class BoardProfiler(BoardMonitor):
+    "Accumulates timing statistics for every observer callback the board makes"
+    def __init__(self, dumpInterval = None, dumpFile = None):
+        "If dumpInterval (seconds) is given, a report is written to dumpFile (a path, default the log) at most that often"
+        self.dumpInterval = dumpInterval
+        self.dumpFile = dumpFile
+        self.reset()
+
+    def reset(self):
+        "Forget all of the statistics gathered so far"
+        self.stats = {} # { "Observer.callback" : {'calls', 'total', 'self', 'max', 'max_depth'} }
+        self.maxDepth = 0
+        self._nested = [] # time spent in nested callbacks, one entry per active callback
+        self._lastDump = time.time()
+
+    def call(self, observer, cbName, func, args):
+        nested = self._nested
+        nested.append(0.0)
+        depth = len(nested)
+        start = time.time()
+        try:
+            func(*args)
+        finally:
+            elapsed = time.time() - start
+            childTime = nested.pop()
+            if len(nested) > 0:
+                nested[-1] += elapsed
+
+            key = "%s.%s" % (observer.__class__.__name__, cbName)
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = {'calls': 0, 'total': 0.0, 'self': 0.0, 'max': 0.0, 'max_depth': 0}
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            entry['self'] += elapsed - childTime
+            if elapsed > entry['max']:
+                entry['max'] = elapsed
+            if depth > entry['max_depth']:
+                entry['max_depth'] = depth
+            if depth > self.maxDepth:
+                self.maxDepth = depth
+
+            if depth == 1 and self.dumpInterval is not None \
+            and time.time() - self._lastDump >= self.dumpInterval:
+                self.dump()
+
+    def snapshot(self):
+        "Returns a copy of the statistics: { 'Observer.callback' : {'calls', 'total', 'self', 'max', 'max_depth'} }"
+        return dict( [(key, dict(entry)) for key, entry in self.stats.items()] )
+
+    def byObserver(self):
+        "Returns the statistics summed over each observer's callbacks: { 'Observer' : {'calls', 'total', 'self', 'max', 'max_depth'} }"
+        retDict = {}
+        for key, entry in self.stats.items():
+            name = key.split(".")[0]
+            obsEntry = retDict.setdefault(name, {'calls': 0, 'total': 0.0, 'self': 0.0, 'max': 0.0, 'max_depth': 0})
+            obsEntry['calls'] += entry['calls']
+            obsEntry['total'] += entry['total']
+            obsEntry['self'] += entry['self']
+            obsEntry['max'] = max(obsEntry['max'], entry['max'])
+            obsEntry['max_depth'] = max(obsEntry['max_depth'], entry['max_depth'])
+        return retDict
+
+    def report(self):
+        "Returns the statistics as a table, slowest (by self time) first"
+        lines = ["%-45s %8s %10s %10s %10s %6s" % ("callback", "calls", "total(s)", "self(s)", "max(ms)", "depth")]
+        for key, entry in sorted(self.stats.items(), key = (lambda x: x[1]['self']), reverse = True):
+            lines.append("%-45s %8d %10.3f %10.3f %10.2f %6d" % \
+                (key, entry['calls'], entry['total'], entry['self'], 1000 * entry['max'], entry['max_depth']) )
+        lines.append("max cascade depth: %d" % (self.maxDepth))
+        return "\n".join(lines)
+
+    def dump(self):
+        "Write out the current report"
+        self._lastDump = time.time()
+        if self.dumpFile is None:
+            logger.warn("Board profile:\n%s" % (self.report()))
+        else:
+            fp = open(self.dumpFile, "a")
+            print >> fp, time.ctime()
+            print >> fp, self.report()
+            fp.close()
+
+#--------------------------------------------
+
+def _describeArgs(args):
+    "Returns a small, JSON friendly dict describing a callback's arguments"
+    retDict = {}
+    for arg in args:
+        if hasattr(arg, 'Points'): #A stroke
+            key = 'stroke' if 'stroke' not in retDict else 'new_stroke'
+            retDict[key] = arg.id
+        elif type(arg) in (list, tuple, set):
+            retDict['strokes'] = [s.id for s in arg if hasattr(s, 'id')]
+        elif arg is not None: #An annotation
+            retDict['annotation'] = arg.__class__.__name__
+            retDict['annotation_id'] = id(arg)
+            retDict['strokes'] = [s.id for s in getattr(arg, 'Strokes', []) if hasattr(s, 'id')]
+    return retDict
+
+class CascadeTracer(BoardMonitor):
+    "Records the tree of observer callbacks set off by each stroke added to the board"
+    def __init__(self, maxStrokes = None):
+        "If maxStrokes is given, only the trees for the most recent maxStrokes strokes are kept"
+        self.maxStrokes = maxStrokes
+        self.reset()
+
+    def reset(self):
+        "Forget everything traced so far"
+        self._roots = [] # one tree per input stroke (or per top-level callback made outside of AddStroke)
+        self._stack = [] # the nodes for the calls in progress
+        self._start = time.time()
+
+    def _now(self):
+        "Microseconds since the tracer was started"
+        return int( (time.time() - self._start) * 1000000 )
+
+    def _push(self, name, cat, args):
+        node = {'name': name, 'cat': cat, 'ts': self._now(), 'dur': 0, 'args': args, 'children': []}
+        if len(self._stack) > 0:
+            self._stack[-1]['children'].append(node)
+        else:
+            self._roots.append(node)
+            if self.maxStrokes is not None and len(self._roots) > self.maxStrokes:
+                del(self._roots[0])
+        self._stack.append(node)
+        return node
+
+    def _pop(self, node):
+        node['dur'] = self._now() - node['ts']
+        #Unwind to node, even if something in between did not return normally
+        while len(self._stack) > 0 and self._stack.pop() is not node:
+            pass
+
+    def strokeStarted(self, stroke):
+        self._push("AddStroke", "board", {'stroke': stroke.id})
+
+    def strokeFinished(self, stroke):
+        for node in reversed(self._stack):
+            if node['name'] == "AddStroke" and node['args'].get('stroke') == stroke.id:
+                self._pop(node)
+                break
+
+    def call(self, observer, cbName, func, args):
+        node = self._push( "%s.%s" % (observer.__class__.__name__, cbName), cbName, _describeArgs(args) )
+        try:
+            func(*args)
+        finally:
+            self._pop(node)
+
+    def trees(self):
+        "Returns the traced trees, oldest first. Each node is {'name', 'cat', 'ts', 'dur', 'args', 'children'}, times in microseconds"
+        return list(self._roots)
+
+    def slowest(self, count = 1):
+        "Returns the count trees that took the longest, slowest first"
+        return sorted(self._roots, key = (lambda n: n['dur']), reverse = True)[:count]
+
+    def keepSlowest(self, count):
+        "Discard all but the count slowest trees"
+        keep = self.slowest(count)
+        self._roots = [node for node in self._roots if node in keep]
+
+    def toChromeTrace(self):
+        "Returns the trees as a Chrome trace-event dict: {'traceEvents': [...]}"
+        events = []
+        pid = os.getpid()
+        tid = threading.current_thread().ident or 0
+        toVisit = list(reversed(self._roots))
+        while len(toVisit) > 0:
+            node = toVisit.pop()
+            events.append( {'name': node['name'], 'cat': node['cat'], 'ph': 'X',
+                            'ts': node['ts'], 'dur': node['dur'], 'pid': pid, 'tid': tid,
+                            'args': node['args']} )
+            toVisit.extend( reversed(node['children']) )
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, filename):
+        "Write the trace to filename as Chrome trace-event JSON"
+        fp = open(filename, "w")
+        json.dump(self.toChromeTrace(), fp)
+        fp.close()
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    Logger.setDoctest(logger)
+    import doctest
+    doctest.testmod()
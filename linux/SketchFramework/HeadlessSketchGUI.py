@@ -0,0 +1,108 @@
+"""
+filename: HeadlessSketchGUI.py
+
+Description:
+   GUI backends that never open a window, for running the recognizers in a
+   server or batch job.  Both export the same drawing interface as TkSketchGUI:
+       NullSketchGUI       drops every draw call on the floor
+       RecordingSketchGUI  keeps each draw call as a compact tuple in self.Recording
+
+   Select one with SketchGUI.setBackend("null") or SketchGUI.setBackend("recording")
+   (or by setting the SKETCHGUI environment variable) before anything is drawn.
+
+Doctest Examples:
+
+>>> gui = RecordingSketchGUI()
+>>> gui.drawLine(0, 0, 10, 10, color="#ff0000")
+>>> gui.drawCircle(5, 5, radius=3)
+>>> gui.drawText(1, 2, InText="hi")
+>>> gui.getRecording()
+[('line', 0, 0, 10, 10, 2, '#ff0000'), ('circle', 5, 5, 3, '#000000', '', 1.0), ('text', 1, 2, 'hi', 10, '#000000')]
+
+Strokes are kept as one entry rather than one line per segment
+>>> from SketchFramework.Stroke import Stroke
+>>> gui.clear()
+>>> gui.drawStroke(Stroke([(0,0), (1,1), (2,0)]), color="#00ff00")
+>>> gui.getRecording()
+[('stroke', ((0.0, 0.0), (1.0, 1.0), (2.0, 0.0)), 2, '#00ff00')]
+
+>>> n = NullSketchGUI()
+>>> n.drawStroke(Stroke([(0,0), (1,1)]))
+>>> n.getDimensions()
+(1280, 800)
+"""
+
+from SketchFramework.SketchGUI import _SketchGUI
+
+#-------------------------------------
+
+class NullSketchGUI(_SketchGUI):
+    "A GUI that accepts every draw call and does nothing with it"
+    Singleton = None
+    def __init__(self):
+        NullSketchGUI.Singleton = self
+
+    def drawCircle(self, x, y, radius=1, color="#000000", fill="", width=1.0):
+        pass
+
+    def drawLine(self, x1, y1, x2, y2, width=2, color="#000000"):
+        pass
+
+    def drawText (self, x, y, InText="", size=10, color="#000000"):
+        pass
+
+    def drawBox(self, topleft, bottomright, topright = None, bottomleft = None, color="#000000", width=2):
+        pass
+
+    def drawStroke(self, stroke, width = 2, color="#000000", erasable = False):
+        pass
+
+#-------------------------------------
+
+class RecordingSketchGUI(_SketchGUI):
+    "A GUI that records every draw call as a tuple (kind, args...) in the order they were made"
+    Singleton = None
+    def __init__(self):
+        RecordingSketchGUI.Singleton = self
+        self.Recording = []
+
+    def drawCircle(self, x, y, radius=1, color="#000000", fill="", width=1.0):
+        self.Recording.append( ('circle', x, y, radius, color, fill, width) )
+
+    def drawLine(self, x1, y1, x2, y2, width=2, color="#000000"):
+        self.Recording.append( ('line', x1, y1, x2, y2, width, color) )
+
+    def drawText (self, x, y, InText="", size=10, color="#000000"):
+        self.Recording.append( ('text', x, y, InText, size, color) )
+
+    def drawStroke(self, stroke, width = 2, color="#000000", erasable = False):
+        "Record the whole stroke as a single entry instead of one line per segment"
+        points = tuple( (p.X, p.Y) for p in stroke.renderPoints() )
+        self.Recording.append( ('stroke', points, width, color) )
+
+    def getRecording(self):
+        "Returns the list of draw calls made since the last clear()"
+        return list(self.Recording)
+
+    def clear(self):
+        "Forget everything recorded so far"
+        self.Recording = []
+
+#-------------------------------------
+
+def NullSketchGUISingleton():
+    if NullSketchGUI.Singleton == None:
+        NullSketchGUI()
+    return NullSketchGUI.Singleton
+
+def RecordingSketchGUISingleton():
+    if RecordingSketchGUI.Singleton == None:
+        RecordingSketchGUI()
+    return RecordingSketchGUI.Singleton
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -44,6 +44,7 @@ from Observers import TuringMachineObserver
 
 
 from Utils.StrokeStorage import StrokeStorage
+from Utils.StrokeSimplifier import StrokeSimplifier
 from Utils import Logger
 
 from Observers.ObserverBase import Animator
@@ -55,6 +56,11 @@ HEIGHT = 3 * WIDTH / 4
 MID_W = WIDTH/2
 MID_H = HEIGHT/2
 
+# Incoming strokes can be thinned out before they go on the board (see Utils/StrokeSimplifier.py).
+# Distances are in board coordinates; None leaves that step out
+SIMPLIFY_RADIUS = None
+SIMPLIFY_EPSILON = None
+
    
 logger = Logger.getLogger("NetSketchGUI", Logger.DEBUG)
 
@@ -128,7 +134,7 @@ class DrawStroke(DrawAction):
         root.attrib['color'] = str(self.color)
         root.attrib['width'] = str(self.width)
 
-        for i, pt in enumerate(self.stroke.Points):
+        for i, pt in enumerate(self.stroke.renderPoints()):
             pt_el = ET.SubElement(root, "p")
             
             #pt_el.attrib['id'] = str(i)
@@ -228,12 +234,13 @@ class DrawText(DrawAction):
         
 class ImgProcThread (threading.Thread):
     "A Thread that continually pulls image data from imgQ and puts the resulting stroke list in strokeQ"
-    def __init__(self, imgQ, strokeQ):
+    def __init__(self, imgQ, strokeQ, simplifier = None):
         threading.Thread.__init__(self)
         self.daemon = True
 
         self.img_queue = imgQ
         self.stk_queue = strokeQ
+        self.simplifier = simplifier
     def run(self):
         while True:
             image = StringIO.StringIO(self.img_queue.get())
@@ -242,12 +249,15 @@ class ImgProcThread (threading.Thread):
             logger.debug("Processed net image, converting strokes")
             newStrokeList = []
             for stk in stks:
-                newStroke = Stroke()
-                for x,y in stk.points:
-                   scale = WIDTH / GETNORMWIDTH()
-                   newPoint = Point(scale * x, HEIGHT - scale * y)
-                   newStroke.addPoint(newPoint)
+                scale = WIDTH / GETNORMWIDTH()
+                points = [Point(scale * x, HEIGHT - scale * y) for x,y in stk.points]
+                if self.simplifier is not None:
+                    newStroke = self.simplifier.makeStroke(points)
+                else:
+                    newStroke = Stroke(points)
                 newStrokeList.append(newStroke)
+            if self.simplifier is not None and self.simplifier.enabled():
+                logger.debug(self.simplifier.report())
             self.stk_queue.put(newStrokeList)
     
 
@@ -267,6 +277,7 @@ class NetSketchGUI(_SketchGUI):
        self._serverThread = None
        self._xmlResponseQueue = None
        self._imgProcThread = None
+       self._simplifier = StrokeSimplifier(radius = SIMPLIFY_RADIUS, epsilon = SIMPLIFY_EPSILON, keepRaw = True)
        self._setupImageServer()
 
        self._drawQueue = []
@@ -277,7 +288,10 @@ class NetSketchGUI(_SketchGUI):
        self.run()
 
     def ResetBoard(self):
-        "Clear all strokes and board observers from the board (logically and visually)"
+        "Clear all strokes and annotations from the board, keeping the observers once they are set up"
+        if self._Board is not None:
+            self._Board.Clear()
+            return
         self._Board = BoardSingleton(reset = True)
         CircleObserver.CircleMarker()
         #CircleObserver.CircleVisualizer()
@@ -323,7 +337,7 @@ class NetSketchGUI(_SketchGUI):
         img_recv_queue = self._serverThread.getRequestQueue()
         self._xmlResponseQueue = self._serverThread.getResponseQueue()
 
-        self._imgProcThread = ImgProcThread(img_recv_queue, self._strokeQueue)
+        self._imgProcThread = ImgProcThread(img_recv_queue, self._strokeQueue, simplifier = self._simplifier)
         self._imgProcThread.start()
 
         self._serverThread.start()
@@ -10,10 +10,14 @@ Description:
           drawCircle
           drawText
    All other functions and interface behavior is up to the GUI designer.
+   Which GUI is used is chosen by name from a registry of backends (see setBackend).
+   "tk" is the default; "null" and "recording" (HeadlessSketchGUI) never open a window.
    This implementation listens for MouseDown events and builds strokes to hand off
       to the board system. Upon any event, Redraw is called globally to fetch all 
       board paint objects and display them.
 """
+import os
+
 HEIGHT = 800
 WIDTH = 1280
 from Point import Point
@@ -61,20 +65,54 @@ class _SketchGUI(object):
     
     def drawStroke(self, stroke, width = 2, color="#000000", erasable = False):
         prev_p = None
-        for next_p in stroke.Points:
+        for next_p in stroke.renderPoints():
             if prev_p is not None:
                 self.drawLine(prev_p.X, prev_p.Y, next_p.X, next_p.Y, width=width, color=color)
             prev_p = next_p
 
     
+_BACKENDS = {} # Maps a backend name to a function returning that backend's GUI instance
+_BackendName = None
+
+def _tkBackend():
+    from SketchFramework import TkSketchGUI as GuiInstance
+    return GuiInstance.SketchGUISingleton()
+
+def _nullBackend():
+    from SketchFramework import HeadlessSketchGUI as GuiInstance
+    return GuiInstance.NullSketchGUISingleton()
+
+def _recordingBackend():
+    from SketchFramework import HeadlessSketchGUI as GuiInstance
+    return GuiInstance.RecordingSketchGUISingleton()
+
+def registerBackend(name, factory):
+    "Input: string name, function factory. Makes the GUI returned by factory() selectable with setBackend(name)"
+    _BACKENDS[name] = factory
+
+def setBackend(name):
+    "Input: string name. Use the named backend for all drawing from now on. Any existing GUI instance is dropped."
+    global _BackendName
+    if name not in _BACKENDS:
+        raise KeyError("Unknown SketchGUI backend '%s'" % (name))
+    _BackendName = name
+    _SketchGUI.Singleton = None
+
+def getBackend():
+    "Returns the name of the backend SketchGUISingleton will use"
+    if _BackendName is None:
+        return os.environ.get("SKETCHGUI", "tk")
+    return _BackendName
+
+registerBackend("tk", _tkBackend)
+registerBackend("null", _nullBackend)
+registerBackend("recording", _recordingBackend)
+
 def SketchGUISingleton():
     "Returns the GUI instance we're currently working with."
-    #from SketchFramework import WpfSketchGUI as GuiInstance
-    from SketchFramework import TkSketchGUI as GuiInstance
-    
-    
+    #registerBackend("wpf", ...) to draw with WpfSketchGUI instead
     if _SketchGUI.Singleton == None:
-       _SketchGUI.Singleton = GuiInstance.SketchGUISingleton()
+       _SketchGUI.Singleton = _BACKENDS[getBackend()]()
        
     return _SketchGUI.Singleton
     
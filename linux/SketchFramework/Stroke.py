@@ -36,6 +36,8 @@ class Stroke(AnnotatableObject):
 
         self._length = -1
         self._resample = {}
+        #All of the points the stroke was drawn with, if it was simplified and asked to keep them (see Utils/StrokeSimplifier.py)
+        self.RawPoints = None
 
         if points and len(points)>0:
             # if passed a sequence of tuples, covert them all to points
@@ -64,19 +66,19 @@ class Stroke(AnnotatableObject):
 
         if len(self.Points) > 0:
             GUI.drawStroke(self, color=drawColor, erasable = True)
+
+    def renderPoints(self):
+        "Returns the points to draw the stroke with: its RawPoints if it kept them, or else its Points"
+        if self.RawPoints is not None:
+            return self.RawPoints
+        return self.Points
                             
     def length (self, force = False):
-        if self._length == -1 or force:
-            if len(self.Points) > 0:
-                self._length = 0
-                prev = self.Points[0]
-                for next in self.Points:
-                    #Sum up the pairwise distance between points
-                    self._length += prev.distance(next)
-                    prev = next
-            else:
-                self._length = 0
-
+        "Returns the length along the stroke, from the arc lengths GeomUtils caches on it. force recomputes them"
+        from Utils import GeomUtils
+        if force:
+            self._arcLengths = (None, None)
+        self._length = GeomUtils.strokeLength(self)
         return self._length
 
     def get_id(self):
@@ -108,14 +110,21 @@ class Stroke(AnnotatableObject):
     def translate(self, xDist, yDist, overWrite = False):
         "Input: Stroke, and the distance in points to translate in X- and Y-directions. Returns a new translated stroke"
         if overWrite:
-            for p in self.Points:
-                p.X += xDist
-                p.Y += yDist
+            moved = set([])
+            for p in self.Points + (self.RawPoints or []): #The raw points include the kept ones: move each only once
+                if id(p) not in moved:
+                    moved.add(id(p))
+                    p.X += xDist
+                    p.Y += yDist
             
             self.BoundTopLeft.X += xDist
             self.BoundTopLeft.Y += yDist
             self.BoundBottomRight.X += xDist
             self.BoundBottomRight.Y += yDist
+            self._moments = (None, None) #Cached by GeomUtils.strokeMoments, no longer right
+            self._features = (None, None, {}) #Cached by GeomUtils.strokeFeaturePoints
+            self._fingerprint = (None, None, None, None) #Cached by ResultCache.strokeFingerprint
+            #Arc lengths (GeomUtils.strokeArcLengths) don't change when the whole stroke moves
             
             self.X = (self.BoundTopLeft.X + self.BoundBottomRight.X) / 2
             self.Y = (self.BoundTopLeft.Y + self.BoundBottomRight.Y) / 2
@@ -36,8 +36,9 @@ from SketchFramework.Board import BoardSingleton
 from SketchSystem import initialize, standAloneMain
 #from SketchFramework.strokeout import imageBufferToStrokes, imageToStrokes
 #from SketchFramework.NetworkReceiver import ServerThread
-from Utils.StrokeStorage import StrokeStorage
-from Utils.GeomUtils import getStrokesIntersection
+from Utils.StrokeStorage import StrokeStorage, StrokeJournal
+from Utils.StrokeSimplifier import StrokeSimplifier
+from Utils.GeomUtils import strokesIntersect
 from Utils import Logger
 
 from Observers.ObserverBase import Animator
@@ -48,6 +49,18 @@ HEIGHT = 800
 MID_W = WIDTH/2
 MID_H = HEIGHT/2
 
+# Incoming strokes can be thinned out before they go on the board (see Utils/StrokeSimplifier.py).
+# Distances are in pixels; None leaves that step out
+SIMPLIFY_RADIUS = None
+SIMPLIFY_EPSILON = None
+
+# Milliseconds between checks for strokes queued by other threads (e.g. the image server)
+QUEUE_POLL_MS = 100
+
+# Put back the strokes journaled by the last session (e.g. one that crashed) when starting up.
+# The "Recover strokes.journal" menu item does the same at any time
+RECOVER_JOURNAL = False
+
    
 logger = Logger.getLogger("TkSketchGUI", Logger.DEBUG)
 
@@ -65,14 +78,8 @@ class TkSketchGUI(_SketchGUI):
        root = Tk()
        root.title("Sketchy/Scratch")
        self.sketchFrame = TkSketchFrame(master = root)
-       try:
-           while 1:
-               root.update()
-               self.sketchFrame.AnimateFrame()
-               self.sketchFrame.AddQueuedStroke()
-               root.update_idletasks()
-       except TclError:
-           pass
+       #Animation and queued strokes run off the frame's timers, so nothing spins while the board sits idle
+       root.mainloop()
 
     def drawCircle(self, x, y, radius=1, color="#000000", fill="", width=1.0):
         "Draw a circle on the canvas at (x,y) with radius rad. Color should be 24 bit RGB string #RRGGBB. Empty string is transparent"
@@ -86,12 +93,13 @@ class TkSketchGUI(_SketchGUI):
 
 class ImgProcThread (threading.Thread):
     "A Thread that continually pulls image data from imgQ and puts the resulting strokes in strokeQ"
-    def __init__(self, imgQ, strokeQ):
+    def __init__(self, imgQ, strokeQ, simplifier = None):
         threading.Thread.__init__(self)
         self.daemon = True
 
         self.img_queue = imgQ
         self.stk_queue = strokeQ
+        self.simplifier = simplifier
     def run(self):
         while True:
             image = StringIO.StringIO(self.img_queue.get())
@@ -99,11 +107,12 @@ class ImgProcThread (threading.Thread):
             stks = imageBufferToStrokes(image)
             logger.debug("Processed net image, converting strokes")
             for stk in stks:
-                newStroke = Stroke()
-                for x,y in stk.points:
-                   scale = WIDTH / float(1280)
-                   newPoint = Point(scale * x,HEIGHT - scale * y)
-                   newStroke.addPoint(newPoint)
+                scale = WIDTH / float(1280)
+                points = [Point(scale * x,HEIGHT - scale * y) for x,y in stk.points]
+                if self.simplifier is not None:
+                    newStroke = self.simplifier.makeStroke(points)
+                else:
+                    newStroke = Stroke(points)
                 self.stk_queue.put(newStroke)
 
 
@@ -141,13 +150,23 @@ class TkSketchFrame(Frame):
         self.StrokeList = []
 
         self.AnimatorDrawtimes = {} #A dictionary of Animator subclasses to the deadline for the next frame draw 
+        self._animateJob = None #The Tk timer for the next frame draw, if there is one
+        self._pollJob = None #The Tk timer for the next check of StrokeQueue, see SchedulePoll
 
         self.StrokeLoader = StrokeStorage()
+        self.StrokeJournal = None
+        self.Simplifier = StrokeSimplifier(radius = SIMPLIFY_RADIUS, epsilon = SIMPLIFY_EPSILON, keepRaw = True)
         #self.SetupImageServer()
 
         self.ResetBoard()
         self.MakeMenu()
+
+        #Every stroke is journaled as it is drawn, after whatever the last session left in the journal
+        self.StrokeJournal = StrokeJournal()
+        if RECOVER_JOURNAL:
+            self.RecoverJournal()
        
+        self.PollStrokeQueue()
         self.Redraw()
 
       
@@ -165,27 +184,62 @@ class TkSketchFrame(Frame):
         top_menu.add_command(label="Reset Board", command = (lambda :self.ResetBoard() or self.Redraw()), underline=1 )
         top_menu.add_command(label="Load strokes.dat", command = (lambda : self.LoadStrokes() or self.Redraw()), underline=1 )
         top_menu.add_command(label="Save strokes.dat", command = (lambda : self.SaveStrokes()), underline=1 )
+        top_menu.add_command(label="Recover strokes.journal", command = (lambda : self.RecoverJournal() or self.Redraw()), underline=1 )
         top_menu.add_command(label="Undo Stroke", command = (lambda :self.RemoveLatestStroke() or self.Redraw()), underline=1 )
         #top_menu.add_command(label="Strokes From Image", command = (lambda :self.LoadStrokesFromImage() or self.Redraw()), underline=1 )
 
 
     def AddQueuedStroke(self):
+        "Add the next stroke waiting in StrokeQueue to the board. Returns True if there was one"
         #Only process one stroke per round
         if not self.StrokeQueue.empty():
             stk = self.StrokeQueue.get()
             logger.debug("Adding queued stroke %s" % (stk))
             self.Board.AddStroke(stk)
             self.StrokeList.append(stk)
+            self.StrokeJournal.append(stk)
             self.Redraw()
             self.StrokeQueue.task_done()
+            return True
+        return False
+
+    def AddQueuedStrokes(self):
+        "Add all of the strokes waiting in StrokeQueue to the board now"
+        while self.AddQueuedStroke():
+            pass
+
+    def PollStrokeQueue(self):
+        "Add the next queued stroke, then check the queue again once Tk is idle if there was one, or in QUEUE_POLL_MS if not"
+        self._pollJob = None
+        self.SchedulePoll(idle = self.AddQueuedStroke())
+
+    def SchedulePoll(self, idle = False):
+        "Set the timer for the next PollStrokeQueue in place of any already set, so it is the only thing taking strokes from the queue"
+        if self._pollJob is not None:
+            self.after_cancel(self._pollJob)
+        if idle:
+            self._pollJob = self.after_idle(self.PollStrokeQueue)
+        else:
+            self._pollJob = self.after(QUEUE_POLL_MS, self.PollStrokeQueue)
 
     def LoadStrokes(self):
       for stroke in self.StrokeLoader.loadStrokes():
          self.Board.AddStroke(stroke)
          self.StrokeList.append(stroke)
+         self.StrokeJournal.append(stroke)
 
     def SaveStrokes(self):
       self.StrokeLoader.saveStrokes(self.StrokeList)
+
+    def RecoverJournal(self):
+      "Replace the board with the strokes in the journal that weren't removed, including any from earlier sessions"
+      self.AddQueuedStrokes() #So they are journaled, rather than dropped by ResetBoard
+      strokes = self.StrokeJournal.recover()
+      self.ResetBoard()
+      for stroke in strokes:
+         self.Board.AddStroke(stroke)
+         self.StrokeList.append(stroke)
+         self.StrokeJournal.append(stroke)
         
     """
     def LoadStrokesFromImage(self):
@@ -212,9 +266,11 @@ class TkSketchFrame(Frame):
     """
 
     def RemoveLatestStroke(self):
+        self.AddQueuedStrokes() #So the stroke just drawn can be undone
         if len (self.StrokeList) > 0:
             stroke = self.StrokeList.pop()
             self.Board.RemoveStroke(stroke)
+            self.StrokeJournal.remove(stroke)
 
     def RebuildObjectMenu(self):
         "Search the board for existing objects, and add a menu entry to manipulate it (drawAll)"
@@ -236,14 +292,23 @@ class TkSketchFrame(Frame):
 
 
     def ResetBoard(self):
-        "Clear all strokes and board observers from the board (logically and visually)"
+        "Clear all strokes and annotations from the board (logically and visually), keeping the observers once they are set up"
         self.p_x = self.p_y = None
 
-        self.Board = BoardSingleton(reset = True)
-        initialize(self.Board)
-        self.RegisterAnimators()
+        if self.Board is None:
+            self.Board = BoardSingleton(reset = True)
+            initialize(self.Board)
+            self.RegisterAnimators()
+        else:
+            self.Board.Clear()
         self.CurrentPointList = []
+        #Strokes still waiting in the queue go with the rest
+        while not self.StrokeQueue.empty():
+            self.StrokeQueue.get()
+            self.StrokeQueue.task_done()
         self.StrokeList = []
+        if self.StrokeJournal is not None:
+            self.StrokeJournal.clear()
 
 
     def RegisterAnimators(self):
@@ -251,7 +316,8 @@ class TkSketchFrame(Frame):
         for obs in self.Board.BoardObservers:
             if Animator in type(obs).__mro__: #Check if it inherits from Animator
                 logger.debug( "Registering %s as animator" % (obs))
-                self.AnimatorDrawtimes[obs] = time.time()
+                self.AnimatorDrawtimes[obs] = 1000 * time.time()
+        self.ScheduleAnimation()
                 
                 
     def CanvasRightMouseDown(self, event):
@@ -274,14 +340,16 @@ class TkSketchFrame(Frame):
 
     def CanvasRightMouseUp(self, event):
         delStrokes = set([])
+        self.AddQueuedStrokes() #So the strokes just drawn can be erased
         if len(self.CurrentPointList) > 0:
             stroke = Stroke( self.CurrentPointList )#, smoothing=True )
             self.CurrentPointList = []
             for stk in list(self.StrokeList):
-                if len(getStrokesIntersection(stroke, stk) ) > 0:
+                if strokesIntersect(stroke, stk):
                     logger.debug( "Removing Stroke")
                     self.Board.RemoveStroke(stk)
                     self.StrokeList.remove(stk)
+                    self.StrokeJournal.remove(stk)
         self.p_x = self.p_y = None
         self.Redraw()
 
@@ -306,27 +374,27 @@ class TkSketchFrame(Frame):
         self.p_y = HEIGHT - y
 
     def AddCurrentStroke(self):
+        "Finish the stroke being drawn and queue it. It is recognized once Tk has handled the events waiting"
         if len(self.CurrentPointList) > 0:
-            stroke = Stroke( self.CurrentPointList )#, smoothing=True )
+            stroke = self.Simplifier.makeStroke( self.CurrentPointList )
             
-            self.Board.AddStroke(stroke)
-            self.StrokeList.append(stroke)
+            self.StrokeQueue.put(stroke)
+            self.SchedulePoll(idle = True)
             self.CurrentPointList = []
             
         
     def CanvasMouseUp(self, event):
         "Finish the stroke and add it to the board"
-        #start a new stroke
+        #start a new stroke. The board is redrawn when the stroke is added
         self.AddCurrentStroke()
         self.p_x = self.p_y = None
-        self.Redraw()
 
     """
     def SetupImageServer(self):
         self.serverThread = ServerThread(port = 30000)
         self.net_queue = self.serverThread.getResponseQueue()
         self.serverThread.start()
-        self.imgProcThread = ImgProcThread(self.net_queue, self.StrokeQueue)
+        self.imgProcThread = ImgProcThread(self.net_queue, self.StrokeQueue, simplifier = self.Simplifier)
         self.imgProcThread.start()
     """
 
@@ -334,11 +402,23 @@ class TkSketchFrame(Frame):
         
 
         
+    def ScheduleAnimation(self):
+        "Set a timer for when the next animation frame is due. With no animators, there is no timer"
+        if self._animateJob is not None:
+            self.after_cancel(self._animateJob)
+            self._animateJob = None
+        if len(self.AnimatorDrawtimes) > 0:
+            delay = min(self.AnimatorDrawtimes.values()) - 1000 * time.time()
+            self._animateJob = self.after(max(0, int(delay) + 1), self.AnimateFrame) #Rounded up, so the frame is due when it fires
+
     def AnimateFrame(self):
+        "Draw the animators whose frames are due, then wait for the next frame"
+        self._animateJob = None
         for obs, deadline in self.AnimatorDrawtimes.items():
             if deadline <= 1000 * time.time():
                 obs.drawMyself()
                 self.AnimatorDrawtimes[obs] = 1000 *( (1 / float(obs.fps)) + time.time() ) #Time the next frame
+        self.ScheduleAnimation()
 
         
     def Redraw(self):
@@ -401,7 +481,7 @@ def drawBox(topleft, bottomright, color="#000000", width=2):
 def drawStroke(stroke, width = 2, color="#000000"):
     s = TkSketchGUISingleton().sketchFrame
     prev_p = None
-    for next_p in stroke.Points:
+    for next_p in stroke.renderPoints():
         if prev_p is not None:
             s.drawLine(prev_p.X, prev_p.Y, next_p.X, next_p.Y, width = width, color=color)
         prev_p = next_p
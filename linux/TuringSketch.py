@@ -18,7 +18,8 @@ from SketchFramework.Stroke import Stroke
 from SketchFramework.Board import BoardSingleton
 from SketchFramework.strokeout import imageToStrokes
 from Utils.StrokeStorage import StrokeStorage
-from Utils.GeomUtils import getStrokesIntersection
+from Utils.StrokeSimplifier import StrokeSimplifier
+from Utils.GeomUtils import strokesIntersect
 
 from Observers import CircleObserver
 from Observers import ArrowObserver
@@ -34,6 +35,11 @@ HEIGHT = 800
 MID_W = WIDTH/2
 MID_H = HEIGHT/2
 
+# Incoming strokes can be thinned out before they go on the board (see Utils/StrokeSimplifier.py).
+# Distances are in pixels; None leaves that step out
+SIMPLIFY_RADIUS = None
+SIMPLIFY_EPSILON = None
+
 
 def initializeBoard(board):
 
@@ -74,12 +80,8 @@ class TkSketchGUI(_SketchGUI):
        root = Tk()
        root.title("Sketchy/Scratch")
        self.sketchFrame = TkSketchFrame(master = root)
-       try:
-           while 1:
-               root.update()
-               root.update_idletasks()
-       except TclError:
-           pass
+       #Everything runs off Tk events, so nothing spins while the board sits idle
+       root.mainloop()
 
     def drawCircle(self, x, y, radius=1, color="#000000", fill="", width=1.0):
         "Draw a circle on the canvas at (x,y) with radius rad. Color should be 24 bit RGB string #RRGGBB. Empty string is transparent"
@@ -144,9 +146,12 @@ class TkSketchFrame(Frame):
         self.SimButton.pack(side=LEFT)
         self.SimButton = Button(self, text="Restart", command = (lambda: self.RestartMachines() or self.Redraw()))
         self.SimButton.pack(side=LEFT)
+        self.SimButton = Button(self, text="Run", command = (lambda: self.RunMachines() or self.Redraw()))
+        self.SimButton.pack(side=LEFT)
 
         self.CurrentPointList = []
         self.StrokeList = []
+        self.Simplifier = StrokeSimplifier(radius = SIMPLIFY_RADIUS, epsilon = SIMPLIFY_EPSILON, keepRaw = True)
 
         self.shouldDrawAnnos = True
         self.shouldDrawStrokes = True
@@ -188,6 +193,12 @@ class TkSketchFrame(Frame):
         for tm_anno in BoardSingleton().FindAnnotations( anno_type = TuringMachineObserver.TuringMachineAnnotation):
             tm_anno.simulateStep()
 
+    def RunMachines(self, max_steps = 1000000, max_time = 1.0):
+        "Fast-forward the machines until they halt, or for at most max_steps steps / max_time seconds each"
+        for tm_anno in BoardSingleton().FindAnnotations( anno_type = TuringMachineObserver.TuringMachineAnnotation):
+            steps = tm_anno.run(max_steps = max_steps, max_time = max_time)
+            print "Ran %s steps" % (steps)
+
     def RestartMachines(self):
         self.SetTapeString()
         for tm_anno in BoardSingleton().FindAnnotations( anno_type = TuringMachineObserver.TuringMachineAnnotation):
@@ -236,16 +247,16 @@ class TkSketchFrame(Frame):
            return
         print "Loaded %s strokes from '%s'" % (len(strokes), fname)
 
+        scale = WIDTH / float(1280)
         for s in strokes:
-           newStroke = Stroke()
-           for x,y in s.points:
-              scale = WIDTH / float(1280)
-              newPoint = Point(scale * x,HEIGHT - scale * y)
-              newStroke.addPoint(newPoint)
+           newStroke = self.Simplifier.makeStroke( [Point(scale * x,HEIGHT - scale * y) for x,y in s.points] )
            self.Board.AddStroke(newStroke)
            self.StrokeList.append(newStroke)
+        if self.Simplifier.enabled():
+           print self.Simplifier.report()
 
     def RemoveLatestStroke(self):
+        self.AddPendingStrokes() #So the stroke just drawn can be undone
         if len (self.StrokeList) > 0:
             stroke = self.StrokeList.pop()
             self.Board.RemoveStroke(stroke)
@@ -270,13 +281,17 @@ class TkSketchFrame(Frame):
 
 
     def ResetBoard(self):
-        "Clear all strokes and board observers from the board (logically and visually)"
+        "Clear all strokes and annotations from the board (logically and visually), keeping the observers once they are set up"
         self.p_x = self.p_y = None
 
-        self.Board = BoardSingleton(reset = True)
-        initializeBoard(self.Board)
-        self.TMVisualizer = TuringMachineObserver.TuringMachineVisualizer()
+        if self.Board is None:
+            self.Board = BoardSingleton(reset = True)
+            initializeBoard(self.Board)
+            self.TMVisualizer = TuringMachineObserver.TuringMachineVisualizer()
+        else:
+            self.Board.Clear()
         self.CurrentPointList = []
+        self.PendingStrokes = [] #Finished strokes waiting for AddPendingStrokes go with the rest
         self.StrokeList = []
 
                 
@@ -300,11 +315,12 @@ class TkSketchFrame(Frame):
 
     def CanvasRightMouseUp(self, event):
         delStrokes = set([])
+        self.AddPendingStrokes() #So the strokes just drawn can be erased
         if len(self.CurrentPointList) > 0:
             stroke = Stroke( self.CurrentPointList )#, smoothing=True )
             self.CurrentPointList = []
             for stk in list(self.StrokeList):
-                if len(getStrokesIntersection(stroke, stk) ) > 0:
+                if strokesIntersect(stroke, stk):
                     print "Removing Stroke"
                     self.Board.RemoveStroke(stk)
                     self.StrokeList.remove(stk)
@@ -333,21 +349,31 @@ class TkSketchFrame(Frame):
         self.p_y = HEIGHT - y
 
     def AddCurrentStroke(self):
+        "Finish the stroke being drawn. It is recognized once Tk has handled the events waiting (see AddPendingStrokes)"
         if len(self.CurrentPointList) > 0:
-            stroke = Stroke( self.CurrentPointList )#, smoothing=True )
+            stroke = self.Simplifier.makeStroke( self.CurrentPointList )
             
-            self.Board.AddStroke(stroke)
-            self.StrokeList.append(stroke)
+            if len(self.PendingStrokes) == 0:
+                self.after_idle(self.AddPendingStrokes)
+            self.PendingStrokes.append(stroke)
             self.CurrentPointList = []
             
+    def AddPendingStrokes(self):
+        "Add the finished strokes that are still waiting to the board, and show what was recognized"
+        if len(self.PendingStrokes) == 0:
+            return
+        strokes = self.PendingStrokes
+        self.PendingStrokes = []
+        for stroke in strokes:
+            self.Board.AddStroke(stroke)
+            self.StrokeList.append(stroke)
+        self.Redraw()
         
     def CanvasMouseUp(self, event):
         "Finish the stroke and add it to the board"
-        #start a new stroke
+        #start a new stroke. The board is redrawn when the stroke is added
         self.AddCurrentStroke()
         self.p_x = self.p_y = None
-        #print "Redraw from MouseUp"
-        self.Redraw()
 
     def Redraw(self):
         "Find all the strokes on the board, draw them, then iterate through every object and have it draw itself"
@@ -34,6 +34,19 @@ TODO: Finish out doctest for the rest of functions in this module
 >>> [angleSub(a,b) for (a,b) in zip(angles,[n-190 for n in normangles])]
 [-170, -170, -170, -170, -170, -170, -170, -170]
 
+--- raw coordinates ---
+- the primitives work on plain numbers, and don't create any Points
+>>> segmentIntersectionXY(0, 0, 10, 10, 0, 10, 10, 0)
+(5.0, 5.0)
+>>> segmentIntersectionXY(0, 0, 1, 1, 0, 10, 10, 0) is None
+True
+>>> pointSegmentDistanceSquared(5, 5, 0, 0, 10, 0), pointSegmentDistanceSquared(13, 4, 0, 0, 10, 0)
+(25.0, 25.0)
+>>> orientation(0, 0, 10, 0, 5, 5) > 0
+True
+>>> douglasPeuckerXY([0, 1, 2, 3, 3, 3], [0, 0.1, 0, 0, 1, 2], 0.5)
+[0, 3, 5]
+
 --- strokes ---
 
 >>> instroke = Stroke([Point(x**3,x**3) for x in range(1,8)])
@@ -49,6 +62,29 @@ TODO: Finish out doctest for the rest of functions in this module
 >>> [ str(p) for p in strokeNormalizeSpacing(instroke,10).Points]
 ['(1.0,1.0)', '(35.2,35.2)', '(69.4,69.4)', '(103.6,103.6)', '(137.8,137.8)', '(172.0,172.0)', '(206.2,206.2)', '(240.4,240.4)', '(274.6,274.6)', '(308.8,308.8)', '(343.0,343.0)']
 
+- the distances along a stroke are cached on it, so points part way along it are found by bisection
+>>> ell = Stroke([Point(0,0), Point(10,0), Point(10,10)])
+>>> strokeArcLengths(ell)
+[0.0, 10.0, 20.0]
+>>> str(strokeMidpoint(ell)), str(strokePointAtFraction(ell, 0.75))
+('(10.0,0.0)', '(10.0,5.0)')
+>>> strokeResampleXY(ell, 5)
+[(0.0, 0.0), (5.0, 0.0), (10.0, 0.0), (10.0, 5.0), (10.0, 10.0)]
+>>> arcLengths(ell.Points + [Point(0,10)], start = strokeArcLengths(ell))
+[0.0, 10.0, 20.0, 30.0]
+>>> strokeArcLengths(ell)
+[0.0, 10.0, 20.0]
+
+- strokeFeaturePoints finds the corners of a stroke (ShortStraw), between its two endpoints.  The
+- corners are points of the stroke resampled at even spacing, so they are close to the drawn ones
+>>> box = Stroke([Point(x, 0) for x in range(0, 40, 2)] + [Point(40, y) for y in range(0, 40, 2)] + [Point(x, 40) for x in range(40, 0, -2)] + [Point(0, y) for y in range(40, -1, -2)])
+>>> [str(p) for p in strokeFeaturePoints(box)]
+['(0.0,0.0)', '(39.6,0.0)', '(40.0,39.3)', '(0.0,39.6)', '(0.0,0.0)']
+>>> len(strokeCorners(box))
+3
+>>> strokeFeaturePoints(Stroke([])), strokeCorners(Stroke([]))
+([], [])
+
 - strokeCircularity will give a number from 0.0 to 1.0, with 1.0 being a perfect circle.  
 - Below we test it first with a line, and then with a perfectly generated circle stroke
 >>> strokeCircularity(instroke)
@@ -57,21 +93,62 @@ TODO: Finish out doctest for the rest of functions in this module
 >>> 0.98 < strokeCircularity(Stroke(circlepoints)) < 1
 True
 
+- strokeFitCircle fits a circle to the points in one pass, giving its center, radius, and about how far
+- the points are from it.  A straight stroke has no circle.  strokeFitEllipse does the same for ellipses
+>>> center, radius, residual = strokeFitCircle(Stroke(circlepoints))
+>>> str(center), round(radius, 1), round(residual, 2)
+('(199.5,200.0)', 99.7, 0.3)
+>>> strokeFitCircle(instroke) is None
+True
+>>> center, major, minor, angle, residual = strokeFitEllipse(Stroke([(200 + 60*math.cos(math.radians(t)), 100 + 30*math.sin(math.radians(t))) for t in range(0, 360, 30)]))
+>>> str(center), round(major, 1), round(minor, 1), round(angle, 1)
+('(200.0,100.0)', 60.0, 30.0, 0.0)
+
 - strokeOrientation measure the angle of a stroke
 - in this case, the line looks like (x,x) so it should be 45 degrees
 >>> strokeOrientation(instroke)
 45.0
 
+- strokeMoments keeps running sums over a stroke's points, so area, mean and orientation
+- don't need another pass over the points as the stroke grows
+>>> square = Stroke([Point(0,0), Point(10,0), Point(10,10)])
+>>> strokeMoments(square).area()
+50.0
+>>> square.addPoint(Point(0,10))
+>>> strokeMoments(square).area(), strokeMoments(square).mean()
+(100.0, (5.0, 5.0))
+
 - strokeConcavity measures what fraction of points fall inside the convex hull of the stroke
 - for a circle, it should be zero because none of the points are on the interior of the hull.
 >>> strokeConcavity(Stroke(circlepoints))
 0.0
 
+- strokeConvexHull caches the hull on the stroke, and only looks at new points as the stroke grows
+>>> growing = Stroke([Point(0,0), Point(10,0), Point(5,5)])
+>>> [str(p) for p in strokeConvexHull(growing)]
+['(0.0,0.0)', '(10.0,0.0)', '(5.0,5.0)']
+>>> growing.addPoint(Point(5,20)); growing.addPoint(Point(5,1))
+>>> [str(p) for p in strokeConvexHull(growing)]
+['(0.0,0.0)', '(10.0,0.0)', '(5.0,20.0)']
+
 - strokeChopEnds cuts the ends off of a stroke
 >>> chopstroke = strokeChopEnds(instroke,0.35,4)
 >>> [ str(p) for p in chopstroke.Points]
 ['(8.0,8.0)', '(27.0,27.0)', '(64.0,64.0)', '(125.0,125.0)', '(216.0,216.0)']
 
+- strokeSmooth averages each point with the ones around it (after putting a point between each pair),
+- in time that doesn't depend on the width.  preserveEnds keeps the ends from being pulled in
+>>> zigzag = Stroke([Point(0,0), Point(10,10), Point(20,0), Point(30,10)])
+>>> [str(p) for p in strokeSmooth(zigzag, width = 2).Points]
+['(5.0,5.0)', '(7.5,5.0)', '(10.0,4.0)', '(15.0,5.0)', '(20.0,6.0)', '(22.5,5.0)', '(25.0,5.0)']
+>>> [str(p) for p in strokeSmooth(zigzag, width = 2, preserveEnds = True).Points][0]
+'(3.0,3.0)'
+
+- a Savitzky-Golay kernel fits a quadratic around each point, so it flattens curves less than the average
+>>> parabola = Stroke([Point(x, x*x) for x in range(5)])
+>>> str(strokeSmooth(parabola, width = 2).Points[4]), str(strokeSmooth(parabola, width = 2, kernel = "savgol").Points[4])
+('(2.0,4.6)', '(2.0,4.2)')
+
 - strokeLineSegOrientations returns a list of all the orientations of the line segments
 - in the stroke.  If we feed it a cicle, the start (normalized) should be 0.0, and about
 - halfway though we should be about at 180 degrees
@@ -93,10 +170,23 @@ True
 >>> str(tl),str(br)
 ('(1.0,343.0)', '(343.0,1.0)')
 
+--- polygons ---
+- a PreparedPolygon can be tested against many points.  This square has a notch cut into its top
+>>> notched = PreparedPolygon([Point(0,0), Point(10,0), Point(10,10), Point(6,10), Point(5,5), Point(4,10), Point(0,10)])
+>>> notched.containsPoints([Point(2,2), Point(5,8), Point(5,4), Point(12,5)])
+[True, False, True, False]
+>>> pointInPolygons([notched, [Point(4,4), Point(8,4), Point(6,8)]], Point(6,5))
+[True, True]
+>>> pointInPolygon(Stroke(circlepoints).Points, Point(200,200))
+True
+>>> pointInPolygon([], Point(0,0))
+False
+
 """
 
 import math
 import sys
+import bisect
 import pdb
 
 from Utils import Logger
@@ -107,9 +197,278 @@ logger = Logger.getLogger('GeomUtils', Logger.WARN )
 
 
 #--------------------------------------------------------------
-# Functions on Points
+# Primitives on raw coordinates
+# These take plain numbers and create no objects (beyond a returned tuple), for use in inner loops.
+# The Point and Stroke versions below delegate to them.
+
+def orientation(ax, ay, bx, by, cx, cy):
+    "Returns twice the signed area of triangle a, b, c: positive if a -> b -> c turns left (counterclockwise), negative if right, 0 if collinear"
+    return (bx - ax) * (cy - ay) - (cx - ax) * (by - ay)
+
+def pointInBoxXY(x, y, minX, minY, maxX, maxY):
+    "Returns True if (x, y) is inside (or on the edge of) the box"
+    return minX <= x <= maxX and minY <= y <= maxY
+
+def pointSegmentDistanceSquared(px, py, x1, y1, x2, y2):
+    "Returns the squared distance from (px, py) to the closest point of the segment (x1, y1)-(x2, y2)"
+    dx = x2 - x1
+    dy = y2 - y1
+    lenSqr = dx * dx + dy * dy
+    if lenSqr == 0:
+        return (px - x1) ** 2 + (py - y1) ** 2
+    t = ((px - x1) * dx + (py - y1) * dy) / float(lenSqr)
+    if t < 0:
+        t = 0.0
+    elif t > 1:
+        t = 1.0
+    return (px - x1 - t * dx) ** 2 + (py - y1 - t * dy) ** 2
+
+def segmentIntersectionXY(px1, py1, px2, py2, qx1, qy1, qx2, qy2, infinite1 = False, infinite2 = False):
+    "Returns (x, y) where the lines p1-p2 and q1-q2 cross, or None. A line is limited to its segment unless it is infinite"
+    if px1 > px2:
+        px1, py1, px2, py2 = px2, py2, px1, py1
+    if qx1 > qx2:
+        qx1, qy1, qx2, qy2 = qx2, qy2, qx1, qy1
+
+    if not infinite1 and not infinite2:
+        #Quick rejection: one segment is entirely above, below, left or right of the other
+        if px2 < qx1 or px1 > qx2 \
+        or (py1 > qy1 and py2 > qy2 and py1 > qy2 and py2 > qy1) \
+        or (py1 < qy1 and py2 < qy2 and py1 < qy2 and py2 < qy1):
+            return None
+
+    pA = py2 - py1
+    pB = px1 - px2
+    pC = pA * px1 + pB * py1
+
+    qA = qy2 - qy1
+    qB = qx1 - qx2
+    qC = qA * qx1 + qB * qy1
+
+    det = pA * qB - qA * pB
+    if det == 0.0:
+        return None #Parallel
+    x = (qB * pC - pB * qC) / float(det)
+    y = (pA * qC - qA * pC) / float(det)
+
+    if not infinite1 and not (px1 <= x <= px2 and min(py1, py2) <= y <= max(py1, py2)):
+        return None
+    if not infinite2 and not (qx1 <= x <= qx2 and min(qy1, qy2) <= y <= max(qy1, qy2)):
+        return None
+    return (x, y)
+
+def linePointsTowardsXY(x1, y1, x2, y2, tx, ty, radius):
+    "Returns True if the line from (x1, y1) through (x2, y2) passes within radius of (tx, ty), and heads towards it"
+    dx = x2 - x1
+    dy = y2 - y1
+    lenSqr = dx * dx + dy * dy
+    if lenSqr == 0:
+        return False
+    #Where the target projects onto the line, as a fraction of the way from 1 to 2
+    t = ((tx - x1) * dx + (ty - y1) * dy) / float(lenSqr)
+    cross = (tx - x1) * dy - (ty - y1) * dx
+    #Past the segment's midpoint (closer to 2 than to 1), and close enough to the line
+    return t > 0.5 and cross * cross < radius * radius * lenSqr
+
+def radialSimplifyXY(xs, ys, radius):
+    "Returns the indices of the points left after dropping each point closer than radius to the last one kept. The first and last points are always kept"
+    count = len(xs)
+    if count < 3:
+        return range(count)
+    radiusSqr = radius * radius
+    retList = [0]
+    lastX = xs[0]
+    lastY = ys[0]
+    for i in xrange(1, count - 1):
+        x = xs[i]
+        y = ys[i]
+        if (x - lastX) ** 2 + (y - lastY) ** 2 >= radiusSqr:
+            retList.append(i)
+            lastX = x
+            lastY = y
+    retList.append(count - 1)
+    return retList
+
+def douglasPeuckerXY(xs, ys, epsilon, indices = None):
+    """Returns the indices, in order, of the points Ramer-Douglas-Peucker keeps: just enough that none of the others
+    is farther than epsilon from the path through them.  If indices is given, only those points are considered"""
+    if indices is None:
+        indices = range(len(xs))
+    count = len(indices)
+    if count < 3:
+        return list(indices)
+    epsilonSqr = epsilon * epsilon
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    toSplit = [(0, count - 1)] #A stack, rather than recursion, so long strokes can't run out of stack
+    while len(toSplit) > 0:
+        first, last = toSplit.pop()
+        ax = xs[indices[first]]
+        ay = ys[indices[first]]
+        bx = xs[indices[last]]
+        by = ys[indices[last]]
+        farthest = None
+        farthestDist = epsilonSqr
+        for k in xrange(first + 1, last):
+            i = indices[k]
+            dist = pointSegmentDistanceSquared(xs[i], ys[i], ax, ay, bx, by)
+            if dist > farthestDist:
+                farthest = k
+                farthestDist = dist
+        if farthest is not None:
+            keep[farthest] = True
+            toSplit.append( (first, farthest) )
+            toSplit.append( (farthest, last) )
+    return [indices[k] for k in xrange(count) if keep[k]]
+
+def fitCircleXY(xs, ys, method = "taubin"):
+    """Fits a circle to the points by algebraic least squares: "kasa" (Kasa, 1976), or "taubin" (Taubin, 1991),
+    which doesn't pull the circle in when the points only cover an arc.  Returns (cx, cy, radius, residual), where
+    residual is the root mean square of (d*d - radius*radius) / (2 * radius) for the points at distance d from the
+    center: about their distance from the circle, when they're close to it.  Returns None if the points are on a line"""
+    if method not in ("kasa", "taubin"):
+        raise ValueError("Unknown circle fit %r" % (method,))
+    n = len(xs)
+    if n < 3:
+        return None
+    meanX = sum(xs) / float(n)
+    meanY = sum(ys) / float(n)
+    #One pass for the moments of the points about their mean, with z = x*x + y*y
+    mxx = myy = mxy = mxz = myz = mzz = 0.0
+    for i in xrange(n):
+        x = xs[i] - meanX
+        y = ys[i] - meanY
+        z = x * x + y * y
+        mxx += x * x
+        myy += y * y
+        mxy += x * y
+        mxz += x * z
+        myz += y * z
+        mzz += z * z
+    mxx /= n; myy /= n; mxy /= n; mxz /= n; myz /= n; mzz /= n
+    mz = mxx + myy
+    covXY = mxx * myy - mxy * mxy
+    #Kasa's center solves the normal equations directly. Taubin's is the root of a cubic near 0, found
+    #with Newton's method (Chernov, "Circular and Linear Regression", 2010), and is Kasa's when the root is 0
+    root = 0.0
+    if method == "taubin":
+        varZ = mzz - mz * mz
+        a3 = 4 * mz
+        a2 = -3 * mz * mz - mzz
+        a1 = varZ * mz + 4 * covXY * mz - mxz * mxz - myz * myz
+        a0 = mxz * (mxz * myy - myz * mxy) + myz * (myz * mxx - mxz * mxy) - varZ * covXY
+        y = a0
+        for _ in xrange(20):
+            slope = a1 + root * (2 * a2 + 3 * a3 * root)
+            if slope == 0:
+                break
+            newRoot = root - y / slope
+            newY = a0 + newRoot * (a1 + newRoot * (a2 + newRoot * a3))
+            if newRoot == root or abs(newY) >= abs(y):
+                break
+            root, y = newRoot, newY
+    det = root * root - root * mz + covXY
+    if det == 0:
+        return None
+    cx = (mxz * (myy - root) - myz * mxy) / det / 2
+    cy = (myz * (mxx - root) - mxz * mxy) / det / 2
+    radiusSqr = cx * cx + cy * cy + mz
+    if radiusSqr <= 0 or radiusSqr * 1e-12 > mz: #A huge circle: the points are on a line
+        return None
+    #The residual from the same moments: the mean of (z - 2*cx*x - 2*cy*y - mz) ** 2
+    meanSqr = mzz - 4 * (cx * mxz + cy * myz) + 4 * (cx * cx * mxx + 2 * cx * cy * mxy + cy * cy * myy) - mz * mz
+    residual = math.sqrt(max(meanSqr, 0.0) / (4 * radiusSqr))
+    return (cx + meanX, cy + meanY, math.sqrt(radiusSqr), residual)
+
+def fitEllipseXY(xs, ys):
+    """Fits a conic a*x*x + b*x*y + c*y*y + d*x + e*y + f = 0, with a + c = 1, to the points by least squares.
+    Returns (cx, cy, major, minor, angle, residual) for the semi-axes and the angle (degrees) of the major one,
+    where residual is the root mean square distance of the points from the ellipse, measured toward its center.
+    Returns None if the conic isn't an ellipse"""
+    n = len(xs)
+    if n < 5:
+        return None
+    meanX = sum(xs) / float(n)
+    meanY = sum(ys) / float(n)
+    scale = math.sqrt(sum([(x - meanX) ** 2 for x in xs]) / n + sum([(y - meanY) ** 2 for y in ys]) / n)
+    if scale == 0:
+        return None
+    #Normal equations for (a, b, d, e, f), putting c = 1 - a: a*(x*x - y*y) + b*x*y + d*x + e*y + f = -y*y
+    normal = [[0.0] * 6 for _ in xrange(5)]
+    for i in xrange(n):
+        x = (xs[i] - meanX) / scale
+        y = (ys[i] - meanY) / scale
+        row = (x * x - y * y, x * y, x, y, 1.0, -y * y)
+        for j in xrange(5):
+            rj = row[j]
+            normalRow = normal[j]
+            for k in xrange(j, 6):
+                normalRow[k] += rj * row[k]
+    for j in xrange(5):
+        for k in xrange(j):
+            normal[j][k] = normal[k][j]
+    #Gaussian elimination, with partial pivoting
+    for col in xrange(5):
+        pivot = max(xrange(col, 5), key = lambda r: abs(normal[r][col]))
+        if abs(normal[pivot][col]) < 1e-12:
+            return None
+        normal[col], normal[pivot] = normal[pivot], normal[col]
+        for r in xrange(col + 1, 5):
+            factor = normal[r][col] / normal[col][col]
+            for k in xrange(col, 6):
+                normal[r][k] -= factor * normal[col][k]
+    coeffs = [0.0] * 5
+    for col in xrange(4, -1, -1):
+        coeffs[col] = (normal[col][5] - sum([normal[col][k] * coeffs[k] for k in xrange(col + 1, 5)])) / normal[col][col]
+    a, b, d, e, f = coeffs
+    c = 1.0 - a
+    det = 4 * a * c - b * b
+    if det <= 0:
+        return None
+    cx = (b * e - 2 * c * d) / det
+    cy = (b * d - 2 * a * e) / det
+    fCenter = f + (d * cx + e * cy) / 2
+    spread = math.sqrt(((a - c) / 2) ** 2 + (b / 2) ** 2)
+    bigLambda = 0.5 + spread #The eigenvalues of [[a, b/2], [b/2, c]], whose sum is 1
+    smallLambda = 0.5 - spread
+    if fCenter >= 0 or smallLambda <= 0:
+        return None
+    major = math.sqrt(-fCenter / smallLambda)
+    minor = math.sqrt(-fCenter / bigLambda)
+    angle = 0.5 * math.atan2(b, a - c) + math.pi / 2 #The big eigenvalue's direction is across the minor axis
+    cosA = math.cos(angle)
+    sinA = math.sin(angle)
+    sumSqr = 0.0
+    for i in xrange(n):
+        dx = (xs[i] - meanX) / scale - cx
+        dy = (ys[i] - meanY) / scale - cy
+        u = dx * cosA + dy * sinA
+        v = dy * cosA - dx * sinA
+        rho = math.sqrt((u / major) ** 2 + (v / minor) ** 2)
+        if rho > 0:
+            sumSqr += ((rho - 1) / rho) ** 2 * (u * u + v * v)
+        else:
+            sumSqr += minor * minor
+    return (cx * scale + meanX, cy * scale + meanY, major * scale, minor * scale,
+            math.degrees(angle) % 180, math.sqrt(sumSqr / n) * scale)
+
+def sweptAngleXY(xs, ys, cx, cy):
+    "Returns the angle, in degrees, that the path through the points turns around (cx, cy): positive counterclockwise (for y up)"
+    total = 0.0
+    lastAngle = math.atan2(ys[0] - cy, xs[0] - cx)
+    for i in xrange(1, len(xs)):
+        angle = math.atan2(ys[i] - cy, xs[i] - cx)
+        delta = angle - lastAngle
+        if delta > math.pi:
+            delta -= 2 * math.pi
+        elif delta < -math.pi:
+            delta += 2 * math.pi
+        total += delta
+        lastAngle = angle
+    return math.degrees(total)
 
-# FIXME: maybe these should be functions on "cordinates" rather than points
+#--------------------------------------------------------------
+# Functions on Points
 
 
 def pointDistanceSquared(X1, Y1, X2, Y2):
@@ -177,10 +536,7 @@ def pointInAngleCone(point, endpoint1, cusp, endpoint2):
 
 def pointInBox(point, boxTL, boxBR):
     "Input: point, and top-left/bottom-right points of bounding box. Returns False if point is outside box, True otherwise"
-    inside_vertical = point.Y <= boxTL.Y and point.Y >= boxBR.Y
-    inside_horiz = point.X >= boxTL.X and point.X <= boxBR.X
-    
-    return inside_horiz and inside_vertical
+    return pointInBoxXY(point.X, point.Y, boxTL.X, boxBR.Y, boxBR.X, boxTL.Y)
 
 
 #--------------------------------------------------------------
@@ -310,12 +666,17 @@ def strokeContainsStroke(stroke1, stroke2, granularity = None):
     if pointDistanceSquared(ep1.X, ep1.Y, ep2.X, ep2.Y) > 10:
         logger.warn("Checking containment within a stroke that's probably not closed")
 
+    #Anything inside stroke1 is inside its bounding box
+    if not (stroke1.BoundTopLeft.X <= stroke2.BoundTopLeft.X and stroke2.BoundBottomRight.X <= stroke1.BoundBottomRight.X \
+    and stroke1.BoundBottomRight.Y <= stroke2.BoundBottomRight.Y and stroke2.BoundTopLeft.Y <= stroke1.BoundTopLeft.Y):
+        return False
+
     sNorm1 = strokeNormalizeSpacing(Stroke(stroke1.Points + [ep2]), numpoints = granularity)
     #Test first point inside stroke 1
     if not pointInPolygon(sNorm1.Points, stroke2.Points[0]):
         return False
     #Test if stroke2 ever leaves stroke1's containment
-    elif len(getStrokesIntersection(stroke1, stroke2)) > 0:
+    elif strokesIntersect(stroke1, stroke2):
         return False
 
     return True
@@ -323,22 +684,38 @@ def strokeContainsStroke(stroke1, stroke2, granularity = None):
 
     
 
+def _strokeSegmentsXY(stroke):
+   "Returns the stroke's segments as a list of (x1, y1, x2, y2, minY, maxY)"
+   pts = stroke.Points
+   return [ (a.X, a.Y, b.X, b.Y, min(a.Y, b.Y), max(a.Y, b.Y)) for a, b in zip(pts[:-1], pts[1:]) ]
+
+def _strokesIntersectionXY(stroke1, stroke2, firstOnly = False):
+   "Returns the (x, y) intersections of two strokes, or just the first one found if firstOnly"
+   intersections = []
+   #Strokes whose bounding boxes don't overlap can't cross
+   if stroke1.BoundBottomRight.X < stroke2.BoundTopLeft.X or stroke2.BoundBottomRight.X < stroke1.BoundTopLeft.X \
+   or stroke1.BoundTopLeft.Y < stroke2.BoundBottomRight.Y or stroke2.BoundTopLeft.Y < stroke1.BoundBottomRight.Y:
+      return intersections
+   segs2 = _strokeSegmentsXY(stroke2)
+   for px1, py1, px2, py2, pMinY, pMaxY in _strokeSegmentsXY(stroke1):
+      pMinX, pMaxX = min(px1, px2), max(px1, px2)
+      for qx1, qy1, qx2, qy2, qMinY, qMaxY in segs2:
+         if pMaxY < qMinY or qMaxY < pMinY or pMaxX < min(qx1, qx2) or max(qx1, qx2) < pMinX:
+            continue
+         cross = segmentIntersectionXY(px1, py1, px2, py2, qx1, qy1, qx2, qy2)
+         if cross is not None:
+            intersections.append(cross)
+            if firstOnly:
+               return intersections
+   return intersections
+
 def getStrokesIntersection(stroke1, stroke2):
    "Returns the intersection(s) of two strokes"
-   intersections = []
+   return [Point(x, y) for x, y in _strokesIntersectionXY(stroke1, stroke2)]
 
-   prev1 = None
-   for p1 in stroke1.Points:
-      if prev1 is not None:
-         prev2 = None
-         for p2 in stroke2.Points:
-            if prev2 is not None:
-               cross = getLinesIntersection( (prev1, p1), (prev2, p2) )
-               if cross is not None:
-                  intersections.append(cross)
-            prev2 = p2
-      prev1 = p1
-   return intersections
+def strokesIntersect(stroke1, stroke2):
+   "Returns True if the two strokes cross anywhere. Faster than getStrokesIntersection, since it stops at the first crossing"
+   return len(_strokesIntersectionXY(stroke1, stroke2, firstOnly = True)) > 0
                 
 
 def translateStroke(inStroke, xDist, yDist):
@@ -388,81 +765,128 @@ def strokeGetPointsCurvature( inStroke ):
     return curvature_list
 
 
-def strokeNormalizeSpacing( inStroke, numpoints=50):
-    """Input: Stroke.  Return a stroke with points evenly distributed in distance across the original path described by inStroke. 
-    Single point strokes just return the point numpoints times"""
-    # TODO: right now, this does not retain any stroke properties other than the path of the points in X,Y (i.e. not time data)
-
-    # this is the final list of points to be returned
-    normalized_points = []
+def _normalizedSpacingXY(inStroke, numpoints):
+    "Returns the (x, y) of the points strokeNormalizeSpacing puts between the first and last point"
     inPoints = inStroke.Points
-
-    #Single point strokes case
-    if len(inPoints) == 1 or numpoints <= 1: 
-        return Stroke(numpoints * [inPoints[0]])
-        
-    # calculate the total euclidean distance traveled
-    total_dist = float(strokeLength(inStroke))
+    lengths = strokeArcLengths(inStroke)
+    # the total euclidean distance traveled
+    total_dist = float(lengths[-1])
     # set the new distance between points
     gap = total_dist/( numpoints - 1)
-    # turn the list of point into a list of line segements
-    segments = strokeSegments( inStroke )
-
-    # start at first point
-    i = 0; current_dist = 0; 
-    # the first point in the new list of points should be the same as the old
-    normalized_points.append( inPoints[0] ) 
 
+    retList = []
     # for each new segment (which should be end at length target_dist)
     stop_dist = total_dist * (1 - (1/(2*float(numpoints))) )
     # target_dist will be the running total distance done so far
     target_dist = gap
+    i = 1
     while target_dist < stop_dist :
+        # find the segment containing the target dist: the first point at least that far along.
+        # targets only increase, so start looking where the last one was found
+        i = bisect.bisect_left(lengths, target_dist, i)
+        p1 = inPoints[i - 1]
+        p2 = inPoints[i]
 
-        # walk until we hit the segment containing the target dist
-        while current_dist<target_dist:
-            (ax,ay),(bx,by) = segments[i]
-            current_dist += pointDistance(ax,ay,bx,by)
-            i += 1
-            # now we should know that segment i-1 contains the best stopping point
-            target_seg = segments[i-1]
-            (p1x,p1y),(p2x,p2y) = target_seg
-
-        # find the new best point in the middle of that segment
-        # figure out how much we overshot the target
-        overshot_dist = current_dist - target_dist;
-        seg_dist = pointDistance( p1x,p1y, p2x,p2y );
+        # figure out how much the end of that segment overshoots the target
+        overshot_dist = lengths[i] - target_dist
+        seg_dist = pointDistance( p1.X, p1.Y, p2.X, p2.Y )
 
-        # the new point should lie on that last segment
-        newx = ( (p1x*overshot_dist) + (p2x*(seg_dist-overshot_dist)) ) / float(seg_dist)
-        newy = ( (p1y*overshot_dist) + (p2y*(seg_dist-overshot_dist)) ) / float(seg_dist)
-
-	# add this new point to the list        
-        normalized_points.append( Point(newx,newy) )
+        # the new point should lie on that segment
+        newx = ( (p1.X*overshot_dist) + (p2.X*(seg_dist-overshot_dist)) ) / float(seg_dist)
+        newy = ( (p1.Y*overshot_dist) + (p2.Y*(seg_dist-overshot_dist)) ) / float(seg_dist)
+        retList.append( (newx, newy) )
 
         # move on to the next point
         target_dist += gap
+    return retList
+
+def strokeNormalizeSpacing( inStroke, numpoints=50):
+    """Input: Stroke.  Return a stroke with points evenly distributed in distance across the original path described by inStroke. 
+    Single point strokes just return the point numpoints times.  Uses the stroke's cached arc lengths (see strokeArcLengths),
+    so resampling a stroke again, to any number of points, doesn't walk all of its segments again"""
+    # TODO: right now, this does not retain any stroke properties other than the path of the points in X,Y (i.e. not time data)
+    inPoints = inStroke.Points
 
+    #Single point strokes case
+    if len(inPoints) == 1 or numpoints <= 1: 
+        return Stroke(numpoints * [inPoints[0]])
 
+    # the first point in the new list of points should be the same as the old
+    normalized_points = [inPoints[0]]
+    normalized_points.extend( [Point(x, y) for x, y in _normalizedSpacingXY(inStroke, numpoints)] )
     # make sure not to drop that last point
     normalized_points.append( inPoints[-1] ) # should be final point 
     return Stroke(normalized_points)
+
+def strokeResampleXY(inStroke, numpoints):
+    "Input: Stroke.  Returns the (x, y) of the points of strokeNormalizeSpacing(inStroke, numpoints), without making a Stroke or any Points"
+    inPoints = inStroke.Points
+    if len(inPoints) == 1 or numpoints <= 1: 
+        return numpoints * [(inPoints[0].X, inPoints[0].Y)]
+    return [(inPoints[0].X, inPoints[0].Y)] + _normalizedSpacingXY(inStroke, numpoints) + [(inPoints[-1].X, inPoints[-1].Y)]
     
 def strokeLength(inStroke):
     "Input: Stroke.  Returns the total length of the stroke by summing up all of the segments."
-    
-    totalLength = 0.0
-    inPoints = inStroke.Points
-    
-    for i in range(0, len(inPoints) - 1):
-        cur = inPoints[i]
-        nxt = inPoints[i + 1]
-        
-        totalLength += vectorLength(cur.X - nxt.X, cur.Y - nxt.Y)
-        
-    return totalLength
+    lengths = strokeArcLengths(inStroke)
+    if len(lengths) == 0:
+        return 0.0
+    return lengths[-1]
     #TODO: This func. looks like the perim function, except without closing it off, cause Perim just assumes it's been hulled...
 
+def arcLengths(inPoints, start = None):
+    """Input: List inPoints.  Returns the distance along the path to each point: [0.0, |p1-p0|, |p1-p0| + |p2-p1|, ...].
+    If start, a list of arc lengths for the first len(start) points, the rest are appended to a copy of it"""
+    if start is None:
+        start = []
+    retList = list(start)
+    if len(inPoints) == 0:
+        return retList
+    if len(retList) == 0:
+        retList.append(0.0)
+    total = retList[-1]
+    prev = inPoints[len(retList) - 1]
+    for nxt in inPoints[len(retList):]:
+        total += vectorLength(prev.X - nxt.X, prev.Y - nxt.Y)
+        retList.append(total)
+        prev = nxt
+    return retList
+
+def strokeArcLengths(inStroke):
+    """Input: Stroke.  Returns arcLengths(inStroke.Points), cached on the stroke and extended with any points appended since.
+    The list is shared with the cache, so don't change it"""
+    points = inStroke.Points
+    lengths, lastPoint = getattr(inStroke, '_arcLengths', (None, None))
+    if lengths is None or len(lengths) > len(points) or (len(lengths) > 0 and points[len(lengths) - 1] is not lastPoint):
+        lengths = []
+    elif len(lengths) == len(points):
+        return lengths
+    lengths = arcLengths(points, start = lengths)
+    if len(points) > 0:
+        inStroke._arcLengths = (lengths, points[-1])
+    return lengths
+
+def strokePointAtLength(inStroke, dist):
+    "Input: Stroke, distance along it.  Returns the Point that far along the stroke (clamped to its ends), found by bisecting its arc lengths"
+    inPoints = inStroke.Points
+    lengths = strokeArcLengths(inStroke)
+    if dist <= 0 or len(inPoints) == 1:
+        return Point(inPoints[0].X, inPoints[0].Y)
+    if dist >= lengths[-1]:
+        return Point(inPoints[-1].X, inPoints[-1].Y)
+    i = bisect.bisect_left(lengths, dist)
+    p1 = inPoints[i - 1]
+    p2 = inPoints[i]
+    frac = (dist - lengths[i - 1]) / (lengths[i] - lengths[i - 1])
+    return Point(p1.X + frac * (p2.X - p1.X), p1.Y + frac * (p2.Y - p1.Y))
+
+def strokePointAtFraction(inStroke, fraction):
+    "Input: Stroke, fraction from 0.0 to 1.0.  Returns the Point that fraction of the way along the stroke"
+    return strokePointAtLength(inStroke, fraction * strokeLength(inStroke))
+
+def strokeMidpoint(inStroke):
+    "Input: Stroke.  Returns the Point half way along the stroke"
+    return strokePointAtFraction(inStroke, 0.5)
+
 def strokeLinearity(inStroke):
     "Input: Stroke.  Returns the Linearity from [0,1] of a set of points as defined by the Ellipse Axis Ratio by the Monotonicity."
      # The General linearity of the points by the amount that they all point in the same direction
@@ -504,12 +928,28 @@ def strokeCircularity(inStroke):
     circularity = ((4 * math.pi) * pArea) / (perim ** 2)
     return circularity
 
+def strokeFitCircle(inStroke, method = "taubin"):
+    "Input: Stroke.  Returns (center Point, radius, residual) of the circle fitted to its points (see fitCircleXY), or None if it's straight"
+    fit = fitCircleXY([p.X for p in inStroke.Points], [p.Y for p in inStroke.Points], method)
+    if fit is None:
+        return None
+    cx, cy, radius, residual = fit
+    return (Point(cx, cy), radius, residual)
+
+def strokeFitEllipse(inStroke):
+    "Input: Stroke.  Returns (center Point, major, minor, angle, residual) of the ellipse fitted to its points (see fitEllipseXY), or None"
+    fit = fitEllipseXY([p.X for p in inStroke.Points], [p.Y for p in inStroke.Points])
+    if fit is None:
+        return None
+    cx, cy, major, minor, angle, residual = fit
+    return (Point(cx, cy), major, minor, angle, residual)
+
 def strokeConcavity(inStroke):
     "Input: Stroke.  Returns the concavity [0,1] of a set of points as defined by the fraction of points in the stroke on the convex hull."
     inPoints = inStroke.Points 
     if len(inPoints) < 3:
         return 0
-    chull = convexHull(inPoints) # find the hull
+    chull = strokeConvexHull(inStroke) # find the hull
     # the concavity should be the ratio of the size of the hull to the 
     # number of points in the original stroke
     return 1.0 - (len(chull) / float(len(inPoints)))
@@ -532,10 +972,10 @@ def strokeLineSegOrientations( inStroke, normalize=True ):
     norm_orientations = [ angleNormalize(x-offset) for x in orientations ]
     return norm_orientations
 
-def strokeSmooth(inStroke, width = 1, preserveEnds = False):
-    "Input: Stroke.  Returns a simmilar stroke with the points smoothed out"
+def strokeSmooth(inStroke, width = 1, preserveEnds = False, kernel = "box"):
+    "Input: Stroke.  Returns a simmilar stroke with the points smoothed out. See _smooth for the kernels"
     inPoints = inStroke.Points;
-    outPoints = _smooth(inPoints, width = width, preserveEnds = preserveEnds)
+    outPoints = _smooth(inPoints, width = width, preserveEnds = preserveEnds, kernel = kernel)
     return Stroke(outPoints)
 
 def strokeDTWDist( testStroke, refStroke):
@@ -610,37 +1050,142 @@ def strokeMonotonicity(inStroke):
 def strokeOrientation(inStroke):
     "Input: List inPoints.  Returns the Angle of Orientation of a set of points (in degrees) where 0 is horizontal"
 
-    cen = inStroke.Center
-    inPoints = inStroke.Points
-    pArea = area(inPoints)
-
-    if (len(inPoints) <= 1):
-        print "Warning: trying to get the Angle of Orientation of one or fewer points."
-        return 0.0
-
-    if pArea == 0:  #Perfect line        
-        orientX = inPoints[-1].X - inPoints[0].X
-        orientY = inPoints[-1].Y - inPoints[0].Y
-        orientMag = vectorLength(orientX, orientY)
-        if orientMag == 0:
-            return 0.0
-        orientX = orientX / orientMag
-        orientY = orientY / orientMag
-        return math.degrees( math.acos(orientX) )
-
-    moment11 = momentOfOrder(cen, inPoints, 1, 1)
-    if moment11 == 0:
-        return 0    #There is no Moment of order 1,1.  We'd get a divide by zero.  Orientation is undefined; just return zero.
-
-    angle = (.5 * math.atan((momentOfOrder(cen, inPoints, 0, 2) - momentOfOrder(cen, inPoints, 2, 0)) / (2 * moment11))) \
-            + sign(moment11) * math.pi / 4
-
-    return math.degrees(angle)
+    return math.degrees( _angleOfOrientation(inStroke) )
     
  
-def strokeFeaturePoints(inStroke):
-   """Returns a list of "interesting" feature points (corners, endpoints) of a stroke"""
-   pass
+# ShortStraw corner finding (Wolin, Eoff & Hammond, 2008)
+STRAW_WINDOW = 3          #Points on either side of a point that its straw spans
+STRAW_RESAMPLE = 40.0     #Resample at the bounding box diagonal / this
+STRAW_THRESHOLD = 0.95    #Corners have straws shorter than this fraction of the median
+STRAW_LINE_RATIO = 0.95   #Between two corners is a line if the straight distance is at least this fraction of the path
+
+def _resampleXYT(inStroke, numpoints):
+    "Returns lists (xs, ys, ts) of numpoints points evenly spaced along the stroke, times interpolated"
+    inPoints = inStroke.Points
+    lengths = strokeArcLengths(inStroke)
+    gap = lengths[-1] / float(numpoints - 1)
+    xs, ys, ts = [inPoints[0].X], [inPoints[0].Y], [inPoints[0].T]
+    i = 1
+    for k in xrange(1, numpoints - 1):
+        target = k * gap
+        i = bisect.bisect_left(lengths, target, i)
+        p1 = inPoints[i - 1]
+        p2 = inPoints[i]
+        frac = (target - lengths[i - 1]) / (lengths[i] - lengths[i - 1])
+        xs.append(p1.X + frac * (p2.X - p1.X))
+        ys.append(p1.Y + frac * (p2.Y - p1.Y))
+        ts.append(p1.T + frac * (p2.T - p1.T))
+    xs.append(inPoints[-1].X)
+    ys.append(inPoints[-1].Y)
+    ts.append(inPoints[-1].T)
+    return xs, ys, ts
+
+def _strawCorners(inStroke, useSpeed):
+    "Does the work for strokeCorners. Returns (feature Points, [(corner Point, straw ratio)])"
+    inPoints = inStroke.Points
+    if len(inPoints) == 0:
+        return ([], [])
+    first = Point(inPoints[0].X, inPoints[0].Y, inPoints[0].T)
+    if len(inPoints) < 2:
+        return ([first], [])
+    last = Point(inPoints[-1].X, inPoints[-1].Y, inPoints[-1].T)
+    diagonal = pointDist(inStroke.BoundTopLeft, inStroke.BoundBottomRight)
+    totalLength = strokeLength(inStroke)
+    win = STRAW_WINDOW
+    if diagonal == 0 or totalLength == 0:
+        return ([first, last], [])
+    numpoints = int(totalLength / (diagonal / STRAW_RESAMPLE)) + 1
+    if numpoints < 2 * win + 1:
+        return ([first, last], [])
+    xs, ys, ts = _resampleXYT(inStroke, numpoints)
+    #Decide on a lightly smoothed copy, so jitter in the input doesn't look like lots of little corners
+    smoothXs = _boxSmoothValues(xs, 1, True)
+    smoothYs = _boxSmoothValues(ys, 1, True)
+    pathLengths = [0.0]
+    for i in xrange(1, numpoints):
+        pathLengths.append( pathLengths[-1] + pointDistance(smoothXs[i - 1], smoothYs[i - 1], smoothXs[i], smoothYs[i]) )
+
+    #The straw at a point is the distance between the points win before and after it. It's short at corners
+    straws = [None] * win
+    straws.extend( [math.sqrt( (smoothXs[i + win] - smoothXs[i - win]) ** 2 + (smoothYs[i + win] - smoothYs[i - win]) ** 2 )
+                    for i in xrange(win, numpoints - win)] )
+    straws.extend( [None] * win )
+    if useSpeed:
+        #The pen slows down for corners: shorten the straws where it went slower than usual
+        durations = [ts[i + win] - ts[i - win] for i in xrange(win, numpoints - win)]
+        if min(durations) > 0:
+            speeds = [1.0 / d for d in durations]
+            medianSpeed = sorted(speeds)[len(speeds) / 2]
+            for i, speed in enumerate(speeds):
+                straws[i + win] *= min(1.0, speed / medianSpeed)
+    inner = straws[win:numpoints - win]
+    median = sorted(inner)[len(inner) / 2]
+    if median == 0:
+        return ([first, last], [])
+    threshold = median * STRAW_THRESHOLD
+
+    #Each run of short straws holds one corner, where the straw is shortest
+    corners = [0]
+    i = win
+    while i < numpoints - win:
+        if straws[i] < threshold:
+            best = i
+            while i < numpoints - win and straws[i] < threshold:
+                if straws[i] < straws[best]:
+                    best = i
+                i += 1
+            corners.append(best)
+        i += 1
+    corners.append(numpoints - 1)
+
+    def isLine(a, b):
+        return pointDistance(smoothXs[a], smoothYs[a], smoothXs[b], smoothYs[b]) >= STRAW_LINE_RATIO * (pathLengths[b] - pathLengths[a])
+
+    #Add the corners missed between two corners that aren't joined by a line
+    c = 1
+    while c < len(corners):
+        a, b = corners[c - 1], corners[c]
+        if not isLine(a, b):
+            quarter = (b - a) / 4
+            candidates = [j for j in xrange(a + quarter, b - quarter) if a < j < b and straws[j] is not None]
+            if len(candidates) > 0:
+                corners.insert(c, min(candidates, key = straws.__getitem__))
+                continue
+        c += 1
+    #Drop the corners that lie on a line between their neighbors
+    c = 1
+    while c < len(corners) - 1:
+        if isLine(corners[c - 1], corners[c + 1]):
+            del(corners[c])
+        else:
+            c += 1
+
+    cornerList = [ (Point(xs[j], ys[j], ts[j]), straws[j] / median) for j in corners[1:-1] ]
+    return ([first] + [p for p, ratio in cornerList] + [last], cornerList)
+
+def _cachedStrawCorners(inStroke, useSpeed):
+    "Returns _strawCorners(inStroke, useSpeed), cached on the stroke until its points change"
+    points = inStroke.Points
+    count, lastPoint, results = getattr(inStroke, '_features', (None, None, {}))
+    if count != len(points) or len(points) == 0 or points[-1] is not lastPoint:
+        results = {}
+        if len(points) > 0:
+            inStroke._features = (len(points), points[-1], results)
+    if useSpeed not in results:
+        results[useSpeed] = _strawCorners(inStroke, useSpeed)
+    return results[useSpeed]
+
+def strokeFeaturePoints(inStroke, useSpeed = False):
+    """Returns a list of "interesting" feature points (corners, endpoints) of a stroke, in order along it.
+    Corners are found with ShortStraw: the stroke is resampled, and corners are where the distance between
+    the points a few steps either side ("straw") is shortest.  If useSpeed, corners where the pen slowed
+    down (from Point.T) are favored.  The result is cached on the stroke"""
+    return list(_cachedStrawCorners(inStroke, useSpeed)[0])
+
+def strokeCorners(inStroke, useSpeed = False):
+    """Returns the corners of a stroke (strokeFeaturePoints without the endpoints) as a list of (Point, sharpness),
+    where sharpness is the straw over the median straw: the smaller, the sharper the corner"""
+    return list(_cachedStrawCorners(inStroke, useSpeed)[1])
 
 
 #--------------------------------------------------------------
@@ -701,6 +1246,83 @@ def momentOfOrder(center, inPoints, p, q):
     retval = sum(retval)
     return retval
 
+class ShapeMoments(object):
+    """Running sums over a list of points: n, sum of x, y, x*x, y*y, x*y, and the shoelace area sum.
+    Adding a point is O(1), and the moments about any center, the mean and the area are then O(1) reads.
+    Sums are kept relative to the first point, to keep the squares small"""
+    def __init__(self, points = ()):
+        self.n = 0
+        self._origin = None
+        self._sx = self._sy = self._sxx = self._syy = self._sxy = 0.0
+        self._areaSum = 0.0 # sum over the open path of (x2 - x1) * (y2 + y1)
+        self._first = self._last = None
+        for p in points:
+            self.addPoint(p.X, p.Y)
+
+    def addPoint(self, x, y):
+        if self._origin is None:
+            self._origin = self._first = (x, y)
+        else:
+            lx, ly = self._last
+            self._areaSum += (x - lx) * (y + ly)
+        self._last = (x, y)
+        dx = x - self._origin[0]
+        dy = y - self._origin[1]
+        self.n += 1
+        self._sx += dx
+        self._sy += dy
+        self._sxx += dx * dx
+        self._syy += dy * dy
+        self._sxy += dx * dy
+
+    def mean(self):
+        "Returns the average point as (x, y)"
+        if self.n == 0:
+            return None
+        return (self._origin[0] + self._sx / self.n, self._origin[1] + self._sy / self.n)
+
+    def area(self):
+        "Returns the area of the points as a closed polygon, the same as area(points)"
+        if self.n == 0:
+            return 0.0
+        (fx, fy), (lx, ly) = self._first, self._last
+        curArea = (self._areaSum + (fx - lx) * (fy + ly)) / 2
+        return abs(curArea)
+
+    def centralMoments(self, cx, cy):
+        "Returns the moments of order (2,0), (0,2) and (1,1) about (cx, cy), as momentOfOrder would"
+        if self.n == 0:
+            return (0.0, 0.0, 0.0)
+        cx -= self._origin[0]
+        cy -= self._origin[1]
+        n = self.n
+        m20 = self._sxx - 2 * cx * self._sx + n * cx * cx
+        m02 = self._syy - 2 * cy * self._sy + n * cy * cy
+        m11 = self._sxy - cx * self._sy - cy * self._sx + n * cx * cy
+        #Sums of squares can't be negative, but rounding can make them a hair under zero
+        return (max(m20, 0.0), max(m02, 0.0), m11)
+
+def strokeMoments(inStroke):
+    "Input: Stroke.  Returns its ShapeMoments, cached on the stroke and brought up to date with any points appended since"
+    points = inStroke.Points
+    moments, lastPoint = getattr(inStroke, '_moments', (None, None))
+    if moments is None or moments.n > len(points) or (moments.n > 0 and points[moments.n - 1] is not lastPoint):
+        moments = ShapeMoments()
+    for p in points[moments.n:]:
+        moments.addPoint(p.X, p.Y)
+    if len(points) > 0:
+        inStroke._moments = (moments, points[-1])
+    return moments
+
+def _momentsAngle(moments, cen):
+    "Returns the angle of orientation (radians) from the moments about cen. See strokeOrientation"
+    moment20, moment02, moment11 = moments.centralMoments(cen.X, cen.Y)
+    #Rounding in the sums can leave a tiny moment where there should be none
+    if abs(moment11) <= 1e-9 * (moment20 + moment02):
+        return 0    #There is no Moment of order 1,1.  We'd get a divide by zero.  Orientation is undefined; just return zero.
+
+    return (.5 * math.atan((moment02 - moment20) / (2 * moment11))) + sign(moment11) * math.pi / 4
+
 def averageDistance(center, inPoints):
     "Input: Point center, List inPoints.  Returns the average abs distance of a set of points from a specified point"
 
@@ -717,12 +1339,17 @@ def sliceByLength(inPoints, lengthBegin, lengthEnd):
     if len(inPoints) < 2:
         print "Warning: Trying to get a slice of a stroke with less than two points."
         return inPoints
-    
-    lengthDiff = lengthEnd - lengthBegin
-    
-    
-    
-        
+    return _sliceByArcLength(inPoints, arcLengths(inPoints), lengthBegin, lengthEnd)
+
+def strokeSliceByLength(inStroke, lengthBegin, lengthEnd):
+    "Input: Stroke; double lengthBegin, lengthEnd.  Returns sliceByLength(inStroke.Points, lengthBegin, lengthEnd), using the stroke's cached arc lengths"
+    inPoints = inStroke.Points
+    if len(inPoints) < 2:
+        return sliceByLength(inPoints, lengthBegin, lengthEnd)
+    return _sliceByArcLength(inPoints, strokeArcLengths(inStroke), lengthBegin, lengthEnd)
+
+def _sliceByArcLength(inPoints, lengths, lengthBegin, lengthEnd):
+    "Does the work of sliceByLength, given the arc lengths of inPoints"
     if lengthBegin < 0.0:
         lengthBegin = 0.0
     
@@ -739,24 +1366,16 @@ def sliceByLength(inPoints, lengthBegin, lengthEnd):
 #    if lengthBegin == 0:
 #        newPoints.append( inPoints[0] )
         
-    currentLength = 0.0
-    totalLength = 0.0
-    
-    for i in range(0, len(inPoints) - 1):
-        cur = inPoints[i]
-        nxt = inPoints[i + 1]
-        
-        totalLength += vectorLength(nxt.X - cur.X, nxt.Y - cur.Y)
-        
+    totalLength = lengths[-1]
     beginThreshold = totalLength * lengthBegin
     endThreshold = totalLength * lengthEnd
     
-    for i in range(0, len(inPoints) - 1):
+    #Segments that end before the begin threshold add nothing, so skip straight past them
+    for i in range(max(0, bisect.bisect_left(lengths, beginThreshold) - 1), len(inPoints) - 1):
         cur = inPoints[i]
         nxt = inPoints[i + 1]
-        
-        segmentLength = vectorLength(nxt.X - cur.X, nxt.Y - cur.Y)
-        curAndSegmentLength = currentLength + segmentLength
+        currentLength = lengths[i]
+        curAndSegmentLength = lengths[i + 1]
         
         if( (currentLength < beginThreshold) and (curAndSegmentLength >= beginThreshold) ):
             newPoints.append(cur)   #Adds the point just before the Threshold
@@ -766,58 +1385,152 @@ def sliceByLength(inPoints, lengthBegin, lengthEnd):
         if( (currentLength < endThreshold) and (curAndSegmentLength >= endThreshold) ):
             newPoints.append(nxt)   #Adds the point just outside the threshold
             break   #Passed end threshold, no need to keep going
-            
-        currentLength = curAndSegmentLength
         
     return newPoints
     
   
 
-def _smooth(inPoints, width = 1, preserveEnds = False):
-    "Input: List inPoints.  returns a smoothed set of the same size using Laplacian smoothing...IN 2D!."
+def _prefixSums(values, power = 0):
+    "Input: list of numbers. Returns [0, v0 * 0**power, ... ] summed, so sum(v[j] * j**power for lo <= j < hi) is ret[hi] - ret[lo]"
+    retList = [0.0]
+    total = 0.0
+    for j, v in enumerate(values):
+        total += v * (j ** power)
+        retList.append(total)
+    return retList
+
+def _boxSmoothValues(values, width, preserveEnds):
+    "Input: list of numbers. Returns the moving average of each over the 2*width+1 values around it, in O(n)"
+    count = len(values)
+    full = 2 * width + 1
+    #Sum relative to the first value, so the differences of the running sums don't lose precision
+    base = values[0]
+    sums = _prefixSums([v - base for v in values])
+    retList = []
+    for i in xrange(count):
+        lo = max(0, i - width)
+        hi = min(count, i + 1 + width)
+        total = sums[hi] - sums[lo]
+        num = hi - lo
+        if preserveEnds and num < full: #Pad the window with the point itself
+            total += (full - num) * (values[i] - base)
+            num = full
+        retList.append(base + total / float(num))
+    return retList
+
+def _powerSum(lo, hi, power):
+    "Returns sum(d**power for lo <= d < hi), for integers lo <= hi and power 0 to 4"
+    def upTo(k): #sum of d**power for 0 <= d < k, k >= 0
+        k -= 1
+        if power == 0:
+            return k + 1
+        elif power == 1:
+            return k * (k + 1) / 2
+        elif power == 2:
+            return k * (k + 1) * (2 * k + 1) / 6
+        elif power == 3:
+            return (k * (k + 1) / 2) ** 2
+        return k * (k + 1) * (2 * k + 1) * (3 * k * k + 3 * k - 1) / 30
+    sign = -1 if power % 2 else 1
+    if lo >= 0:
+        return upTo(hi) - upTo(lo)
+    elif hi <= 0:
+        return sign * (upTo(1 - lo) - upTo(1 - hi))
+    return sign * (upTo(1 - lo) - upTo(1)) + upTo(hi)
+
+def _savGolSmoothValues(values, width, preserveEnds):
+    """Input: list of numbers. Returns the value at each position of the least squares
+    quadratic through the 2*width+1 values around it (a Savitzky-Golay filter), in O(n)"""
+    count = len(values)
+    full = 2 * width + 1
+    base = values[0]
+    centered = [v - base for v in values]
+    sums0 = _prefixSums(centered)
+    sums1 = _prefixSums(centered, 1)
+    sums2 = _prefixSums(centered, 2)
+    retList = []
+    for i in xrange(count):
+        lo = max(0, i - width)
+        hi = min(count, i + 1 + width)
+        #Moments of the offsets d = j - i, and of the values against them
+        s0, s1, s2, s3, s4 = [_powerSum(lo - i, hi - i, p) for p in range(5)]
+        t0 = sums0[hi] - sums0[lo]
+        t1 = (sums1[hi] - sums1[lo]) - i * t0
+        t2 = (sums2[hi] - sums2[lo]) - 2 * i * (sums1[hi] - sums1[lo]) + i * i * t0
+        if preserveEnds and s0 < full: #Pad the window with the point itself, at d = 0
+            t0 += (full - s0) * centered[i]
+            s0 = full
+        #Solve the normal equations for the constant term, by Cramer's rule
+        det = s0 * (s2 * s4 - s3 * s3) - s1 * (s1 * s4 - s2 * s3) + s2 * (s1 * s3 - s2 * s2)
+        if det == 0: #Too few points for a quadratic
+            retList.append(base + t0 / float(s0))
+            continue
+        num = t0 * (s2 * s4 - s3 * s3) - s1 * (t1 * s4 - s3 * t2) + s2 * (t1 * s3 - s2 * t2)
+        retList.append(base + num / float(det))
+    return retList
+
+def _smoothValues(values, width, preserveEnds, kernel):
+    "Input: list of numbers. Returns them smoothed with the named kernel"
+    if kernel == "box":
+        return _boxSmoothValues(values, width, preserveEnds)
+    elif kernel == "gaussian": #Three box passes come within a few percent of a Gaussian
+        for _ in range(3):
+            values = _boxSmoothValues(values, width, preserveEnds)
+        return values
+    elif kernel == "savgol":
+        return _savGolSmoothValues(values, width, preserveEnds)
+    raise ValueError("Unknown smoothing kernel %s" % (kernel))
+
+def _smooth(inPoints, width = 1, preserveEnds = False, kernel = "box"):
+    """Input: List inPoints.  returns a smoothed set of the same size using Laplacian smoothing...IN 2D!.
+    kernel is "box" (the mean of the 2*width+1 points around each point), "gaussian" (three box passes,
+    a Gaussian with sigma about sqrt(width*(width+1))) or "savgol" (the local least squares quadratic).
+    If preserveEnds, windows cut short by the ends of the list are padded with the point itself.
+    Every kernel takes O(n) time, whatever the width."""
 
     if len(inPoints) < 3:
         logger.debug("trying to smooth less than three points")
         return inPoints
-    newPoints = []
+    width = max(0, width)
 
     #Double the amount of points, and then smooth that.
-    for i in range(0, len(inPoints) - 1):
-        cur = inPoints[i]
-        nxt = inPoints[i + 1]
-        newPoints.append(cur)
-
-        avgpt = Point((cur.X + nxt.X) / 2.0, (cur.Y + nxt.Y) / 2.0, (cur.T + nxt.T) / 2.0)
-        newPoints.append(avgpt)
-
-    newPoints.append(inPoints[len(inPoints) - 1]) #add the last point into the list, but do NOT add in a point between the first & last.
+    #Do NOT add in a point between the first & last.
     #TODO: Maybe instead of disregarding it, check to see if stroke is a closedAnno, and if so, smooth between beginning and end?
+    xs, ys, ts = [], [], []
+    prev = None
+    for cur in inPoints:
+        if prev is not None:
+            xs.append((prev.X + cur.X) / 2.0)
+            ys.append((prev.Y + cur.Y) / 2.0)
+            ts.append((prev.T + cur.T) / 2.0)
+        xs.append(cur.X)
+        ys.append(cur.Y)
+        ts.append(cur.T)
+        prev = cur
 
     #Decision time: Smooth and modify both new and old points, or old points only?  Currently does both
-    finalPoints = []
-    #finalPoints.append(newPoints[0]) # First Point remains unchanged... See above TODO to possibly contradict this statement
-
-    #new and old point smoothing
-    for i in range(len(newPoints)):
-        pointRange = range( max(0, i - width), min (len(newPoints), i + 1 + width) )  #Average over a range
-        pointListX = [newPoints[j].X for j in pointRange]
-        pointListY = [newPoints[j].Y for j in pointRange]
-        pointListT = [newPoints[j].T for j in pointRange]
-        if preserveEnds:
-            while len(pointListX) < (2 * width + 1):
-                pointListX.append(newPoints[i].X)
-                pointListY.append(newPoints[i].Y)
-                pointListT.append(newPoints[i].T)
-
-        x = sum(pointListX) / float(len(pointListX))
-        y = sum(pointListY) / float(len(pointListY))
-        t = sum(pointListT) / float(len(pointListT))
-        finalPoints.append( Point(x,y,t) )
-
-    #finalPoints.append(newPoints[len(newPoints) - 1]) #As with first point remaining unchanged...
-    return finalPoints
+    xs = _smoothValues(xs, width, preserveEnds, kernel)
+    ys = _smoothValues(ys, width, preserveEnds, kernel)
+    ts = _smoothValues(ts, width, preserveEnds, kernel)
+    return [Point(x, y, t) for x, y, t in zip(xs, ys, ts)]
 
 
+def simplifyPoints(inPoints, radius = None, epsilon = None):
+    """Input: List inPoints.  Returns the points left (the same Point objects, in order) after dropping those closer than radius
+    to the last one kept, and then those Douglas-Peucker with tolerance epsilon can do without.  None skips that step"""
+    if len(inPoints) < 3:
+        return list(inPoints)
+    xs = [p.X for p in inPoints]
+    ys = [p.Y for p in inPoints]
+    indices = None
+    if radius is not None:
+        indices = radialSimplifyXY(xs, ys, radius)
+    if epsilon is not None:
+        indices = douglasPeuckerXY(xs, ys, epsilon, indices = indices)
+    if indices is None:
+        return list(inPoints)
+    return [inPoints[i] for i in indices]
+
 def perimeter(inPoints):
     "Input: List inPoints.  returns the perimeter of the input set of points."
 
@@ -853,11 +1566,9 @@ def ellipseAxisRatio(inStroke):
     alpha = 0.0
     beta = 0.0
 
-    cen = centroid(inStroke.Points)
+    cen = centroid(strokeConvexHull(inStroke)) #The centroid only depends on the hull
 
-    moment11 = momentOfOrder(cen, inPoints, 1, 1)
-    moment20 = momentOfOrder(cen, inPoints, 2, 0)
-    moment02 = momentOfOrder(cen, inPoints, 0, 2)
+    moment20, moment02, moment11 = strokeMoments(inStroke).centralMoments(cen.X, cen.Y)
     moment00 = len(inPoints) #MomentOfOrder(  cen, inPoints, 0, 0 )
 
     #How does EllipseAxisRatio compare with Eccentricity and compactness as given by Csetverikov?
@@ -918,36 +1629,7 @@ def lineLength(inStroke):
 
 def linePointsTowards(linept1, linept2, target, radius):
     "Tests whether a line points toward a target or not"
-    retValue = False
-    slope = lineSlope(linept1, linept2)
-    dir_mult = 1
-    if (slope != None and linept2.X - linept1.X < 0) or (slope == None and linept2.Y - linept1.Y < 0):
-        dir_mult = -1
-
-    pt1 = target
-    if slope == 0:
-        pt2 = Point(target.X, target.Y + 10 )
-    else:
-        if slope == None:
-            perp_slope = 0.0
-        else:
-            perp_slope = -1 / float(slope)
-        pt2 = Point(target.X + 10, target.Y + (10 * perp_slope))
-    line1 = (linept1, linept2)
-    line2 = (target, pt2)
-    tangentPoint = getLinesIntersection(line1, line2, infinite1 = True, infinite2 = True)
-
-
-    if tangentPoint != None:
-        line1dist = pointDistanceSquared(linept1.X, linept1.Y, tangentPoint.X, tangentPoint.Y)
-        line2dist = pointDistanceSquared(linept2.X, linept2.Y, tangentPoint.X, tangentPoint.Y)
-        distSqr =  pointDistanceSquared(target.X, target.Y, tangentPoint.X, tangentPoint.Y)
-        if distSqr < radius ** 2 and line2dist < line1dist: #Points close enough and the right direction
-            retValue = True
-
-    return retValue
-        
-
+    return linePointsTowardsXY(linept1.X, linept1.Y, linept2.X, linept2.Y, target.X, target.Y, radius)
 
     
 #With respect to the horizontal.  0 deg == horizontal line
@@ -958,16 +1640,14 @@ def angleOfOrientation(inStroke):
 #With respect to the horizontal.  0 deg == horizontal line
 def _angleOfOrientation(inStroke):
     "Input: List inPoints.  Returns in radians the Angle of Orientation of a set of points to be interpreted as a line with respect to the horizontal axis"
-    cen = inStroke.Center
     inPoints = inStroke.Points
-    pArea = area(inPoints)
-
     if (len(inPoints) <= 1):
         print "Warning: trying to get the Angle of Orientation of one or fewer points."
         return 0.0
 
+    moments = strokeMoments(inStroke)
     #Perfect line        
-    if pArea == 0:
+    if moments.area() == 0:
         #Corner case of a single point. Weird behavior?
         orientX = inPoints[len(inPoints) - 1].X - inPoints[0].X
         orientY = inPoints[len(inPoints) - 1].Y - inPoints[0].Y
@@ -982,64 +1662,64 @@ def _angleOfOrientation(inStroke):
 
         return math.acos(orientX)
 
+    return _momentsAngle(moments, inStroke.Center)
 
-    moment11 = momentOfOrder(cen, inPoints, 1, 1)
-
-    if moment11 == 0:
-        return 0    #There is no Moment of order 1,1.  We'd get a divide by zero.  Orientation is undefined; just return zero.
-
-    angle = (.5 * math.atan((momentOfOrder(cen, inPoints, 0, 2) - momentOfOrder(cen, inPoints, 2, 0)) / (2 * moment11))) + sign(moment11) * math.pi / 4
-
-    return angle
 
+def _monotoneChain(keyed):
+    "Input: list of ((x, y), Point), sorted and without repeated coordinates. Returns the hull Points (see convexHull)"
+    if len(keyed) < 3:
+        return [p for xy, p in keyed]
 
-def _TurnType(A, B, C):
-    "Input: Points A, B, C.  Returns the type of turn from A -> B."
-    z = (B.X - A.X) * (C.Y - A.Y) - (C.X - A.X) * (B.Y - A.Y)
+    def halfHull(ordered):
+        chain = []
+        for (x, y), p in ordered:
+            #Only drop strict right turns, so points along the hull's edges are kept
+            while len(chain) >= 2 and orientation(chain[-2][0][0], chain[-2][0][1], chain[-1][0][0], chain[-1][0][1], x, y) < 0:
+                chain.pop()
+            chain.append( ((x, y), p) )
+        return chain
 
-    if z > 0:
-        return "Left"
-    elif z < 0:
-        return "Right"
-    else:
-        return "Collinear"
+    lower = halfHull(keyed)
+    upper = halfHull(reversed(keyed))
+    if len(lower) == len(keyed) and len(upper) == len(keyed): #All on one line
+        return [p for xy, p in keyed]
+    return [p for xy, p in lower[:-1] + upper[:-1]]
 
+def _keyPoints(inPoints):
+    "Returns the points as a sorted list of ((x, y), Point), keeping the first Point at each coordinate"
+    keyed = {}
+    for p in inPoints:
+        keyed.setdefault( (p.X, p.Y), p)
+    return sorted(keyed.items())
 
 def convexHull(inPoints):
-    "Input:  Set of Points as a polygon/line.  Returns a set of ordered points defined as the Convex Hull using Grahms Scan"
-    pts = list(set(inPoints)) # Remove duplicates
-    if len(pts) < 3:
+    """Input:  Set of Points as a polygon/line.  Returns the list of Points on the Convex Hull, counterclockwise from the leftmost (then lowest) point,
+    using Andrew's monotone chain.  Points lying along the hull's edges are included"""
+    keyed = _keyPoints(inPoints)
+    if len(keyed) < 3:
         print("Warning: Trying to get the hull of less than 3 points")
         return inPoints
-
-    A = pts[0]
-
-    #Find upperleftmost point, with leftness taking priority
-    for pt in inPoints:
-        if pt.X < A.X or (pt.X == A.X and pt.Y < A.Y):
-            A = pt
-
-
-    comparer = _PointComparer(A)
-    pts.sort(comparer.Compare)
-    newPoints = []
-    newPoints.append(A)   #The upperleft most point
-    currentPt = pts[1]  #The 2nd point
-    j = 2
-
-    while j < len(pts):
-        turnType = _TurnType(newPoints[len(newPoints) - 1], currentPt, pts[j])
-        if turnType == "Right":
-            currentPt = newPoints.pop()
-        else:
-            newPoints.append(currentPt)
-            currentPt = pts[j]
-            j = j + 1
-
-    if (_TurnType(newPoints[len(newPoints) - 1], currentPt, A) != "Right"):
-        newPoints.append(currentPt)
-
-    return newPoints
+    return _monotoneChain(keyed)
+
+def strokeConvexHull(inStroke):
+    """Input: Stroke.  Returns convexHull(inStroke.Points), cached on the stroke.  If points have been appended
+    since (e.g. the stroke is still being drawn), the cached hull is extended with just the new points"""
+    points = inStroke.Points
+    cached = getattr(inStroke, '_hull', None)
+    if cached is not None:
+        hull, count, lastPoint = cached
+        if count == len(points) and (count == 0 or points[-1] is lastPoint):
+            return list(hull)
+        if count < len(points) and (count == 0 or points[count - 1] is lastPoint) and len(hull) >= 3:
+            #The hull of the old points and the new ones is the hull of the old hull and the new ones
+            hull = _monotoneChain( _keyPoints(hull + points[count:]) )
+            inStroke._hull = (hull, len(points), points[-1])
+            return list(hull)
+
+    hull = convexHull(points)
+    if len(points) > 0:
+        inStroke._hull = (list(hull), len(points), points[-1])
+    return list(hull)
 
 def centroid(inPoints):
     "Input: List inPoints.  Returns a Point of the center of Mass (assuming uniform density) of the convex hull of a polygon/line."
@@ -1092,76 +1772,93 @@ def area(inPoints):
 
 def pointInPolygon( inPoints, point ):
     "Input: List inPoints, Point point.  Returns true if the point is inside the Polygon.  Assumptions: List of points describes a CLOSED polygon.  Open polygons will be treated as if first & last point interconnect.  TODO:  Improve support for strokes with tails."
-    
-    numIntersections = 0
-    rayEndPt = Point( sys.maxint, point.Y ) #A ray extending as far as possible to the right , max X coord.
-    
-    currentPoint = None
-    nextPoint = None
-    
-    for i in range(0, len(inPoints)):
-        
-        currentPoint = inPoints[i]
-        nextPoint = inPoints[(i + 1) % len(inPoints)]
-        
-        if( linesIntersect( point, rayEndPt, currentPoint, nextPoint) ):
-            numIntersections +=1
-            
-    return ((numIntersections%2)!=0)    #If the ray passes through an ODD number of points, then it's inside the polygon.
-
-
-                
-
-            
-
+    return PreparedPolygon(inPoints).contains(point)
+
+def pointsInPolygon( inPoints, points ):
+    "Input: List inPoints (or a PreparedPolygon), list of Points points.  Returns a list of whether each point is inside the polygon"
+    if not isinstance(inPoints, PreparedPolygon):
+        inPoints = PreparedPolygon(inPoints)
+    return inPoints.containsPoints(points)
+
+def pointInPolygons( polygons, point ):
+    "Input: list of polygons (point lists or PreparedPolygons), Point point.  Returns a list of whether the point is inside each polygon"
+    retList = []
+    for poly in polygons:
+        if not isinstance(poly, PreparedPolygon):
+            poly = PreparedPolygon(poly)
+        retList.append(poly.contains(point))
+    return retList
+
+class PreparedPolygon(object):
+    """A polygon set up for many containment tests.  Its edges are stored as plain coordinates,
+    bucketed into horizontal bands so a point only tests the edges level with it, and points
+    outside its bounding box are rejected straight away.  Uses the even-odd rule, like pointInPolygon"""
+    def __init__(self, inPoints):
+        "Input: List inPoints describing a closed polygon (the last point connects back to the first)"
+        xs = [float(p.X) for p in inPoints]
+        ys = [float(p.Y) for p in inPoints]
+        self.numPoints = len(xs)
+        self._bands = []
+        if self.numPoints == 0:
+            self.minX = self.minY = self.maxX = self.maxY = 0.0
+            self._bandHeight = 1.0
+            return
+        self.minX, self.maxX = min(xs), max(xs)
+        self.minY, self.maxY = min(ys), max(ys)
+
+        numBands = max(1, int(math.sqrt(self.numPoints)))
+        self._bandHeight = (self.maxY - self.minY) / numBands or 1.0
+        self._bands = [[] for i in range(numBands)]
+        for i in range(self.numPoints):
+            x1, y1 = xs[i - 1], ys[i - 1]
+            x2, y2 = xs[i], ys[i]
+            if y1 == y2: #Horizontal edges never cross a horizontal ray
+                continue
+            edge = (x1, y1, x2, y2, (x2 - x1) / (y2 - y1))
+            for band in range(self._band(min(y1, y2)), self._band(max(y1, y2)) + 1):
+                self._bands[band].append(edge)
+
+    def _band(self, y):
+        return min(len(self._bands) - 1, max(0, int((y - self.minY) / self._bandHeight)))
+
+    def boundingBox(self):
+        "Returns the bounding box as a tuple of Points, (topleft,bottomright)"
+        return (Point(self.minX, self.maxY), Point(self.maxX, self.minY))
+
+    def containsXY(self, x, y):
+        "Returns true if the point (x, y) is inside the polygon"
+        if self.numPoints == 0:
+            return False
+        if x < self.minX or x > self.maxX or y < self.minY or y > self.maxY:
+            return False
+        inside = False
+        for x1, y1, x2, y2, invSlope in self._bands[self._band(y)]:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * invSlope:
+                inside = not inside
+        return inside
+
+    def contains(self, point):
+        "Returns true if point is inside the polygon"
+        return self.containsXY(point.X, point.Y)
+
+    def containsPoints(self, points):
+        "Returns a list of whether each of points is inside the polygon"
+        containsXY = self.containsXY
+        return [containsXY(p.X, p.Y) for p in points]
+
+    def boundingBoxContains(self, boxTL, boxBR):
+        "Returns true if the box (topleft, bottomright) is within the polygon's bounding box.  Only the bounding boxes are compared, not the polygon itself"
+        return self.minX <= boxTL.X and boxBR.X <= self.maxX and self.minY <= boxBR.Y and boxTL.Y <= self.maxY
 
 
 def getLinesIntersection(line1, line2, infinite1 = False, infinite2 = False):
     "Input: two lines specified as 2-tuples of points. Returns the intersection point of two lines or None."
     p1, p2 = line1
     q1, q2 = line2
-    
-    if p1.X > p2.X:
-        p1, p2 = p2, p1
-    if q1.X > q2.X:
-        q1, q2 = q2, q1   
-    
-    #is p __ than q
-    isHigher = p1.Y > q1.Y and p2.Y > q2.Y and p1.Y > q2.Y and p2.Y > q1.Y
-    isLower = p1.Y < q1.Y and p2.Y < q2.Y and p1.Y < q2.Y and p2.Y < q1.Y
-    isLeft= p2.X < q1.X
-    isRight= p1.X > q2.X
-    
-    if (isHigher or isLower or isLeft or isRight) and not infinite1 and not infinite2:
+    cross = segmentIntersectionXY(p1.X, p1.Y, p2.X, p2.Y, q1.X, q1.Y, q2.X, q2.Y, infinite1 = infinite1, infinite2 = infinite2)
+    if cross is None:
         return None
-    else:
-        pA = p2.Y - p1.Y
-        pB = p1.X - p2.X
-        pC = pA*p1.X + pB*p1.Y
-       
-        qA = q2.Y - q1.Y
-        qB = q1.X - q2.X
-        qC = qA*q1.X + qB*q1.Y
-        
-        det = pA*qB - qA*pB
-        if det == 0.0:
-            return None #Parallel
-        ret_x = (qB*pC - pB*qC) / float(det)
-        ret_y = (pA*qC - qA*pC) / float(det)
-        
-        xpoint = Point(ret_x, ret_y)
-        
-        
-        if not infinite1:
-            line1_bb = strokelistBoundingBox([Stroke(points = list(line1))]) #Create a bounding box for this line
-            if not pointInBox(xpoint, line1_bb[0], line1_bb[1]):
-                return None
-        if not infinite2:
-            line2_bb = strokelistBoundingBox([Stroke(points = list(line2))])
-            if not pointInBox(xpoint, line2_bb[0], line2_bb[1]):
-                return None
-        
-        return xpoint
+    return Point(cross[0], cross[1])
     
 def linesIntersect(p1, p2, q1, q2):
     "Returns true if lines intersect, else false. getLinesIntersection returns the actual point"
@@ -1198,9 +1895,7 @@ def linesIntersect(p1, p2, q1, q2):
         
     return retval
     """
-    if getLinesIntersection((p1, p2) , (q1, q2)) is not None:
-        return True
-    return False
+    return segmentIntersectionXY(p1.X, p1.Y, p2.X, p2.Y, q1.X, q1.Y, q2.X, q2.Y) is not None
     
 
 def lineSlope(p1, p2):
@@ -1212,31 +1907,6 @@ def lineSlope(p1, p2):
         return None
     return (p2.Y - p1.Y) / run
     
-class _PointComparer:
-    "Comparer used to compare and sort points based on their TurnType"
-    def __init__(self, pointA):
-        self.A = pointA
-
-    def Compare(self, P, Q):
-        if P == Q:
-            return 0
-
-        if P == self.A:
-            return - 1
-        elif Q == self.A:
-            return 1
-
-        turnType = _TurnType(self.A, P, Q)
-
-        if turnType == "Right":
-            return 1
-        elif turnType == "Left":
-            return - 1
-        else:
-            V1 = vectorLengthSquared(P.X - self.A.X, P.Y - self.A.Y)
-            V2 = vectorLengthSquared(Q.X - self.A.X, Q.Y - self.A.Y)
-            return cmp(V1, V2)
-
 #-------------------------------------
 # if executed by itself, run all the doc tests
 
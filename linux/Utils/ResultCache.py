@@ -0,0 +1,166 @@
+"""
+filename: ResultCache.py
+
+description:
+   Remembers what a recognizer decided about a stroke's geometry, so that geometry isn't
+   classified again.  The same strokes are recognized over and over: NetSketchGUI resets the
+   board and adds every stroke back for each request, and some markers re-run onStrokeAdded
+   on the strokes left over when one is removed.
+
+   Results are keyed by strokeFingerprint, a digest of the stroke's points rounded to
+   multiples of a quantum, so a stroke read back with its coordinates a hair off (e.g. from
+   XML) still matches.  Each cache evicts the least recently used results once the memory
+   they take (estimated) goes over its cap.  Caches are meant to be kept at module level, one
+   per recognizer, so they outlive the board and the observers; clearAll empties them all.
+
+   Results are handed out as they were stored, to every stroke with the same fingerprint,
+   so they should be plain values (numbers, strings, tuples of them) rather than Points
+   or anything else a caller might change.
+
+Doctest Examples:
+
+>>> cache = ResultCache("Example", maxBytes = 4096)
+>>> def countPoints(stroke):
+...     return len(stroke.Points)
+>>> cache.getOrCompute(Stroke([Point(0, 0), Point(10, 10)]), countPoints)
+2
+
+A stroke with the same points, to within the quantum, gets the same result without computing it
+>>> cache.getOrCompute(Stroke([Point(0.01, 0), Point(10, 10)]), None)
+2
+>>> cache.hits, cache.misses
+(1, 1)
+
+Extra arguments are passed to compute, and are part of the key
+>>> cache.getOrCompute(Stroke([Point(0, 0), Point(10, 10)]), (lambda stroke, scale: scale * len(stroke.Points)), 3)
+6
+
+Old results are evicted once the cache is full
+>>> for i in range(100):
+...     result = cache.getOrCompute(Stroke([Point(i, 0), Point(i, 10)]), countPoints)
+>>> len(cache) < 100, cache.sizeBytes() <= 4096, cache.evictions > 0
+(True, True, True)
+>>> cache.hits, cache.misses
+(1, 102)
+"""
+
+import hashlib
+import math
+import struct
+import sys
+from collections import OrderedDict
+
+from SketchFramework.Point import Point
+from SketchFramework.Stroke import Stroke
+from Utils import Logger
+
+logger = Logger.getLogger('ResultCache', Logger.WARN )
+
+DEFAULT_QUANTUM = 0.1 #Board units that points are rounded to for strokeFingerprint
+ENTRY_OVERHEAD = 200  #Rough bytes of bookkeeping for each entry, on top of its key and value
+
+#-------------------------------------
+
+def strokeFingerprint(stroke, quantum = DEFAULT_QUANTUM):
+    "Input: Stroke. Returns a digest of its points rounded to multiples of quantum, cached on the stroke until its points change"
+    points = stroke.Points
+    count, lastPoint, lastQuantum, digest = getattr(stroke, '_fingerprint', (None, None, None, None))
+    if count == len(points) and lastQuantum == quantum and (count == 0 or points[-1] is lastPoint):
+        return digest
+    scale = 1.0 / quantum
+    coords = []
+    for p in points:
+        coords.append(int(math.floor(p.X * scale + 0.5)))
+        coords.append(int(math.floor(p.Y * scale + 0.5)))
+    digest = hashlib.sha1(struct.pack('<%dq' % (len(coords)), *coords)).digest()
+    lastPoint = None
+    if len(points) > 0:
+        lastPoint = points[-1]
+    stroke._fingerprint = (len(points), lastPoint, quantum, digest)
+    return digest
+
+def _sizeOf(value):
+    "Returns an estimate of the bytes taken by value, and whatever tuples, lists and dicts in it hold"
+    size = sys.getsizeof(value)
+    if type(value) in (tuple, list):
+        size += sum([_sizeOf(v) for v in value])
+    elif type(value) is dict:
+        size += sum([_sizeOf(k) + _sizeOf(v) for k, v in value.items()])
+    return size
+
+#-------------------------------------
+
+_caches = [] #Every ResultCache made, for clearAll and allCaches
+
+def allCaches():
+    "Returns a list of every ResultCache made"
+    return list(_caches)
+
+def clearAll():
+    "Empties every ResultCache, and resets their counts"
+    for cache in _caches:
+        cache.clear()
+
+class ResultCache(object):
+    "A recognizer's results, keyed by strokeFingerprint, evicting the least recently used over maxBytes"
+    def __init__(self, name, maxBytes = 1 << 20, quantum = DEFAULT_QUANTUM):
+        self.name = name
+        self.maxBytes = maxBytes
+        self.quantum = quantum
+        self._entries = OrderedDict() #key : (result, size), least recently used first
+        self._bytes = 0
+        self.clear()
+        _caches.append(self)
+
+    def clear(self):
+        "Forget all the results, and the counts"
+        self._entries.clear()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sizeBytes(self):
+        "Returns the estimated memory taken by the results held"
+        return self._bytes
+
+    def getOrCompute(self, stroke, compute, *args):
+        "Returns the result for stroke's geometry and args, calling compute(stroke, *args) if there isn't one yet"
+        key = (strokeFingerprint(stroke, self.quantum),) + args
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.hits += 1
+            self._entries[key] = entry #Now the most recently used
+            return entry[0]
+        self.misses += 1
+        result = compute(stroke, *args)
+        self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        size = _sizeOf(key) + _sizeOf(result) + ENTRY_OVERHEAD
+        if size > self.maxBytes:
+            return
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while self._bytes > self.maxBytes:
+            oldKey, (oldResult, oldSize) = self._entries.popitem(last = False)
+            self._bytes -= oldSize
+            self.evictions += 1
+        logger.debug("%s: stored a result, %s held in %s bytes" % (self.name, len(self._entries), self._bytes))
+
+    def report(self):
+        "Returns a one line summary of the hits and misses so far"
+        return "%s: %s hits, %s misses, %s evicted, %s held in %s bytes" % \
+            (self.name, self.hits, self.misses, self.evictions, len(self._entries), self._bytes)
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    Logger.setDoctest(logger)
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,156 @@
+"""
+filename: SpatialGrid.py
+
+description:
+   A uniform grid (spatial hash) for finding the things on the board near a point
+   without looking at all of them.  Each item is stored with a bounding box (a point
+   is a box with no size), in every grid cell the box touches.  Queries return the
+   items whose boxes overlap the query region, in the order they were inserted, so
+   results are as repeatable as a scan over a list would be.
+
+Doctest Examples:
+
+>>> grid = SpatialGrid(cellSize = 10)
+>>> grid.insert('a', 5, 5)
+>>> grid.insert('b', 100, 100)
+>>> grid.insert('box', 20, 20, 60, 30)
+>>> grid.queryRadius(0, 0, 8)
+['a']
+>>> grid.queryRadius(40, 35, 6)
+['box']
+>>> grid.query(0, 0, 200, 200)
+['a', 'b', 'box']
+>>> grid.remove('a')
+>>> grid.queryRadius(0, 0, 8), len(grid)
+([], 2)
+>>> 'b' in grid
+True
+>>> grid.nearest(90, 90)
+('b', 200)
+>>> grid.nearest(90, 90, maxRadius = 5)
+(None, None)
+>>> grid.clear()
+>>> grid.query(0, 0, 200, 200), len(grid)
+([], 0)
+"""
+
+import math
+
+#-------------------------------------
+
+class SpatialGrid(object):
+    "Stores items by bounding box in a grid of square cells, for fast region queries"
+    def __init__(self, cellSize = 64):
+        self.cellSize = float(cellSize)
+        self._cells = {} # (column, row) : {item : True}
+        self._boxes = {} # item : (x1, y1, x2, y2, insertion number)
+        self._count = 0
+        self._extent = None # bounding box of everything ever inserted
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def clear(self):
+        "Removes every item"
+        self._cells = {}
+        self._boxes = {}
+        self._count = 0
+        self._extent = None
+
+    def __contains__(self, item):
+        return item in self._boxes
+
+    def _cellRange(self, x1, y1, x2, y2):
+        size = self.cellSize
+        for col in xrange(int(math.floor(x1 / size)), int(math.floor(x2 / size)) + 1):
+            for row in xrange(int(math.floor(y1 / size)), int(math.floor(y2 / size)) + 1):
+                yield (col, row)
+
+    def insert(self, item, x1, y1, x2 = None, y2 = None):
+        "Store item at the point (x1, y1), or over the box from (x1, y1) to (x2, y2). Items must be hashable"
+        if x2 is None or y2 is None:
+            x2, y2 = x1, y1
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        if item in self._boxes:
+            self.remove(item)
+        self._boxes[item] = (x1, y1, x2, y2, self._count)
+        self._count += 1
+        if self._extent is None:
+            self._extent = (x1, y1, x2, y2)
+        else:
+            ex1, ey1, ex2, ey2 = self._extent
+            self._extent = (min(x1, ex1), min(y1, ey1), max(x2, ex2), max(y2, ey2))
+        for cell in self._cellRange(x1, y1, x2, y2):
+            self._cells.setdefault(cell, {})[item] = True
+
+    def remove(self, item):
+        "Forget item. Does nothing if it isn't stored"
+        box = self._boxes.pop(item, None)
+        if box is None:
+            return
+        for cell in self._cellRange(box[0], box[1], box[2], box[3]):
+            contents = self._cells.get(cell)
+            if contents is not None:
+                contents.pop(item, None)
+                if len(contents) == 0:
+                    del(self._cells[cell])
+
+    def box(self, item):
+        "Returns the (x1, y1, x2, y2) item was stored with"
+        return self._boxes[item][:4]
+
+    def query(self, x1, y1, x2, y2):
+        "Returns the items whose boxes overlap the box from (x1, y1) to (x2, y2), in insertion order"
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        found = {}
+        for cell in self._cellRange(x1, y1, x2, y2):
+            for item in self._cells.get(cell, ()):
+                if item not in found:
+                    bx1, by1, bx2, by2, num = self._boxes[item]
+                    if bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1:
+                        found[item] = num
+        return sorted(found.keys(), key = found.get)
+
+    def _distanceSquared(self, item, x, y):
+        bx1, by1, bx2, by2, num = self._boxes[item]
+        dx = max(bx1 - x, 0, x - bx2)
+        dy = max(by1 - y, 0, y - by2)
+        return dx * dx + dy * dy
+
+    def queryRadius(self, x, y, radius):
+        "Returns the items whose boxes come within radius of the point (x, y), in insertion order"
+        radiusSqr = radius * radius
+        return [item for item in self.query(x - radius, y - radius, x + radius, y + radius)
+                if self._distanceSquared(item, x, y) <= radiusSqr]
+
+    def nearest(self, x, y, maxRadius = None):
+        "Returns (item, squared distance) for the item whose box is closest to (x, y), or (None, None) if none are within maxRadius"
+        if len(self._boxes) == 0:
+            return (None, None)
+        ex1, ey1, ex2, ey2 = self._extent
+        farthest = math.sqrt( max((x - ex1) ** 2, (x - ex2) ** 2) + max((y - ey1) ** 2, (y - ey2) ** 2) )
+        if maxRadius is None or maxRadius > farthest:
+            maxRadius = farthest
+        radius = min(self.cellSize, maxRadius)
+        while True:
+            best, bestDist = None, None
+            for item in self.queryRadius(x, y, radius): #In insertion order, so ties go to the oldest
+                dist = self._distanceSquared(item, x, y)
+                if best is None or dist < bestDist:
+                    best, bestDist = item, dist
+            if best is not None or radius >= maxRadius:
+                return (best, bestDist)
+            radius = min(2 * radius, maxRadius)
+
+    def items(self):
+        "Returns every item stored, in insertion order"
+        return sorted(self._boxes.keys(), key = (lambda item: self._boxes[item][4]))
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,163 @@
+"""
+filename: StrokeGenerators.py
+
+description:
+   Builds synthetic, hand-drawn looking strokes for benchmarking and testing the
+   recognizers without a person at the tablet.  Every generator takes a random.Random
+   so that a given seed always produces the same board.
+
+   Shapes are laid out left to right, top to bottom in cells of CELL_SIZE pixels so that
+   neighbouring shapes do not accidentally combine (except where they are meant to,
+   e.g. the head and tail of an arrow, or the nodes and edges of a digraph).
+
+Doctest Examples:
+
+>>> rand = random.Random(1)
+>>> circle = circleStroke(rand, 100, 100, 40)
+>>> len(circle.Points)
+40
+>>> 0.8 < GeomUtils.strokeCircularity(circle) <= 1.0
+True
+
+>>> [len(generateStrokes(kind, 12)) for kind in KINDS]
+[12, 12, 12, 12, 12, 12]
+
+>>> ids = [s.id for s in generateStrokes('arrow', 4, seed = 3)]
+>>> ids == sorted(ids)
+True
+"""
+
+import math
+import random
+
+from Utils import GeomUtils
+from SketchFramework.Point import Point
+from SketchFramework.Stroke import Stroke
+
+CELL_SIZE = 250 # pixels on a side for each generated shape
+COLUMNS = 8  # shapes per row before wrapping to the next row
+
+#--------------------------------------------------------------
+# Single strokes
+
+def _jitter(rand, noise):
+    if noise <= 0:
+        return 0.0
+    return rand.uniform(-noise, noise)
+
+def _pathStroke(rand, points, noise, t0 = 0.0, numpoints = None):
+    "Input: list of (x,y) corners. Returns a stroke that follows the polyline, resampled to numpoints and jittered by noise"
+    path = Stroke(points)
+    if numpoints is None:
+        numpoints = max(2, int(GeomUtils.strokeLength(path) / 4))
+    path = GeomUtils.strokeNormalizeSpacing(path, numpoints)
+    outPoints = []
+    for i, p in enumerate(path.Points):
+        outPoints.append( Point(p.X + _jitter(rand, noise), p.Y + _jitter(rand, noise), t0 + i * 0.01) )
+    return Stroke(outPoints)
+
+def circleStroke(rand, cx, cy, radius, noise = 1.0, numpoints = 40, t0 = 0.0):
+    "Returns a roughly circular stroke, slightly overdrawn at the end like a person would"
+    start = rand.uniform(0, 2 * math.pi)
+    sweep = 2 * math.pi * 1.05
+    points = []
+    for i in range(numpoints):
+        ang = start + sweep * i / float(numpoints - 1)
+        r = radius + _jitter(rand, noise)
+        points.append( Point(cx + r * math.cos(ang), cy + r * math.sin(ang), t0 + i * 0.01) )
+    return Stroke(points)
+
+def lineStroke(rand, x1, y1, x2, y2, noise = 1.0, t0 = 0.0):
+    "Returns a roughly straight stroke from (x1,y1) to (x2,y2)"
+    return _pathStroke(rand, [(x1, y1), (x2, y2)], noise, t0 = t0)
+
+def arrowStrokes(rand, x1, y1, x2, y2, noise = 1.0, t0 = 0.0):
+    "Returns [tail, head]: a two-stroke arrow pointing from (x1,y1) to (x2,y2)"
+    length = GeomUtils.pointDistance(x1, y1, x2, y2)
+    ang = math.atan2(y2 - y1, x2 - x1)
+    wingLen = max(8.0, length / 5.0)
+    wingAng = math.radians(30)
+    #Stop the tail just short of the tip, inside the arrowhead
+    back = min(3.0, length / 10.0)
+    tail = lineStroke(rand, x1, y1, x2 - back * math.cos(ang), y2 - back * math.sin(ang), noise = noise, t0 = t0)
+
+    w1 = (x2 - wingLen * math.cos(ang - wingAng), y2 - wingLen * math.sin(ang - wingAng))
+    w2 = (x2 - wingLen * math.cos(ang + wingAng), y2 - wingLen * math.sin(ang + wingAng))
+    head = _pathStroke(rand, [w1, (x2, y2), w2], noise / 2.0, t0 = t0 + 1, numpoints = 15)
+    return [tail, head]
+
+def digitStroke(rand, digit, x, y, height, noise = 0.5, t0 = 0.0):
+    "Returns a '0' (small closed loop) or '1' (short vertical bar) with its lower left corner at (x,y)"
+    if digit == '0':
+        radius = height / 2.0
+        return circleStroke(rand, x + radius * 0.7, y + radius, radius, noise = noise, numpoints = 24, t0 = t0)
+    else:
+        return lineStroke(rand, x + _jitter(rand, 1), y + height, x + _jitter(rand, 1), y, noise = noise, t0 = t0)
+
+#--------------------------------------------------------------
+# Whole shapes, each returns a list of strokes drawn inside the cell at (x,y)
+
+def _circleShape(rand, x, y):
+    return [ circleStroke(rand, x + CELL_SIZE / 2.0, y + CELL_SIZE / 2.0, rand.uniform(30, 80)) ]
+
+def _lineShape(rand, x, y):
+    ang = rand.uniform(0, 2 * math.pi)
+    r = CELL_SIZE * 0.4
+    cx, cy = x + CELL_SIZE / 2.0, y + CELL_SIZE / 2.0
+    return [ lineStroke(rand, cx - r * math.cos(ang), cy - r * math.sin(ang), cx + r * math.cos(ang), cy + r * math.sin(ang)) ]
+
+def _arrowShape(rand, x, y):
+    ang = rand.uniform(0, 2 * math.pi)
+    r = CELL_SIZE * 0.35
+    cx, cy = x + CELL_SIZE / 2.0, y + CELL_SIZE / 2.0
+    return arrowStrokes(rand, cx - r * math.cos(ang), cy - r * math.sin(ang), cx + r * math.cos(ang), cy + r * math.sin(ang))
+
+def _textShape(rand, x, y):
+    height = 20
+    strokes = []
+    for i in range(rand.randint(3, 8)):
+        strokes.append( digitStroke(rand, rand.choice("01"), x + 10 + i * height, y + CELL_SIZE / 2.0, height, t0 = i) )
+    return strokes
+
+def _digraphShape(rand, x, y):
+    radius = 30
+    c1 = (x + radius + 10, y + CELL_SIZE / 2.0)
+    c2 = (x + CELL_SIZE - radius - 10, y + CELL_SIZE / 2.0)
+    strokes = [ circleStroke(rand, c1[0], c1[1], radius), circleStroke(rand, c2[0], c2[1], radius, t0 = 1) ]
+    gap = radius + 5
+    strokes.extend( arrowStrokes(rand, c1[0] + gap, c1[1], c2[0] - gap, c2[1], t0 = 2) )
+    return strokes
+
+_SHAPES = {
+    'circle': _circleShape,
+    'line': _lineShape,
+    'arrow': _arrowShape,
+    'text': _textShape,
+    'digraph': _digraphShape,
+    }
+
+KINDS = ['circle', 'line', 'arrow', 'text', 'digraph', 'mixed']
+
+def generateStrokes(kind, count, seed = 0):
+    "Input: shape kind (one of KINDS), number of strokes. Returns a list of exactly count strokes, in drawing order"
+    rand = random.Random(seed)
+    if kind == 'mixed':
+        makers = [_SHAPES[k] for k in sorted(_SHAPES.keys())]
+    else:
+        makers = [_SHAPES[kind]]
+
+    strokes = []
+    cell = 0
+    while len(strokes) < count:
+        x = (cell % COLUMNS) * CELL_SIZE
+        y = (cell / COLUMNS) * CELL_SIZE
+        strokes.extend( rand.choice(makers)(rand, x, y) )
+        cell += 1
+    return strokes[:count]
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,106 @@
+"""
+filename: StrokeSimplifier.py
+
+description:
+   Thins out the points of strokes as they come in (from the mouse, or converted from an
+   image), before they are added to the board.  Input devices report far more points than
+   the recognizers need, and most of GeomUtils takes time at least linear in the number of
+   points.  There are two steps, each optional:
+      radius   drop each point closer than radius to the last point kept.  This is cheap, and
+               removes the clumps of points left where the pen moved slowly
+      epsilon  Ramer-Douglas-Peucker: keep just enough points that none of the dropped ones
+               is farther than epsilon from the path through the kept ones
+   The first and last points are always kept, and kept points are not moved, so they keep
+   their times.  With keepRaw, a simplified stroke keeps all of the points it was drawn with
+   in RawPoints, and is drawn with those.
+
+Doctest Examples:
+
+>>> simplifier = StrokeSimplifier(radius = 1.0, epsilon = 0.5, keepRaw = True)
+>>> points = [Point(x, 0) for x in range(10)] + [Point(9, y) for y in range(1, 10)]
+>>> stroke = simplifier.makeStroke(points)
+>>> [str(p) for p in stroke.Points]
+['(0.0,0.0)', '(9.0,0.0)', '(9.0,9.0)']
+>>> simplifier.lastRemoved, len(stroke.renderPoints())
+(16, 19)
+
+A stroke with nothing to remove is passed through as it is
+>>> simplifier.simplify(stroke) is stroke
+True
+>>> simplifier.report()
+'Removed 16 of 22 points (72.7%) from 2 strokes'
+"""
+
+from SketchFramework.Point import Point
+from SketchFramework.Stroke import Stroke
+from Utils import GeomUtils
+from Utils import Logger
+
+logger = Logger.getLogger('StrokeSimplifier', Logger.WARN )
+
+#-------------------------------------
+
+class StrokeSimplifier(object):
+    "Simplifies strokes before they go on the board, and counts the points it removes"
+    def __init__(self, radius = None, epsilon = None, keepRaw = False):
+        "radius and epsilon are distances in board coordinates, None skips that step. If keepRaw, simplified strokes keep their raw points for drawing"
+        self.radius = radius
+        self.epsilon = epsilon
+        self.keepRaw = keepRaw
+        self.resetCounts()
+
+    def resetCounts(self):
+        "Forget the points counted so far"
+        self.lastRemoved = 0  # points removed from the last stroke
+        self.totalRemoved = 0
+        self.totalPoints = 0
+        self.strokeCount = 0
+
+    def enabled(self):
+        "Returns True if either step is turned on"
+        return self.radius is not None or self.epsilon is not None
+
+    def simplifyPoints(self, points):
+        "Input: list of Points. Returns the ones kept (the same Point objects, in order), and counts the ones removed"
+        kept = GeomUtils.simplifyPoints(points, radius = self.radius, epsilon = self.epsilon)
+        self.lastRemoved = len(points) - len(kept)
+        self.totalRemoved += self.lastRemoved
+        self.totalPoints += len(points)
+        self.strokeCount += 1
+        if self.lastRemoved > 0:
+            logger.debug("Simplified a stroke from %s to %s points" % (len(points), len(kept)))
+        return kept
+
+    def makeStroke(self, points):
+        "Input: list of Points. Returns a new Stroke of the points that are kept"
+        points = list(points)
+        stroke = Stroke(self.simplifyPoints(points))
+        if self.keepRaw and self.lastRemoved > 0:
+            stroke.RawPoints = points
+        return stroke
+
+    def simplify(self, stroke):
+        "Input: Stroke. Returns a new, simplified Stroke, or stroke itself if no points were removed"
+        kept = self.simplifyPoints(stroke.Points)
+        if self.lastRemoved == 0:
+            return stroke
+        newStroke = Stroke(kept)
+        newStroke.Color = stroke.Color
+        if self.keepRaw:
+            newStroke.RawPoints = list(stroke.renderPoints())
+        return newStroke
+
+    def report(self):
+        "Returns a one line summary of the points removed so far"
+        fraction = 0.0
+        if self.totalPoints > 0:
+            fraction = 100.0 * self.totalRemoved / self.totalPoints
+        return "Removed %s of %s points (%.1f%%) from %s strokes" % (self.totalRemoved, self.totalPoints, fraction, self.strokeCount)
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+    Logger.setDoctest(logger)
+    import doctest
+    doctest.testmod()
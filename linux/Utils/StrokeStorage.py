@@ -1,14 +1,217 @@
+"""
+filename: StrokeStorage.py
+
+description:
+   Saves and loads lists of strokes.  Two formats are understood:
+
+   text: one line per point, between #STROKE and #ENDSTROKE lines
+      #STROKE
+        x y t
+        ...
+      #ENDSTROKE
+
+   binary: columnar, for large archives.  All values little endian.
+      header    "SKSTRK01", uint32 version, uint32 stroke count
+      index     per stroke: uint64 file offset of its data, uint32 point count
+      data      per stroke: packed float64 X[], then Y[], then T[]
+   A binary file is memory mapped, and each stroke is only decoded when it is asked for.
+
+   loadStrokes works out which format a file is in by itself, and reads text files a
+   line at a time, so memory use does not grow with the file.  saveStrokes writes
+   text unless the storage was created with binary = True.
+
+   StrokeJournal is an append-only text file that strokes are written to one at a time,
+   as they are added to (or removed from) the board, so saving costs one stroke rather
+   than the whole board.  Removals are recorded as "#REMOVE n", n counting the strokes
+   in the journal from 0.  After a crash, recover() replays the journal.  Only strokes
+   appended, or recovered, through a journal can be removed through it: a stroke written
+   by an earlier session is just a record in the file until it is recovered.
+
+Doctest Examples:
+
+>>> import tempfile
+>>> fname = tempfile.mktemp()
+>>> strokes = [Stroke([Point(0, 0, 1), Point(1.5, 2, 2)]), Stroke([Point(10, 10, 3)])]
+>>> StrokeStorage(fname, binary = True).saveStrokes(strokes)
+>>> [[(p.X, p.Y, p.T) for p in s.Points] for s in StrokeStorage(fname).loadStrokes()]
+[[(0.0, 0.0, 1.0), (1.5, 2.0, 2.0)], [(10.0, 10.0, 3.0)]]
+
+>>> bfile = BinaryStrokeFile(fname)
+>>> len(bfile), bfile.pointCount(0)
+(2, 2)
+>>> xs, ys, ts = bfile.pointArrays(1)
+>>> list(xs), list(ys), list(ts)
+([10.0], [10.0], [3.0])
+>>> bfile.close()
+
+>>> StrokeStorage(fname).saveStrokes(strokes)
+>>> isBinaryFile(fname)
+False
+>>> [len(s.Points) for s in StrokeStorage(fname).loadStrokes()]
+[2, 1]
+
+>>> journal = StrokeJournal(fname)
+>>> journal.clear()
+>>> for s in strokes:
+...     journal.append(s)
+>>> journal.remove(strokes[0])
+>>> journal.close()
+>>> [len(s.Points) for s in StrokeJournal(fname).recover()]
+[1]
+
+A stroke that was cut off part way through writing is dropped
+>>> fd = open(fname, "a")
+>>> fd.write("#STROKE\\n  1.0 2.0 3.0\\n  4.0")
+>>> fd.close()
+>>> journal = StrokeJournal(fname)
+>>> [len(s.Points) for s in journal.recover()]
+[1]
+>>> journal.close()
+
+A journal opened on an existing file numbers new strokes after the ones already in it
+>>> journal = StrokeJournal(fname)
+>>> newStroke = Stroke([Point(5, 5, 4), Point(6, 6, 5), Point(7, 7, 6)])
+>>> journal.append(newStroke)
+>>> journal.remove(newStroke)
+>>> journal.append(Stroke([Point(8, 8, 7), Point(9, 9, 8)]))
+>>> journal.close()
+>>> [len(s.Points) for s in StrokeJournal(fname).recover()]
+[1, 2]
+
+Appending to a journal that was cut off part way through an entry drops the broken entry first
+>>> fd = open(fname, "a")
+>>> fd.write("#REMOVE")
+>>> fd.close()
+>>> journal = StrokeJournal(fname)
+>>> journal.append(Stroke([Point(1, 1, 9)]))
+>>> journal.close()
+>>> [len(s.Points) for s in StrokeJournal(fname).recover()]
+[1, 2, 1]
+>>> os.remove(fname)
+"""
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+
 from  SketchFramework.Stroke import Stroke
 from  SketchFramework.Point import Point
 from Utils import Logger
 
 logger = Logger.getLogger('StrokeStorage', Logger.DEBUG)
 
+BINARY_MAGIC = "SKSTRK01"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<8sII")  # magic, version, stroke count
+_INDEX_ENTRY = struct.Struct("<QI")  # data offset, point count
+_FLOAT_SIZE = array('d').itemsize
+
+
+def isBinaryFile(filename):
+   "Returns True if filename holds strokes in the binary format"
+   fd = open(filename, "rb")
+   magic = fd.read(len(BINARY_MAGIC))
+   fd.close()
+   return magic == BINARY_MAGIC
+
+
+def _packFloats(values):
+   arr = array('d', values)
+   if sys.byteorder != 'little':
+      arr.byteswap()
+   return arr.tostring()
+
+
+def saveBinaryStrokes(filename, strokelist):
+   "Input: file name, list of Strokes.  Writes the strokes in the binary format"
+   strokelist = list(strokelist)
+   fd = open(filename, "wb")
+   fd.write( _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(strokelist)) )
+   offset = _HEADER.size + _INDEX_ENTRY.size * len(strokelist)
+   for strk in strokelist:
+      fd.write( _INDEX_ENTRY.pack(offset, len(strk.Points)) )
+      offset += 3 * _FLOAT_SIZE * len(strk.Points)
+   for strk in strokelist:
+      fd.write( _packFloats([p.X for p in strk.Points]) )
+      fd.write( _packFloats([p.Y for p in strk.Points]) )
+      fd.write( _packFloats([p.T for p in strk.Points]) )
+   fd.close()
+   logger.debug("Saved %s strokes" % (len(strokelist)) )
+
+
+class BinaryStrokeFile(object):
+   "A memory mapped binary stroke file.  Strokes are decoded one at a time, as they are asked for"
+   def __init__(self, filename):
+      self._fd = open(filename, "rb")
+      size = os.fstat(self._fd.fileno()).st_size
+      if size < _HEADER.size:
+         self._fd.close()
+         raise ValueError("%s is too short to be a binary stroke file" % (filename))
+      self._map = mmap.mmap(self._fd.fileno(), 0, access = mmap.ACCESS_READ)
+      magic, version, count = _HEADER.unpack_from(self._map, 0)
+      if magic != BINARY_MAGIC or version != BINARY_VERSION:
+         self.close()
+         raise ValueError("%s is not a version %s binary stroke file" % (filename, BINARY_VERSION))
+      if _HEADER.size + count * _INDEX_ENTRY.size > size:
+         self.close()
+         raise ValueError("%s is truncated" % (filename))
+      self._count = count
+
+   def __len__(self):
+      return self._count
+
+   def _entry(self, idx):
+      if idx < 0:
+         idx += self._count
+      if idx < 0 or idx >= self._count:
+         raise IndexError("stroke index out of range")
+      return _INDEX_ENTRY.unpack_from(self._map, _HEADER.size + idx * _INDEX_ENTRY.size)
+
+   def pointCount(self, idx):
+      "Returns the number of points in stroke idx without decoding it"
+      return self._entry(idx)[1]
+
+   def pointArrays(self, idx):
+      "Returns stroke idx as three arrays of floats (xs, ys, ts), without building any Points"
+      offset, npoints = self._entry(idx)
+      retList = []
+      colSize = npoints * _FLOAT_SIZE
+      for col in range(3):
+         start = offset + col * colSize
+         arr = array('d')
+         arr.fromstring(self._map[start:start + colSize])
+         if sys.byteorder != 'little':
+            arr.byteswap()
+         retList.append(arr)
+      return tuple(retList)
+
+   def __getitem__(self, idx):
+      "Returns stroke idx as a new Stroke"
+      xs, ys, ts = self.pointArrays(idx)
+      return Stroke( [Point(x, y, t) for x, y, t in zip(xs, ys, ts)] )
+
+   def __iter__(self):
+      for idx in xrange(self._count):
+         yield self[idx]
+
+   def close(self):
+      if self._map is not None:
+         self._map.close()
+         self._map = None
+      self._fd.close()
+
 
 class StrokeStorage(object):
-   def __init__(self, filename = "strokes.dat"):
+   def __init__(self, filename = "strokes.dat", binary = False):
+      "If binary is True, saveStrokes writes the binary format.  loadStrokes reads either"
       self._fname = filename
+      self._binary = binary
    def saveStrokes(self, strokelist):
+      if self._binary:
+         saveBinaryStrokes(self._fname, strokelist)
+         return
       fd = open(self._fname, "w")
       for strk in strokelist:
          print >> fd, "#STROKE"
@@ -18,15 +221,25 @@ class StrokeStorage(object):
          logger.debug("Saved Stroke with %s points" % (len(strk.Points)) )
       fd.close()
    def loadStrokes(self):
+      if isBinaryFile(self._fname):
+         bfile = BinaryStrokeFile(self._fname)
+         try:
+            for strk in bfile:
+               yield strk
+         finally:
+            bfile.close()
+         return
       fd = open(self._fname, "r")
       curStroke = None
-      for line in fd.readlines():
+      for line in fd:
          if line.startswith("#STROKE"):
             curStroke = Stroke()
          elif line.startswith("#ENDSTROKE"):
             logger.debug("Loaded Stroke with %s points" % (len(curStroke.Points)) )
             yield curStroke
             curStroke = None
+         elif line.startswith("#"): #Journal entries, see StrokeJournal
+            continue
          else:
             fields = line.split()
             assert len(fields) <= 3 and len(fields) > 1, "Error: ill-formed point"
@@ -35,8 +248,117 @@ class StrokeStorage(object):
                t = 0.0
             elif len(fields) == 3:
                x, y, t = fields
-               
+
             curStroke.addPoint ( Point(float(x), float(y), float(t)) )
       fd.close()
 
-         
+
+class StrokeJournal(object):
+   "An append-only record of the strokes added to and removed from a board"
+   def __init__(self, filename = "strokes.journal", sync = False):
+      "If sync is True, every entry is forced to disk (fsync) before returning"
+      self._fname = filename
+      self._sync = sync
+      self._fd = None
+      self._index = {} # stroke : its number in the journal
+      self._count = None # strokes ever added to the journal, counted from the file when first needed (see _countEntries)
+
+   def _countEntries(self):
+      "Carry on numbering from the strokes already in the journal, so that \"#REMOVE n\" names the right one"
+      strokes, self._count, cutOff = self._read(countOnly = True)
+      if cutOff:
+         #Anything appended after a line cut off by a crash would be garbled, so compact the journal first
+         self.recover()
+
+   def _read(self, countOnly = False):
+      """Returns the strokes in the journal that were not removed, as a dict of number : stroke, along with
+      the number of strokes ever added, and whether the journal ends with a line cut off by a crash.
+      If countOnly, the points aren't read, so the strokes are empty"""
+      strokes = {} # number : stroke
+      count = 0
+      cutOff = False
+      if os.path.exists(self._fname):
+         fd = open(self._fname, "r")
+         curStroke = None
+         for line in fd:
+            if not line.endswith("\n"): #Cut off by a crash
+               cutOff = True
+               break
+            if line.startswith("#STROKE"):
+               curStroke = Stroke()
+            elif line.startswith("#ENDSTROKE"):
+               if curStroke is not None:
+                  strokes[count] = curStroke
+                  count += 1
+               curStroke = None
+            elif line.startswith("#REMOVE"):
+               strokes.pop(int(line.split()[1]), None)
+            elif curStroke is not None and not countOnly:
+               fields = line.split()
+               if len(fields) == 2:
+                  curStroke.addPoint( Point(float(fields[0]), float(fields[1])) )
+               elif len(fields) == 3:
+                  curStroke.addPoint( Point(float(fields[0]), float(fields[1]), float(fields[2])) )
+         fd.close()
+      return strokes, count, cutOff
+
+   def _write(self, text):
+      if self._fd is None:
+         self._fd = open(self._fname, "a")
+      self._fd.write(text)
+      self._fd.flush()
+      if self._sync:
+         os.fsync(self._fd.fileno())
+
+   def append(self, stroke):
+      "Record that stroke was added"
+      if self._count is None:
+         self._countEntries()
+      lines = ["#STROKE\n"]
+      lines.extend( ["  %s %s %s\n" % (p.X, p.Y, p.T) for p in stroke.Points] )
+      lines.append("#ENDSTROKE\n")
+      self._write("".join(lines))
+      self._index[stroke] = self._count
+      self._count += 1
+
+   def remove(self, stroke):
+      "Record that stroke, which was appended or recovered through this journal, was removed"
+      num = self._index.pop(stroke, None)
+      if num is None:
+         logger.warn("Removing a stroke that is not in the journal")
+         return
+      self._write("#REMOVE %s\n" % (num))
+
+   def clear(self):
+      "Start a new, empty journal"
+      self.close()
+      open(self._fname, "w").close()
+      self._index = {}
+      self._count = 0
+
+   def recover(self):
+      """Returns the strokes recorded in the journal that were not removed, in order. 
+      The journal is rewritten to hold just those strokes, and new entries are appended after them."""
+      self.close()
+      strokes, count, cutOff = self._read()
+      logger.debug("Recovered %s of %s journaled strokes" % (len(strokes), count) )
+
+      retList = [strokes[num] for num in sorted(strokes.keys())]
+      #Compact the journal, so it doesn't keep growing from one session to the next
+      self.clear()
+      for stroke in retList:
+         self.append(stroke)
+      return retList
+
+   def close(self):
+      if self._fd is not None:
+         self._fd.close()
+         self._fd = None
+
+#-------------------------------------
+# if executed by itself, run all the doc tests
+
+if __name__ == "__main__":
+   Logger.setDoctest(logger)
+   import doctest
+   doctest.testmod()
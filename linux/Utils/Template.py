@@ -2,15 +2,72 @@
 filename: Template.py
 
 description:
+   Matches strokes against libraries of template shapes.  A template file (*.templ)
+   is text, written by TkTemplateInput:
+      #TEMPLATE name [number of strokes]
+      x y
+      ...
+      #END name
 
+   Template files are compiled the first time they are loaded: every template is
+   resampled to a fixed number of points, centered on the origin, and summarized by a
+   few cheap features.  The compiled library is cached next to the source file (with
+   a "c" appended to the name, e.g. arrowheads.templc) and rebuilt whenever the source
+   changes.  Within a process each library is only ever loaded once, and is shared
+   (read only) by every TemplateDict that uses it.
+
+   Matching runs coarse to fine (see TemplateIndex):
+      1. only templates with the same number of strokes and similar features
+         (closedness, axis ratio, turning) are considered at all,
+      2. those are scored at low resolution, in every rotation,
+      3. only the best few are scored at full resolution.
 
 Doctest Examples:
 
+>>> import tempfile
+>>> fname = tempfile.mktemp(suffix = ".templ")
+>>> vee = Stroke.Stroke([(0, 10), (10, 0), (20, 10)])
+>>> fp = open(fname, "w")
+>>> print >> fp, "#TEMPLATE Vee"
+>>> for p in GeomUtils.strokeNormalizeSpacing(vee, 16).Points:
+...     print >> fp, "%s %s" % (p.X, p.Y)
+>>> print >> fp, "#END Vee"
+>>> fp.close()
+>>> lib = loadTemplateLibrary(fname, resampleSize = 16)
+>>> [(t.name, t.numStrokes, len(t.vector)) for t in lib.templates]
+[('Vee', 1, 32)]
+>>> lib is loadTemplateLibrary(fname, resampleSize = 16)
+True
+
+The compiled copy is used from then on
+>>> os.path.exists(fname + "c")
+True
+>>> _LIBRARIES.clear()
+>>> loadTemplateLibrary(fname, resampleSize = 16).templates[0].vector == lib.templates[0].vector
+True
+
+>>> matcher = TemplateDict(fname, resampleSize = 16)
+>>> score = matcher.Score([vee.translate(100, 50)])
+>>> score['name'], score['score'] < 0.2
+('Vee', True)
+
+Shapes nothing like any template are not scored at all
+>>> print matcher.Score([Stroke.Stroke([(0, 0), (20, 0)])])
+None
+
+>>> index = lib.index()
+>>> len(index.candidates(shapeFeatures(strokeVector(vee, 16))))
+1
+>>> len(index.candidates(shapeFeatures(strokeVector(vee, 16)), numStrokes = 2))
+0
+>>> os.remove(fname); os.remove(fname + "c")
 """
 
 #-------------------------------------
 import itertools #for permutations
 import math
+import marshal
+import os
 
 from Utils import GeomUtils
 from Utils import Logger
@@ -24,112 +81,407 @@ from SketchFramework.Board import BoardObserver, BoardSingleton
 
 logger = Logger.getLogger('TemplateDict', Logger.WARN )
 
+ROTATIONS = 16 # Orientations each template is tried in
+COMPILED_VERSION = 2
+TURNING_POINTS = 8 # Turning is measured over this many segments, so that jitter doesn't count
+LOW_RES_POINTS = 10 # Points compared in the low resolution scan
+
+#Width of each feature's buckets in the TemplateIndex, and the highest bucket
+CLOSEDNESS_BIN, CLOSEDNESS_MAX = 0.25, 4
+AXIS_RATIO_BIN, AXIS_RATIO_MAX = 0.25, 3
+TURNING_BIN, TURNING_MAX = math.pi / 2, 6
+
+_LIBRARIES = {} # (absolute file name, resample size) : TemplateLibrary, shared by the whole process
+
 #-------------------------------------
-        
+
 class TemplateDict( object ):
     "Compares all strokes with templates and annotates strokes with any template within some threshold."
-    def __init__(self, filename, resampleSize = 64):
-        
-        self._templates = {}
-        self._loadTemplates(filename = filename)
+    def __init__(self, filename, resampleSize = 64, topK = 5):
+        "topK templates (the best at low resolution) are scored at full resolution"
         self._resampleSize = resampleSize
-        
+        self._topK = topK
+        self._library = loadTemplateLibrary(filename, resampleSize = resampleSize)
+        self._templates = self._library.byName()
+
 
     def getTemplates(self):
-        "Returns a dict of named templates: {'name':stroke}"
+        "Returns a dict of named templates: {'name':[list of points, ...]}"
         return dict(self._templates)
-        
-    def _loadTemplates(self, filename):
-        "Load templates from filename into self._templates"
-        logger.debug("Loading templates: %s" % filename)
-        try:
-           fp = open(filename, "r")
-        except:
-           return
-        
-        self._templates = {}
-        current_template = None 
-        for line in fp.readlines():
-           fields = line.split()
-           if line.startswith("#TEMPLATE"):
-               #assert len(fields) == 3
-               template_name = fields[1]
-               current_template_set = self._templates.setdefault(template_name, [])
-               current_template = []
-               current_template_set.append(current_template)
-               
-           elif line.startswith("#END"):
-               assert len(fields) == 2
-               assert fields[1] == template_name
-               
-               template_name = None
-               current_template = None
-               
-               logger.debug('   "%s" loaded' % template_name)
-           elif len(line.strip()) > 0:
-               assert len(fields) == 2
-               x = float(fields[0])
-               y = float(fields[1])
-               assert current_template is not None
-               current_template.append(Point.Point(x, y))
-        fp.close()
-        logger.debug("Loaded %s templates" % len(self._templates))
-        return self._templates
 
     def Score( self, strokelist, max_return = 1, interest = 0.2):
-        "Compare these strokes to all templates, and return the best templates with their scores. "
-        ROTATIONS = 16
-        best_templ = None 
+        """Compare these strokes to the templates, and return the best template with its score:
+       {'name', 'score', 'template'}. Returns None if no template is similar enough to be worth scoring."""
+        index = self._library.index()
+        best_templ = None
+        best_match = None # (template, rotation index) of the best score so far
         for stroke_order in itertools.permutations(strokelist):
             pointlist = []
             for s in stroke_order:
                 pointlist.extend(s.Points)
             new_stroke = Stroke.Stroke(points=pointlist)
-            
-            for name, template_set in self._templates.items():
-                for template in template_set:
-                    for angle in [2 * math.pi / ROTATIONS * i for i in range(ROTATIONS)]:
-                        end_template = GeomUtils.rotateStroke(Stroke.Stroke(points=template), angle).Points
-                        firstpass_score = _scoreStroke(new_stroke, end_template, 10)
-                        if best_templ is not None and firstpass_score - 0.1 > best_templ['score']:
-                            continue
-                        score = _scoreStroke(new_stroke, end_template, len(end_template))
-                        logger.debug("   '%s' ... %s" % (name, score))
-                
-                        if best_templ is None:
-                            best_templ = {'score': score + 1}
-                    
-                        if score < best_templ['score']:
-                            best_templ['name'] = name
-                            best_templ['score'] = score
-                            best_templ['template'] = end_template
+            stroke_vect = strokeVector(new_stroke, self._resampleSize)
+            if stroke_vect is None:
+                continue
+            firstpass_step = max(1, self._resampleSize / 10)
+
+            candidates = index.candidates(shapeFeatures(stroke_vect), len(strokelist))
+            for template in index.shortlist(stroke_vect, candidates, self._topK):
+                for rotIdx, end_template in enumerate(template.rotations()):
+                    firstpass_score = _angularDistance(stroke_vect, end_template, firstpass_step)
+                    if best_templ is not None and firstpass_score - 0.1 > best_templ['score']:
+                        continue
+                    score = _angularDistance(stroke_vect, end_template)
+                    logger.debug("   '%s' ... %s" % (template.name, score))
+
+                    if best_templ is None:
+                        best_templ = {'score': score + 1}
+
+                    if score < best_templ['score']:
+                        best_templ['name'] = template.name
+                        best_templ['score'] = score
+                        best_match = (template, rotIdx)
+        if best_match is not None:
+            template, rotIdx = best_match
+            best_templ['template'] = template.rotatedPoints(rotIdx)
         return best_templ
 
 #-------------------------------------
 
+class CompiledTemplate( object ):
+    "A template resampled and centered on the origin. Fields: name, numStrokes, points (as loaded), vector [x0, y0, x1, y1, ...], features"
+    __slots__ = ('name', 'numStrokes', 'points', 'vector', 'features', '_rotations', '_lowRes')
+    def __init__(self, name, numStrokes, points, vector, features):
+        self.name = name
+        self.numStrokes = numStrokes
+        self.points = points
+        self.vector = vector
+        self.features = features
+        self._rotations = None
+        self._lowRes = None
+
+    def rotations(self):
+        "Returns the template's vector rotated through each of ROTATIONS evenly spaced angles, starting at 0"
+        if self._rotations is None:
+            rotations = []
+            vect = self.vector
+            for i in range(ROTATIONS):
+                angle = 2 * math.pi / ROTATIONS * i
+                cosA, sinA = math.cos(angle), math.sin(angle)
+                rotated = []
+                for j in xrange(0, len(vect), 2):
+                    x, y = vect[j], vect[j + 1]
+                    rotated.append(x * cosA - y * sinA)
+                    rotated.append(x * sinA + y * cosA)
+                rotations.append(tuple(rotated))
+            self._rotations = rotations
+        return self._rotations
+
+    def lowResRotations(self):
+        "Returns rotations(), each cut down to about LOW_RES_POINTS points (see lowRes)"
+        if self._lowRes is None:
+            self._lowRes = [lowRes(vect) for vect in self.rotations()]
+        return self._lowRes
+
+    def rotatedPoints(self, rotIdx):
+        "Returns rotation rotIdx of the template as a list of Points"
+        vect = self.rotations()[rotIdx]
+        return [Point.Point(vect[j], vect[j + 1]) for j in xrange(0, len(vect), 2)]
+
+
+class TemplateLibrary( object ):
+    "The compiled templates from one template file"
+    def __init__(self, filename, resampleSize, templates, sourceStamp = None):
+        self.filename = filename
+        self.resampleSize = resampleSize
+        self.templates = templates # list of CompiledTemplate
+        self.sourceStamp = sourceStamp # (mtime, size) of the file the templates were compiled from
+        self._index = None
+
+    def index(self):
+        "Returns the TemplateIndex of these templates, building it the first time"
+        if self._index is None:
+            self._index = TemplateIndex(self.templates)
+        return self._index
+
+    def byName(self):
+        "Returns {'name':[list of points, ...]} of the templates as they were loaded"
+        retDict = {}
+        for template in self.templates:
+            retDict.setdefault(template.name, []).append(template.points)
+        return retDict
+
+
+class TemplateIndex( object ):
+    "Finds the templates worth scoring against a stroke, without looking at every template"
+    def __init__(self, templates):
+        self._buckets = {} # (numStrokes, closedness bin, axis ratio bin, turning bin) : [templates]
+        for template in templates:
+            key = (template.numStrokes,) + _featureBins(template.features)
+            self._buckets.setdefault(key, []).append(template)
+
+    def candidates(self, features, numStrokes = 1):
+        "Returns the templates drawn with numStrokes strokes whose features are in the same or a neighbouring bucket"
+        closedBin, axisBin, turnBin = _featureBins(features)
+        retList = []
+        for c in (closedBin - 1, closedBin, closedBin + 1):
+            for a in (axisBin - 1, axisBin, axisBin + 1):
+                for t in (turnBin - 1, turnBin, turnBin + 1):
+                    retList.extend( self._buckets.get( (numStrokes, c, a, t), () ) )
+        return retList
+
+    def shortlist(self, stroke_vect, templates, topK):
+        "Returns the topK of templates that best match stroke_vect at low resolution, in any rotation, best first"
+        if len(templates) <= topK:
+            return templates
+        lowStroke = lowRes(stroke_vect)
+        scored = []
+        for template in templates:
+            best = min( [_angularDistance(lowStroke, rotated) for rotated in template.lowResRotations()] )
+            scored.append( (best, template) )
+        scored.sort(key = (lambda x: x[0]))
+        return [template for score, template in scored[:topK]]
+
+def _featureBins(features):
+    closedness, axisRatio, turning = features
+    return ( min(int(closedness / CLOSEDNESS_BIN), CLOSEDNESS_MAX),
+             min(int(axisRatio / AXIS_RATIO_BIN), AXIS_RATIO_MAX),
+             min(int(turning / TURNING_BIN), TURNING_MAX) )
+
+#-------------------------------------
+
+def loadTemplateLibrary(filename, resampleSize = 64):
+    "Returns the compiled TemplateLibrary for filename. Each library is loaded once per process and shared"
+    key = (os.path.abspath(filename), resampleSize)
+    try:
+        stat = os.stat(filename)
+        stamp = (stat.st_mtime, stat.st_size)
+    except OSError:
+        logger.warn("Cannot read templates: %s" % filename)
+        return TemplateLibrary(filename, resampleSize, [])
+
+    library = _LIBRARIES.get(key)
+    if library is not None and library.sourceStamp == stamp:
+        return library
+
+    compiledName = filename + "c"
+    library = _readCompiled(compiledName, filename, resampleSize, stamp)
+    if library is None:
+        library = compileTemplates(filename, resampleSize)
+        library.sourceStamp = stamp
+        _writeCompiled(compiledName, library)
+    _LIBRARIES[key] = library
+    return library
+
+def compileTemplates(filename, resampleSize = 64):
+    "Parse the template file filename and return it as a TemplateLibrary"
+    templates = []
+    for name, numStrokes, points in _parseTemplateFile(filename):
+        if len(points) == 0:
+            continue
+        templStroke = Stroke.Stroke(points = points)
+        if len(points) != resampleSize:
+            templStroke = GeomUtils.strokeNormalizeSpacing(templStroke, resampleSize)
+        vector = _centeredVector(templStroke, resampleSize)
+        if vector is None:
+            logger.warn("Template '%s' could not be resampled to %s points" % (name, resampleSize))
+            continue
+        templates.append( CompiledTemplate(name, numStrokes, points, vector, shapeFeatures(vector)) )
+    logger.debug("Compiled %s templates" % len(templates))
+    return TemplateLibrary(filename, resampleSize, templates)
+
+def _parseTemplateFile(filename):
+    "Returns a list of (name, number of strokes, list of points) for each template in filename"
+    logger.debug("Loading templates: %s" % filename)
+    fp = open(filename, "r")
+    retList = []
+    template_name = None
+    current_template = None
+    for line in fp:
+       fields = line.split()
+       if line.startswith("#TEMPLATE"):
+           template_name = fields[1]
+           numStrokes = 1
+           if len(fields) > 2:
+               numStrokes = int(fields[2])
+           current_template = []
+           retList.append( (template_name, numStrokes, current_template) )
+
+       elif line.startswith("#END"):
+           assert len(fields) == 2
+           assert fields[1] == template_name
+
+           logger.debug('   "%s" loaded' % template_name)
+           template_name = None
+           current_template = None
+       elif len(line.strip()) > 0:
+           assert len(fields) == 2
+           x = float(fields[0])
+           y = float(fields[1])
+           assert current_template is not None
+           current_template.append(Point.Point(x, y))
+    fp.close()
+    logger.debug("Loaded %s templates" % len(retList))
+    return retList
+
+def _readCompiled(compiledName, filename, resampleSize, stamp):
+    "Returns the TemplateLibrary stored in compiledName, or None if it is missing or out of date"
+    try:
+        fp = open(compiledName, "rb")
+        try:
+            data = marshal.load(fp)
+        finally:
+            fp.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if type(data) is not dict or data.get('version') != COMPILED_VERSION \
+    or data.get('resample') != resampleSize or tuple(data.get('source', ())) != stamp:
+        return None
+
+    templates = []
+    for name, numStrokes, rawPoints, vector, features in data['templates']:
+        points = [Point.Point(rawPoints[j], rawPoints[j + 1]) for j in xrange(0, len(rawPoints), 2)]
+        templates.append( CompiledTemplate(name, numStrokes, points, vector, features) )
+    logger.debug("Loaded %s compiled templates from %s" % (len(templates), compiledName))
+    return TemplateLibrary(filename, resampleSize, templates, sourceStamp = stamp)
+
+def _writeCompiled(compiledName, library):
+    "Store library in compiledName. Failing to (e.g. a read only directory) only costs speed"
+    templates = []
+    for t in library.templates:
+        rawPoints = []
+        for p in t.points:
+            rawPoints.append(p.X)
+            rawPoints.append(p.Y)
+        templates.append( (t.name, t.numStrokes, tuple(rawPoints), t.vector, t.features) )
+    data = {'version': COMPILED_VERSION,
+            'resample': library.resampleSize,
+            'source': library.sourceStamp,
+            'templates': templates}
+    try:
+        fp = open(compiledName, "wb")
+        marshal.dump(data, fp)
+        fp.close()
+    except IOError, e:
+        logger.debug("Could not write compiled templates %s: %s" % (compiledName, e))
+
+#-------------------------------------
+
+def _centeredVector(stroke, numPoints):
+    "Input: resampled Stroke, number of points. Returns the stroke centered on its centroid as a tuple (x0, y0, x1, y1, ...), or None if it has the wrong number of points"
+    if len(stroke.Points) != numPoints:
+        return None
+    centr = GeomUtils.centroid(stroke.Points)
+    vector = []
+    for p in stroke.Points:
+        vector.append(p.X - centr.X)
+        vector.append(p.Y - centr.Y)
+    return tuple(vector)
+
+def strokeVector(stroke, numPoints):
+    "Input: Stroke, number of points. Returns the stroke as a vector that can be compared against compiled templates, or None"
+    return _centeredVector(GeomUtils.strokeNormalizeSpacing(stroke, numPoints), numPoints)
+
+def lowRes(vector, numPoints = LOW_RES_POINTS):
+    "Input: vector (x0, y0, x1, y1, ...). Returns every n'th point of it, so that about numPoints are left"
+    step = max(1, (len(vector) / 2) / numPoints)
+    retList = []
+    for j in xrange(0, len(vector), 2 * step):
+        retList.append(vector[j])
+        retList.append(vector[j + 1])
+    return tuple(retList)
+
+def shapeFeatures(vector):
+    """Input: vector (x0, y0, x1, y1, ...) of evenly spaced points. Returns rotation invariant summary features:
+       (closedness - distance between the endpoints over the path length, 0 is closed
+        axis ratio - minor over major principal axis, 0 is a line and 1 is round
+        turning - total absolute turning angle along the path, measured over TURNING_POINTS segments, in radians)"""
+    n = len(vector) / 2
+    if n < 2:
+        return (1.0, 0.0, 0.0)
+    length = 0.0
+    sumX = sumY = 0.0
+    for j in xrange(0, 2 * n, 2):
+        sumX += vector[j]
+        sumY += vector[j + 1]
+    meanX, meanY = sumX / n, sumY / n
+    sxx = syy = sxy = 0.0
+    for j in xrange(0, 2 * n, 2):
+        dx, dy = vector[j] - meanX, vector[j + 1] - meanY
+        sxx += dx * dx
+        syy += dy * dy
+        sxy += dx * dy
+        if j > 0:
+            length += math.sqrt( (vector[j] - vector[j - 2]) ** 2 + (vector[j + 1] - vector[j - 1]) ** 2 )
+    if length == 0:
+        return (1.0, 0.0, 0.0)
+
+    turning = 0.0
+    prevAngle = None
+    step = max(1, (n - 1) / TURNING_POINTS)
+    indices = range(0, n, step)
+    if indices[-1] != n - 1:
+        indices.append(n - 1)
+    for i, k in zip(indices[:-1], indices[1:]):
+        sx, sy = vector[2 * k] - vector[2 * i], vector[2 * k + 1] - vector[2 * i + 1]
+        if sx == 0 and sy == 0:
+            continue
+        angle = math.atan2(sy, sx)
+        if prevAngle is not None:
+            delta = abs(angle - prevAngle)
+            if delta > math.pi:
+                delta = 2 * math.pi - delta
+            turning += delta
+        prevAngle = angle
+
+    closedness = math.sqrt( (vector[-2] - vector[0]) ** 2 + (vector[-1] - vector[1]) ** 2 ) / length
+    #Eigenvalues of the covariance matrix
+    half = (sxx + syy) / 2.0
+    spread = math.sqrt( ((sxx - syy) / 2.0) ** 2 + sxy ** 2 )
+    major, minor = half + spread, max(0.0, half - spread)
+    axisRatio = math.sqrt(minor / major) if major > 0 else 0.0
+    return (closedness, axisRatio, turning)
+
+def _angularDistance(vect1, vect2, step = 1):
+    "Input: two equal length vectors (x0, y0, x1, y1, ...), using every step'th point. Returns the angle between them, as GeomUtils.vectorDistance"
+    dotval = mag1 = mag2 = 0.0
+    for j in xrange(0, len(vect1), 2 * step):
+        x1, y1, x2, y2 = vect1[j], vect1[j + 1], vect2[j], vect2[j + 1]
+        dotval += x1 * x2
+        dotval += y1 * y2
+        mag1 += x1 * x1
+        mag1 += y1 * y1
+        mag2 += x2 * x2
+        mag2 += y2 * y2
+    if mag1 == 0 or mag2 == 0:
+        return math.pi
+    retval = dotval / (math.sqrt(mag1) * math.sqrt(mag2))
+    retval = round(retval, 5) #Same precision kludge as GeomUtils.vectorDistance
+    return math.acos(retval)
+
 def _scoreStroke(stroke, template, sample_size = None):
-    
+
     if sample_size is None:
         sample_size = len(template)
-        
+
     sNorm = GeomUtils.strokeNormalizeSpacing(stroke, len(template))
     centr = GeomUtils.centroid(sNorm.Points)
     numPoints = len(sNorm.Points)
-    
+
     point_vect = []
     templ_vect = []
 
     numPoints = len(template)
     if len(template) == len(sNorm.Points):
         for idx in range(0, numPoints, numPoints/sample_size ):
-       
+
            templ_vect.append(template[idx].X)
            templ_vect.append(template[idx].Y)
-       
+
            p = sNorm.Points[idx]
            point_vect.append(p.X - centr.X)
            point_vect.append(p.Y - centr.Y)
-       
+
         angularDist = GeomUtils.vectorDistance(point_vect, templ_vect)
     else:
         angularDist = math.pi
@@ -139,6 +491,6 @@ def _scoreStroke(stroke, template, sample_size = None):
 
 
 if __name__ == "__main__":
-    Logger.setDoctest(logger) 
+    Logger.setDoctest(logger)
     import doctest
     doctest.testmod()